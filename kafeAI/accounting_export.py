@@ -0,0 +1,257 @@
+import os
+import sys
+import calendar
+import datetime
+import argparse
+
+# 会计导出：任意期间 (月 / 季度 / 年) -> Excel + SIE4
+# 报告按日期流式读取，科目合计增量累加，Excel 以 write-only 模式逐行写出，内存占用恒定
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import report_index
+import tenants
+
+COMPANY_NAME = os.getenv("SHOP_NAME", "Tant Anki & Fröken Sara AB")
+
+# BAS 科目 (与原 generate_accounting_excel.py 保持一致)
+ACCOUNTS = {
+    "1510": "Kundfordringar",
+    "1580": "Fordringar för kontokort och kuponger",
+    "1910": "Kassa",
+    "3001": "Försäljning inom Sverige, 12 % moms",
+    "3005": "Försäljning inom Sverige, 25 % moms",
+    "2611": "Utgående moms på försäljning inom Sverige, 25 %",
+    "2621": "Utgående moms på försäljning inom Sverige, 12 %",
+    "3740": "Öres- och kronutjämning",
+}
+
+ENTRY_LINES = [
+    ("1580_Card", "1580", "Fordringar Kontokort (应收卡款)", "debit"),
+    ("1580_Swish", "1580", "Fordringar Swish (应收Swish)", "debit"),
+    ("1910_Cash", "1910", "Kassa (现金账户)", "debit"),
+    ("1510_Invoice", "1510", "Kundfordringar Faktura (应收发票款)", "debit"),
+    ("3001_Net", "3001", "Försäljning mat/kaffe 12% (食品销售-净额)", "credit"),
+    ("3005_Net", "3005", "Försäljning alkohol 25% (酒精类销售-净额)", "credit"),
+    ("2611_VAT", "2611", "Utgående moms 25% (销项增值税-25%)", "credit"),
+    ("2621_VAT", "2621", "Utgående moms 12% (销项增值税-12%)", "credit"),
+    ("3740_Rounding", "3740", "Öresavrundning (四舍五入差额)", "credit"),
+]
+
+DAILY_COLUMNS = ["Date", "Total Gross", "Total Net", "Total VAT", "Card", "Swish", "Cash", "Transactions"]
+
+
+def parse_period(period: str):
+    """
+    "2026-01" -> month, "2026-Q1" -> quarter, "2026" -> year.
+    Returns (start_iso, end_iso, label).
+    """
+    p = period.strip().upper().replace("_", "-")
+    try:
+        if "-Q" in p:
+            year, q = p.split("-Q")
+            year, q = int(year), int(q)
+            if not 1 <= q <= 4:
+                raise ValueError
+            first, last = 3 * q - 2, 3 * q
+            start = datetime.date(year, first, 1)
+            end = datetime.date(year, last, calendar.monthrange(year, last)[1])
+            return start.isoformat(), end.isoformat(), f"{year}_Q{q}"
+        if "-" in p:
+            year, month = (int(x) for x in p.split("-"))
+            start = datetime.date(year, month, 1)
+            end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+            return start.isoformat(), end.isoformat(), f"{calendar.month_name[month]}_{year}"
+        year = int(p)
+        return f"{year}-01-01", f"{year}-12-31", str(year)
+    except ValueError:
+        raise ValueError(f"Invalid period '{period}'. Use YYYY-MM, YYYY-Qn or YYYY.")
+
+
+def _payment_account(method: str) -> str:
+    """POS payment keys vary ("card", "card (KONTOKORT FAST)", "SWISH", "faktura (发票/订餐)")"""
+    m = method.lower()
+    if m.startswith("card") or "kort" in m:
+        return "1580_Card"
+    if m.startswith("swish"):
+        return "1580_Swish"
+    if m.startswith("cash") or m.startswith("kontant"):
+        return "1910_Cash"
+    # 其他支付方式 (例如发票/订餐) 记为应收账款
+    return "1510_Invoice"
+
+
+def report_amounts(date: str, report: dict) -> dict:
+    """Account amounts for a single Z-report."""
+    sales = report.get("sales_summary", {})
+    payments = report.get("payment_methods", {})
+    gross = sales.get("total_gross", 0) or 0
+
+    amounts = {key: 0.0 for key, _, _, _ in ENTRY_LINES}
+    for v in sales.get("vat_details", []):
+        rate = str(v.get("rate", "")).replace("%", "").strip()
+        vat = v.get("vat_amount", 0) or 0
+        # 2 月起的报告没有 net_amount，用 total - vat_amount 推算
+        net = v["net_amount"] if "net_amount" in v else (v.get("total", 0) or 0) - vat
+        if rate == "25":
+            amounts["3005_Net"] += net
+            amounts["2611_VAT"] += vat
+        elif rate == "12":
+            amounts["3001_Net"] += net
+            amounts["2621_VAT"] += vat
+
+    if not sales.get("vat_details"):
+        # 没有税率明细时，全部按 12% (食品/咖啡) 入账
+        amounts["3001_Net"] += sales.get("total_net", 0) or 0
+        amounts["2621_VAT"] += sales.get("total_vat", 0) or 0
+
+    for method, value in payments.items():
+        if method == "total_transactions" or not isinstance(value, (int, float)):
+            continue
+        amounts[_payment_account(method)] += value
+
+    debit = amounts["1580_Card"] + amounts["1580_Swish"] + amounts["1910_Cash"] + amounts["1510_Invoice"]
+    if not debit:
+        amounts["1580_Card"] = debit = gross
+
+    credit = amounts["3001_Net"] + amounts["3005_Net"] + amounts["2611_VAT"] + amounts["2621_VAT"]
+    amounts["3740_Rounding"] = round(debit - credit, 2)
+    return amounts
+
+
+class _SIEWriter:
+    """Minimal SIE type 4 writer: one voucher (#VER) per Z-report."""
+
+    def __init__(self, path: str, start: str, end: str):
+        self.f = open(path, "w", encoding="cp437", errors="replace", newline="\r\n")
+        self.ver_no = 0
+        year = start[:4]
+        self._line("#FLAGGA 0")
+        self._line("#PROGRAM \"kafeAI\" 2.0")
+        self._line("#FORMAT PC8")
+        self._line(f"#GEN {datetime.date.today().strftime('%Y%m%d')}")
+        self._line("#SIETYP 4")
+        self._line(f"#FNAMN \"{COMPANY_NAME}\"")
+        self._line(f"#RAR 0 {year}0101 {year}1231")
+        self._line(f"#OMFATTN {end.replace('-', '')}")
+        self._line("#KPTYP BAS2014")
+        for account, name in ACCOUNTS.items():
+            self._line(f"#KONTO {account} \"{name}\"")
+
+    def _line(self, text: str):
+        self.f.write(text + "\n")
+
+    def add_voucher(self, date: str, amounts: dict):
+        rows = {}
+        for key, account, _, side in ENTRY_LINES:
+            value = amounts.get(key, 0)
+            if value:
+                rows[account] = rows.get(account, 0) + (value if side == "debit" else -value)
+        if not rows:
+            return
+        self.ver_no += 1
+        ymd = date.replace("-", "")
+        self._line(f"#VER \"A\" {self.ver_no} {ymd} \"Dagskassa {date}\"")
+        self._line("{")
+        for account, value in rows.items():
+            if round(value, 2):
+                self._line(f"   #TRANS {account} {{}} {value:.2f}")
+        self._line("}")
+
+    def close(self):
+        self.f.close()
+
+
+def export_period(period: str, xlsx_path: str = None, sie_path: str = None, reports_dir: str = None) -> dict:
+    """
+    Stream all reports in the period once, writing the daily sheet row by row and
+    accumulating account totals. Returns {"label", "days", "totals", "xlsx", "sie"}.
+    """
+    start, end, label = parse_period(period)
+    reports_dir = reports_dir or report_index.default_reports_dir()
+
+    wb = ws_daily = ws_cat = None
+    if xlsx_path:
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws_entries = wb.create_sheet("Accounting_Entries")
+        ws_daily = wb.create_sheet("Daily_Sales_Summary")
+        ws_cat = wb.create_sheet("Category_Sales")
+        ws_daily.append(DAILY_COLUMNS)
+        ws_cat.append(["Date", "Category", "Count", "Amount"])
+
+    sie = _SIEWriter(sie_path, start, end) if sie_path else None
+
+    totals = {key: 0.0 for key, _, _, _ in ENTRY_LINES}
+    days = 0
+    try:
+        for date, report in report_index.iter_reports(start, end, reports_dir):
+            amounts = report_amounts(date, report)
+            for key, value in amounts.items():
+                totals[key] += value
+            days += 1
+
+            if ws_daily is not None:
+                sales = report.get("sales_summary", {})
+                payments = report.get("payment_methods", {})
+                ws_daily.append([
+                    date,
+                    sales.get("total_gross", 0),
+                    sales.get("total_net", 0),
+                    sales.get("total_vat", 0),
+                    amounts["1580_Card"],
+                    amounts["1580_Swish"],
+                    amounts["1910_Cash"],
+                    payments.get("total_transactions", 0),
+                ])
+                for c in report.get("sales_by_category", []):
+                    ws_cat.append([date, c.get("category"), c.get("count", 0), c.get("amount", 0)])
+
+            if sie:
+                sie.add_voucher(date, amounts)
+    finally:
+        if sie:
+            sie.close()
+
+    if wb is not None:
+        ws_entries.append(["Account", "Description", "Debit", "Credit"])
+        total_debit = total_credit = 0.0
+        for key, account, description, side in ENTRY_LINES:
+            value = round(totals[key], 2)
+            if key == "3740_Rounding" and not value:
+                continue
+            debit, credit = (value, 0) if side == "debit" else (0, value)
+            total_debit += debit
+            total_credit += credit
+            ws_entries.append([account, description, debit, credit])
+        ws_entries.append(["", "TOTAL SUMMARY", round(total_debit, 2), round(total_credit, 2)])
+        wb.save(xlsx_path)
+
+    return {
+        "label": label,
+        "days": days,
+        "totals": {k: round(v, 2) for k, v in totals.items()},
+        "xlsx": xlsx_path,
+        "sie": sie_path,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export accounting entries for a period (Excel + SIE4).")
+    parser.add_argument("period", help="YYYY-MM, YYYY-Qn or YYYY")
+    parser.add_argument("--out", default=None, help="Output directory (default: <site>/exports)")
+    parser.add_argument("--tenant", default=None, help="Site id from tenants.json (default: default site)")
+    parser.add_argument("--no-sie", action="store_true", help="Skip the SIE4 file")
+    args = parser.parse_args()
+
+    _, _, label = parse_period(args.period)
+    with tenants.tenant_scope(args.tenant):
+        out = args.out or tenants.data_path("exports")
+        os.makedirs(out, exist_ok=True)
+        result = export_period(
+            args.period,
+            xlsx_path=os.path.join(out, f"{label}_Accounting_Report.xlsx"),
+            sie_path=None if args.no_sie else os.path.join(out, f"{label}_Accounting.se"),
+        )
+    print(f"Exported {result['days']} reports for {result['label']}")
+    print(f"  Excel: {result['xlsx']}")
+    if result["sie"]:
+        print(f"  SIE4:  {result['sie']}")
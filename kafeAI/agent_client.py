@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+import requests
+from structured_log import get_logger, current_run_id
+import tenants
+
+# agent_service.py 的瘦客户端：提供与编译后的 LangGraph app 相同的 stream / get_state / update_state 接口，
+# 前端代码不需要区分在本进程运行还是通过服务运行
+# AGENT_SERVICE_URL 未设置时 get_app() 返回本进程的 manageragent.app (原来的行为)
+
+AGENT_SERVICE_URL = os.getenv("AGENT_SERVICE_URL", "").rstrip("/")
+REQUEST_TIMEOUT = 30      # seconds for state / control requests
+STREAM_READ_TIMEOUT = 60  # seconds without SSE data (the service sends keepalives every 15s)
+RECONNECTS = 3            # stream reconnect attempts (resumed with Last-Event-ID)
+
+log = get_logger("Agent Client")
+
+StateSnapshot = namedtuple("StateSnapshot", ["values", "next"])
+
+
+class ServiceError(RuntimeError):
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AgentClient:
+    """HTTP client for agent_service.py with the graph's stream / get_state / update_state interface."""
+
+    def __init__(self, base_url: str = AGENT_SERVICE_URL):
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """One pooled session per calling thread (front ends call from worker threads)."""
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _request(self, method: str, path: str, **kwargs):
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        resp = self.session.request(method, self.base_url + path, **kwargs)
+        if resp.status_code >= 400:
+            try:
+                message = resp.json().get("error", resp.text)
+            except ValueError:
+                message = resp.text
+            raise ServiceError(f"{method} {path}: {resp.status_code} {message}", resp.status_code)
+        return resp.json() if resp.content else None
+
+    @staticmethod
+    def _thread(config: dict) -> str:
+        return config["configurable"]["thread_id"]
+
+    def start(self, inputs: dict, config: dict) -> str:
+        """Queue a run (inputs=None resumes the thread) and return its run_id."""
+        body = {
+            "thread_id": self._thread(config),
+            "inputs": inputs,
+            "tenant_id": (inputs or {}).get("tenant_id") or tenants.current_tenant_id(),
+            # Service-side log records carry the caller's run_id
+            "log_run_id": current_run_id(),
+        }
+        return self._request("POST", "/runs", json=body)["run_id"]
+
+    def events(self, run_id: str):
+        """(event, data) pairs from the run's SSE stream, reconnecting where it left off."""
+        last_id = None
+        attempts = 0
+        while True:
+            headers = {"Accept": "text/event-stream"}
+            if last_id is not None:
+                headers["Last-Event-ID"] = last_id
+            try:
+                with self.session.get(f"{self.base_url}/runs/{run_id}/stream", headers=headers, stream=True,
+                                      timeout=(REQUEST_TIMEOUT, STREAM_READ_TIMEOUT)) as resp:
+                    if resp.status_code >= 400:
+                        raise ServiceError(f"stream {run_id}: {resp.status_code} {resp.text}", resp.status_code)
+                    event, data, event_id = "message", [], None
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if line:
+                            field, _, value = line.partition(":")
+                            value = value[1:] if value.startswith(" ") else value
+                            if field == "event":
+                                event = value
+                            elif field == "data":
+                                data.append(value)
+                            elif field == "id":
+                                event_id = value
+                            continue
+                        if data:
+                            if event_id is not None:
+                                last_id = event_id
+                            attempts = 0
+                            yield event, json.loads("\n".join(data))
+                            if event == "end":
+                                return
+                        event, data, event_id = "message", [], None
+            except requests.RequestException as e:
+                attempts += 1
+                if attempts > RECONNECTS:
+                    raise ServiceError(f"stream {run_id} lost: {e}")
+                log.warning(f"Stream {run_id} interrupted ({e}), reconnecting")
+                time.sleep(attempts)
+
+    def stream(self, inputs: dict, config: dict):
+        """Like app.stream(): yields {node: update}. Closing the generator early cancels the run."""
+        run_id = self.start(inputs, config)
+        finished = False
+        try:
+            for event, data in self.events(run_id):
+                if event == "update":
+                    yield {data["node"]: data["content"]}
+                elif event == "end":
+                    finished = True
+                    if data["status"] == "error":
+                        raise ServiceError(data["error"])
+        finally:
+            if not finished:
+                self.cancel(run_id)
+
+    def cancel(self, run_id: str) -> bool:
+        try:
+            return self._request("POST", f"/runs/{run_id}/cancel")["cancelled"]
+        except (ServiceError, requests.RequestException) as e:
+            log.warning(f"Could not cancel run {run_id}: {e}")
+            return False
+
+    def get_state(self, config: dict) -> StateSnapshot:
+        state = self._request("GET", f"/threads/{self._thread(config)}/state")
+        return StateSnapshot(state["values"], tuple(state["next"]))
+
+    def update_state(self, config: dict, values: dict, as_node: str = None):
+        self._request("POST", f"/threads/{self._thread(config)}/state", json={"values": values, "as_node": as_node})
+
+    def release_thread(self, thread_id: str):
+        self._request("DELETE", f"/threads/{thread_id}")
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+
+_app = None
+
+
+def get_app():
+    """The agent service client when AGENT_SERVICE_URL is set, otherwise the in-process graph."""
+    global _app
+    if _app is None:
+        if AGENT_SERVICE_URL:
+            _app = AgentClient(AGENT_SERVICE_URL)
+        else:
+            from manageragent import app
+            _app = app
+    return _app
+
+
+def release_thread(thread_id: str):
+    """Drop a finished run's checkpoints wherever the graph runs."""
+    app = get_app()
+    if isinstance(app, AgentClient):
+        app.release_thread(thread_id)
+    else:
+        from manageragent import release_thread as release_local
+        release_local(thread_id)
@@ -0,0 +1,78 @@
+# 每个 Agent 的输出写入自己的状态通道：
+#   - 结构化数据：weather / sales_forecast / financials / stock / promotion_data / poster_path / execution
+#   - 一条可读报告：reports[node] = {"status", "text"}
+# reports 按节点合并 (覆盖，不追加)，消费方直接按节点读取，不再在 context 字符串里做子串匹配，
+# 检查点大小也不会随节点数累加。
+# 注意：LangGraph 的状态键不能与节点同名 (所以是 sales_forecast / financials，而不是 forecast / post_mortem)
+
+OK = "ok"
+ERROR = "error"
+DEGRADED = "degraded"   # cached result standing in for a node that timed out
+SKIPPED = "skipped"
+
+# Full-report order, with the icon and label used in prompts and UIs
+REPORT_META = {
+    "post_mortem": ("📋", "Post-mortem"),
+    "forecast": ("📈", "Sales Forecast"),
+    "predictor": ("🌤️", "Weather"),
+    "stock_manager": ("📦", "Inventory"),
+    "pricing": ("💰", "Pricing"),
+    "creative": ("🎨", "Poster"),
+    "executor": ("✅", "Order Execution"),
+}
+
+
+def merge_reports(left: dict, right: dict) -> dict:
+    """Reducer for the reports channel: one entry per node, parallel branches merge."""
+    return {**(left or {}), **(right or {})}
+
+
+def report(node: str, text: str, status: str = OK, **channels) -> dict:
+    """State update with the node's report plus its typed channels, e.g. report("predictor", ..., weather={...})."""
+    return {"reports": {node: {"status": status, "text": text}}, **channels}
+
+
+def report_of(values: dict, node: str):
+    return (values.get("reports") or {}).get(node)
+
+
+def text_of(values: dict, node: str, default: str = "") -> str:
+    entry = report_of(values, node)
+    return entry["text"] if entry else default
+
+
+def failed(entry) -> bool:
+    return bool(entry) and entry.get("status") in (ERROR, SKIPPED)
+
+
+def ordered(values: dict) -> list:
+    """[(node, report)] in pipeline order."""
+    reports = values.get("reports") or {}
+    return [(node, reports[node]) for node in REPORT_META if node in reports]
+
+
+def context_text(values: dict, nodes=None) -> str:
+    """Prompt context from the reports of `nodes` (default: all, pipeline order) plus human feedback."""
+    parts = [
+        f"{REPORT_META[node][1]}:\n{entry['text']}"
+        for node, entry in ordered(values)
+        if nodes is None or node in nodes
+    ]
+    if values.get("feedback"):
+        parts.append(f"Human Feedback: {values['feedback']}")
+    return "\n\n".join(parts)
+
+
+def update_text(node: str, update: dict):
+    """Readable text of one streamed node update (its report, or a decision), else None."""
+    if not update:
+        return None
+    entry = (update.get("reports") or {}).get(node)
+    if entry:
+        return entry["text"]
+    return update.get("decision")
+
+
+def label(node: str) -> str:
+    icon, name = REPORT_META.get(node, ("📋", node))
+    return f"{icon} {name}"
@@ -0,0 +1,32 @@
+import re
+
+# @mention 路由：决定一条消息走完整报告 (full) 还是只运行被点名的节点 (single)
+# 不依赖 LangGraph，瘦客户端 (agent_client) 也可以直接使用
+
+# Mapping of user mentions to actual graph node IDs
+AGENT_MENTIONS = {
+    "weather": "predictor",
+    "stock": "stock_manager",
+    "inventory": "stock_manager",
+    "finance": "post_mortem",
+    "report": "post_mortem",
+    "forecast": "forecast",
+    "pricing": "pricing",
+    "creative": "creative",
+    "poster": "creative"
+}
+
+
+def route_for(issue: str):
+    """
+    (routing_mode, target_nodes) for a user message. Any known @mention selects Single Mode;
+    every mentioned node is targeted once, in mention order.
+    """
+    targets = []
+    for mention in re.findall(r"@(\w+)", issue or ""):
+        node = AGENT_MENTIONS.get(mention.lower())
+        if node and node not in targets:
+            targets.append(node)
+    if targets:
+        return "single", targets
+    return "full", ["post_mortem"]
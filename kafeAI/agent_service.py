@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import threading
+from flask import Flask, Response, request, jsonify
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# 本地 Agent 服务：所有前端 (Streamlit / Twilio / WhatsApp Web / stress_test) 共用一个进程里的
+# LangGraph 图、检查点 (MemorySaver)、LLM 客户端、响应缓存和限流器
+# - POST /runs 把运行放进任务队列，由 AGENT_WORKERS 个工作线程执行；队列满返回 429
+# - GET /runs/<id>/stream 以 Server-Sent Events 推送每个节点的输出 (支持 Last-Event-ID 断点续传)
+# - 同一 thread_id 同时只能有一个运行 (409)
+# 前端通过 agent_client.py 连接 (设置 AGENT_SERVICE_URL)；未设置时前端仍在本进程内运行图
+# 用法：python agent_service.py
+
+try:
+    from manageragent import app as graph, release_thread
+except ImportError as e:
+    print(f"❌ Could not import manageragent: {e}")
+    sys.exit(1)
+
+from structured_log import get_logger, run_context
+import tenants
+
+log = get_logger("Agent Service")
+
+SERVICE_HOST = os.getenv("AGENT_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("AGENT_SERVICE_PORT", "8765"))
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))         # graph runs executed in parallel
+MAX_QUEUED = int(os.getenv("AGENT_MAX_QUEUED", "32"))        # runs waiting for a worker
+KEEPALIVE = 15            # seconds between SSE comments on an idle stream
+FINISHED_TTL = 3600       # seconds a finished run stays available for late readers
+
+QUEUED, RUNNING, DONE, CANCELLED, ERROR = "queued", "running", "done", "cancelled", "error"
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class ThreadBusy(RuntimeError):
+    pass
+
+
+def _json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class Job:
+    """One graph run (inputs=None resumes the thread from its checkpoint)."""
+
+    def __init__(self, thread_id: str, inputs: dict, tenant_id: str, log_run_id: str = None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.log_run_id = log_run_id or self.run_id   # the caller's run_id, used to tag log records
+        self.thread_id = thread_id
+        self.inputs = inputs
+        self.tenant_id = tenant_id
+        self.status = QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []          # (node, content)
+        self._cond = threading.Condition()
+        self.cancelled = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, CANCELLED, ERROR)
+
+    def add(self, node: str, content):
+        with self._cond:
+            self.events.append((node, content))
+            self._cond.notify_all()
+
+    def finish(self, status: str, error: str = None):
+        with self._cond:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def wait(self, cursor: int, timeout: float):
+        """Events after cursor (blocking up to timeout) and whether the run has finished."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.events) > cursor or self.finished, timeout)
+            return self.events[cursor:], self.finished
+
+    def info(self) -> dict:
+        return {
+            "run_id": self.run_id, "thread_id": self.thread_id, "status": self.status,
+            "error": self.error, "events": len(self.events),
+            "created_at": self.created_at, "finished_at": self.finished_at,
+        }
+
+
+class AgentService:
+    """Job queue + worker pool in front of one compiled graph and its checkpointer."""
+
+    def __init__(self, app, workers: int = AGENT_WORKERS, max_queued: int = MAX_QUEUED):
+        self.app = app
+        self.jobs = {}            # run_id -> Job
+        self.active = {}          # thread_id -> run_id of its queued / running job
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker, daemon=True, name=f"agent-worker-{i}")
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, thread_id: str, inputs: dict = None, tenant_id: str = None, log_run_id: str = None) -> Job:
+        tenant_id = tenant_id or (inputs or {}).get("tenant_id") or tenants.current_tenant_id()
+        with self._lock:
+            self._prune()
+            if thread_id in self.active:
+                raise ThreadBusy(f"Thread {thread_id} already has run {self.active[thread_id]}")
+            job = Job(thread_id, inputs, tenant_id, log_run_id)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFull(f"{self._queue.maxsize} runs already queued")
+            self.jobs[job.run_id] = job
+            self.active[thread_id] = job.run_id
+        return job
+
+    def cancel(self, run_id: str) -> bool:
+        job = self.jobs.get(run_id)
+        if not job or job.finished:
+            return False
+        job.cancelled.set()
+        return True
+
+    def release(self, thread_id: str):
+        with self._lock:
+            if thread_id in self.active:
+                raise ThreadBusy(f"Thread {thread_id} has a run in flight")
+        release_thread(thread_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return {
+            "workers": len(self._workers),
+            "queued": sum(j.status == QUEUED for j in jobs),
+            "running": sum(j.status == RUNNING for j in jobs),
+            "finished": sum(j.finished for j in jobs),
+        }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                status, error = self._execute(job)
+            finally:
+                # Free the thread before readers see the end, so they can resume it right away
+                with self._lock:
+                    self.active.pop(job.thread_id, None)
+                self._queue.task_done()
+            job.finish(status, error)
+
+    def _execute(self, job: Job):
+        """(final status, error) of one run."""
+        if job.cancelled.is_set():
+            return CANCELLED, None
+        job.status = RUNNING
+        config = {"configurable": {"thread_id": job.thread_id}}
+        try:
+            with tenants.tenant_scope(job.tenant_id), run_context(thread_id=job.thread_id, run_id=job.log_run_id):
+                for output in self.app.stream(job.inputs, config=config):
+                    for node, content in output.items():
+                        job.add(node, content)
+                    # 取消在两个图步骤之间生效：正在运行的节点在其时间预算内结束
+                    if job.cancelled.is_set():
+                        break
+            return (CANCELLED if job.cancelled.is_set() else DONE), None
+        except Exception as e:
+            log.error(f"Run {job.run_id} on {job.thread_id} failed: {e}")
+            return ERROR, str(e)
+
+    def _prune(self):
+        """Forget runs finished more than FINISHED_TTL ago (caller holds _lock)."""
+        cutoff = time.time() - FINISHED_TTL
+        for run_id in [r for r, j in self.jobs.items() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[run_id]
+
+
+service = None
+http = Flask(__name__)
+
+
+def _error(message: str, status: int):
+    return jsonify({"error": message}), status
+
+
+@http.route("/health", methods=["GET"])
+def health():
+    return jsonify({"ok": True, **service.stats()})
+
+
+@http.route("/runs", methods=["POST"])
+def create_run():
+    """{"thread_id", "inputs" (null resumes), "tenant_id"?, "log_run_id"?} -> 202 {"run_id", ...}"""
+    body = request.get_json(force=True) or {}
+    if not body.get("thread_id"):
+        return _error("thread_id is required", 400)
+    return _submit(body["thread_id"], body.get("inputs"), body.get("tenant_id"), body.get("log_run_id"))
+
+
+def _submit(thread_id: str, inputs: dict, tenant_id: str = None, log_run_id: str = None):
+    try:
+        job = service.submit(thread_id, inputs, tenant_id, log_run_id)
+    except ThreadBusy as e:
+        return _error(str(e), 409)
+    except QueueFull as e:
+        return _error(str(e), 429)
+    return jsonify(job.info()), 202
+
+
+@http.route("/runs/<run_id>", methods=["GET"])
+def get_run(run_id):
+    job = service.jobs.get(run_id)
+    if not job:
+        return _error(f"Unknown run {run_id}", 404)
+    return jsonify(job.info())
+
+
+@http.route("/runs/<run_id>/cancel", methods=["POST"])
+def cancel_run(run_id):
+    if run_id not in service.jobs:
+        return _error(f"Unknown run {run_id}", 404)
+    return jsonify({"cancelled": service.cancel(run_id)})
+
+
+@http.route("/runs/<run_id>/stream", methods=["GET"])
+def stream_run(run_id):
+    """Server-Sent Events: one "update" per node output, then "end" with the final status."""
+    job = service.jobs.get(run_id)
+    if not job:
+        return _error(f"Unknown run {run_id}", 404)
+    # Event ids are event indexes; a reconnecting client sends the last one it received
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("after")
+    cursor = int(last_id) + 1 if last_id not in (None, "") else 0
+
+    def events():
+        nonlocal cursor
+        while True:
+            new, finished = job.wait(cursor, KEEPALIVE)
+            for node, content in new:
+                yield f"id: {cursor}\nevent: update\ndata: {_json({'node': node, 'content': content})}\n\n"
+                cursor += 1
+            if finished and not new:
+                yield f"event: end\ndata: {_json({'status': job.status, 'error': job.error})}\n\n"
+                return
+            if not new:
+                yield ": keepalive\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@http.route("/threads/<thread_id>/state", methods=["GET"])
+def get_state(thread_id):
+    snapshot = service.app.get_state({"configurable": {"thread_id": thread_id}})
+    return Response(_json({"values": snapshot.values, "next": list(snapshot.next)}), mimetype="application/json")
+
+
+@http.route("/threads/<thread_id>/state", methods=["POST"])
+def update_state(thread_id):
+    """{"values", "as_node"?} -> app.update_state (e.g. HITL feedback or a precomputed briefing)."""
+    body = request.get_json(force=True) or {}
+    if thread_id in service.active:
+        return _error(f"Thread {thread_id} has a run in flight", 409)
+    service.app.update_state({"configurable": {"thread_id": thread_id}}, body.get("values") or {},
+                             as_node=body.get("as_node"))
+    return jsonify({"ok": True})
+
+
+@http.route("/threads/<thread_id>/resume", methods=["POST"])
+def resume(thread_id):
+    """Resume a thread paused at the HITL checkpoint: {"feedback"?, "as_node"?} -> 202 {"run_id", ...}"""
+    body = request.get_json(force=True) or {}
+    if thread_id in service.active:
+        return _error(f"Thread {thread_id} has a run in flight", 409)
+    config = {"configurable": {"thread_id": thread_id}}
+    if not service.app.get_state(config).next:
+        return _error(f"Thread {thread_id} is not paused", 409)
+    if body.get("feedback"):
+        service.app.update_state(config, {"feedback": body["feedback"]}, as_node=body.get("as_node"))
+    return _submit(thread_id, None, body.get("tenant_id"), body.get("log_run_id"))
+
+
+@http.route("/threads/<thread_id>", methods=["DELETE"])
+def delete_thread(thread_id):
+    try:
+        service.release(thread_id)
+    except ThreadBusy as e:
+        return _error(str(e), 409)
+    return "", 204
+
+
+def start_service(app=graph, workers: int = AGENT_WORKERS) -> AgentService:
+    global service
+    service = AgentService(app, workers)
+    return service
+
+
+if __name__ == "__main__":
+    start_service()
+    print("\n" + "="*50)
+    print("🧠 kafeAI Agent Service")
+    print(f"   http://{SERVICE_HOST}:{SERVICE_PORT}  |  Workers: {AGENT_WORKERS}")
+    print(f"   Clients: AGENT_SERVICE_URL=http://{SERVICE_HOST}:{SERVICE_PORT}")
+    print("="*50 + "\n")
+    http.run(host=SERVICE_HOST, port=SERVICE_PORT, threaded=True)
@@ -0,0 +1,83 @@
+import asyncio
+import time
+import argparse
+from playwright.async_api import async_playwright
+from whatsapp_web import INPUT_SELECTOR, send_whatsapp_message
+
+# WhatsApp Web 发送速度基准：本地 HTML 替身页面 (contenteditable 输入框，Enter 发送，Shift+Enter 换行)
+# 对比旧的 page.type (逐字符按键) 与 insertText 路径，输出每 KB 的发送时间
+# 用法：python bench_whatsapp_send.py [--sizes 1 4 16] [--skip-type]
+
+STAND_IN_PAGE = """
+<html><body>
+<div id="sent"></div>
+<footer><div contenteditable="true" id="compose" style="min-height:2em;border:1px solid #ccc"></div></footer>
+<script>
+  const box = document.getElementById("compose");
+  box.addEventListener("keydown", (e) => {
+    if (e.key === "Enter" && !e.shiftKey) {
+      e.preventDefault();
+      const msg = document.createElement("div");
+      msg.className = "message-out";
+      msg.textContent = box.innerText;
+      document.getElementById("sent").appendChild(msg);
+      box.innerHTML = "";
+    }
+  });
+</script>
+</body></html>
+"""
+
+
+def sample_report(kb: int) -> str:
+    """Report-like text of about kb KB: short paragraphs of lines with emoji."""
+    paragraph = "📦 Stock: sallad 4 kg / target 10 kg (~1.5 days left)\n🌤️ Rain 70%, expect fewer walk-ins.\n"
+    text = ""
+    while len(text.encode("utf-8")) < kb * 1024:
+        text += paragraph + "\n"
+    return text.strip()
+
+
+async def send_typed(page, message):
+    """The previous send path: one keystroke per character."""
+    await page.click(INPUT_SELECTOR)
+    await page.type(INPUT_SELECTOR, message)
+    await page.press(INPUT_SELECTOR, "Enter")
+
+
+async def _sent_count(page) -> int:
+    return await page.evaluate("document.querySelectorAll('#sent .message-out').length")
+
+
+async def bench(sizes, skip_type: bool):
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(STAND_IN_PAGE)
+
+        methods = [("insert_text", send_whatsapp_message)]
+        if not skip_type:
+            methods.append(("page.type", send_typed))
+
+        print(f"{'method':<12} {'KB':>4} {'seconds':>9} {'s/KB':>8}")
+        for kb in sizes:
+            message = sample_report(kb)
+            for name, send in methods:
+                before = await _sent_count(page)
+                started = time.perf_counter()
+                await send(page, message)
+                elapsed = time.perf_counter() - started
+                ok = await _sent_count(page) == before + 1
+                delivered = await page.evaluate("document.querySelector('#sent').lastChild.textContent")
+                intact = delivered.replace("\n", "") == message.replace("\n", "")
+                print(f"{name:<12} {kb:>4} {elapsed:>9.2f} {elapsed / kb:>8.3f}"
+                      + ("" if ok and intact else "  (text mismatch)"))
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the WhatsApp Web send path against a local stand-in page.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16], help="Message sizes in KB")
+    parser.add_argument("--skip-type", action="store_true", help="Only measure the insert_text path")
+    args = parser.parse_args()
+    asyncio.run(bench(args.sizes, args.skip_type))
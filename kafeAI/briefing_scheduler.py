@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import uuid
+import time
+import hashlib
+import argparse
+import datetime
+import threading
+from dotenv import load_dotenv
+
+# 夜间预计算：在配置的时间 (BRIEFING_TIME) 先跑完 Phase 1 (到 HITL 暂停点)，
+# 把暂停时的状态和摘要存到 <site>/cache/precomputed/<target_date>.json，并推送“待审批”通知。
+# 早上的完整报告请求 (Decisions 页 / WhatsApp) 在输入未变化时直接恢复这份状态。
+# 多门店时所有门店并行预计算 (tenants.run_for_tenants)，每个门店通知自己的管理员号码。
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import report_index
+import tenants
+import agent_reports
+import outbox
+import weather_forecast
+import pricing_rules
+from structured_log import get_logger, run_context
+
+log = get_logger("Briefing Scheduler")
+
+BRIEFING_TIME = os.getenv("BRIEFING_TIME", "22:30")   # HH:MM local time, "off" disables
+BRIEFING_ISSUE = "Daily Briefing"
+NOTIFY_TO = os.getenv("BRIEFING_NOTIFY_TO")           # overrides each site's admin_number
+RESUME_AS_NODE = "creative"  # last Phase 1 node; the graph pauses before "manager"
+LIVE_INPUT_KEYS = ("issue", "history", "feedback", "tenant_id")  # taken from the request, not the record
+TEMP_BAND = 5             # °C; the fingerprint only changes when the forecast moves to another band
+
+
+# ── Inputs ────────────────────────────────────────────────────
+def weather_bucket(weather: dict) -> dict:
+    """
+    Coarse form of a forecast: what the pricing rules react to plus a TEMP_BAND temperature band,
+    so hourly forecast revisions do not invalidate a precomputed briefing.
+    """
+    return {
+        "condition": next((w for w in pricing_rules.BAD_WEATHER_WORDS
+                           if w in (weather.get("condition") or "").lower()), "fair"),
+        "rain": (weather.get("rain_chance") or 0) >= pricing_rules.RAIN_CHANCE_THRESHOLD,
+        "snow": (weather.get("snow_chance") or 0) >= pricing_rules.SNOW_CHANCE_THRESHOLD,
+        "temp_band": round((weather.get("avg_temp_c") or 0) / TEMP_BAND),
+    }
+
+
+def input_fingerprint(target_date: str) -> str:
+    """
+    Hash of everything Phase 1 reads: the latest Z-report, current stock (inventory only,
+    metadata timestamps are ignored), Menu.md and the weather bucket for target_date.
+    Keyed on the briefing's own date, so the 22:30 run still matches the next morning.
+    """
+    h = hashlib.sha256()
+    index = report_index.get_index()
+    if index:
+        date, path = index[-1]
+        st = os.stat(path)
+        h.update(f"{date}:{st.st_size}:{st.st_mtime_ns}".encode())
+    try:
+        with open(tenants.data_path("stock.json"), "r", encoding="utf-8") as f:
+            inventory = json.load(f).get("inventory", [])
+        h.update(json.dumps(inventory, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    except (OSError, json.JSONDecodeError):
+        h.update(b"no-stock")
+    try:
+        with open(tenants.data_path("Menu.md"), "rb") as f:
+            h.update(f.read())
+    except OSError:
+        h.update(b"no-menu")
+    try:
+        weather = weather_forecast.for_date(tenants.get_tenant()["city"], target_date)
+    except Exception:
+        weather = None
+    if weather:
+        h.update(json.dumps({"date": target_date, **weather_bucket(weather)}, sort_keys=True).encode("utf-8"))
+    else:
+        h.update(f"{target_date}:no-weather".encode())
+    return h.hexdigest()
+
+
+def render_summary(values: dict) -> str:
+    """Plain-text briefing from the paused Phase 1 state."""
+    lines = [f"kafeAI Daily Briefing for {values.get('target_date', 'tomorrow')}"]
+    lines.extend(f"{agent_reports.label(node)}: {entry['text']}" for node, entry in agent_reports.ordered(values))
+    promo = values.get("promotion_data")
+    if promo:
+        lines.append(
+            f"Proposed promotion: {promo.get('promotion_id')} - {promo.get('discount_type')} on "
+            f"{promo.get('product_item')} ({promo.get('price_original', '?')} -> {promo.get('price_promo', '?')} SEK)"
+        )
+    return "\n\n".join(lines)
+
+
+# ── Persisted Runs ────────────────────────────────────────────
+def precomputed_dir() -> str:
+    """cache/precomputed/ of the current tenant."""
+    return tenants.data_path("cache", "precomputed")
+
+
+def _record_path(target_date: str) -> str:
+    return os.path.join(precomputed_dir(), f"{target_date}.json")
+
+
+def save_record(record: dict):
+    os.makedirs(precomputed_dir(), exist_ok=True)
+    path = _record_path(record["target_date"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_precomputed(today: str = None):
+    """
+    Newest precomputed briefing whose target date is today or later and whose inputs
+    have not changed since it was computed. None otherwise.
+    """
+    directory = precomputed_dir()
+    if not os.path.isdir(directory):
+        return None
+    today = today or datetime.date.today().isoformat()
+    candidates = sorted(
+        (name[:-5] for name in os.listdir(directory) if name.endswith(".json")),
+        reverse=True,
+    )
+    for target_date in candidates:
+        if target_date < today:
+            break
+        try:
+            with open(_record_path(target_date), "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if "reports" not in record.get("values", {}):
+            continue  # saved before the per-agent state channels
+        if record.get("fingerprint") == input_fingerprint(target_date):
+            return record
+        log.info(f"Precomputed briefing for {target_date} is stale (inputs changed)")
+    return None
+
+
+def restore(app, config: dict, record: dict, inputs: dict = None):
+    """
+    Load a precomputed Phase 1 state into `config`'s thread, paused before the manager.
+    The live request's issue / history (inputs) replace the precomputed run's, so the
+    manager answers what was actually asked.
+    """
+    values = dict(record["values"])
+    values.update({key: inputs[key] for key in LIVE_INPUT_KEYS if key in (inputs or {})})
+    app.update_state(config, values, as_node=RESUME_AS_NODE)
+
+
+def precompute(force: bool = False, tenant_id: str = None) -> dict:
+    """Run Phase 1 to the HITL pause and persist the state. Skips if an up-to-date run exists."""
+    with tenants.tenant_scope(tenant_id) as tenant:
+        return _precompute(force, tenant)
+
+
+def _precompute(force: bool, tenant: dict) -> dict:
+    if not force:
+        existing = load_precomputed()
+        if existing:
+            log.info(f"[{tenant['id']}] Briefing for {existing['target_date']} is already up to date")
+            return existing
+
+    from agent_client import get_app, release_thread
+    app = get_app()
+
+    thread_id = f"briefing_{tenant['id']}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    config = {"configurable": {"thread_id": thread_id}}
+    inputs = {"issue": BRIEFING_ISSUE, "feedback": "", "tenant_id": tenant["id"]}
+
+    started = time.time()
+    with run_context(thread_id=thread_id, run_id=uuid.uuid4().hex[:12]):
+        log.info(f"[{tenant['id']}] Precomputing Phase 1...")
+        for _ in app.stream(inputs, config=config):
+            pass
+        snapshot = app.get_state(config)
+    # 状态已持久化到 record，内存中的检查点不再需要
+    release_thread(thread_id)
+
+    values = dict(snapshot.values)
+    target_date = values.get("target_date") or (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    record = {
+        "tenant_id": tenant["id"],
+        "target_date": target_date,
+        "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "duration_s": round(time.time() - started, 1),
+        # Phase 1 may deplete stock itself, so the fingerprint is taken after the run
+        "fingerprint": input_fingerprint(target_date),
+        "paused_before": list(snapshot.next),
+        "values": values,
+        "summary": render_summary(values),
+    }
+    save_record(record)
+    log.info(f"[{tenant['id']}] Briefing for {target_date} saved ({record['duration_s']}s)")
+    notify(record, tenant)
+    return record
+
+
+def precompute_all(force: bool = False) -> dict:
+    """Precompute every site in parallel. {tenant_id: record or Exception}."""
+    results = tenants.run_for_tenants(lambda tenant_id: precompute(force, tenant_id))
+    for tenant_id, result in results.items():
+        if isinstance(result, Exception):
+            log.error(f"[{tenant_id}] Precompute failed: {str(result)}")
+    return results
+
+
+def notify(record: dict, tenant: dict = None):
+    """Push a ready-to-approve message to the site's admin via Twilio; falls back to the log."""
+    tenant = tenant or tenants.get_tenant(record.get("tenant_id"))
+    body = (
+        f"☕ kafeAI briefing for {tenant['name']} on {record['target_date']} is ready to approve.\n"
+        "Open the Decisions tab or reply with a full report request."
+    )
+    notify_to = NOTIFY_TO or tenant.get("admin_number")
+    sid, token, sender = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"), os.getenv("TWILIO_FROM_NUMBER")
+    if not (sid and token and sender and notify_to):
+        log.info(body.replace("\n", " "))
+        return
+    try:
+        to = notify_to if notify_to.startswith("whatsapp:") or not sender.startswith("whatsapp:") else f"whatsapp:{notify_to}"
+        outbox.enqueue(to, body, sender=sender)
+        log.info(f"Notification queued for {notify_to}")
+    except Exception as e:
+        log.warning(f"Notification failed: {str(e)}")
+
+
+# ── Scheduler ─────────────────────────────────────────────────
+def seconds_until(hhmm: str, now: datetime.datetime = None) -> float:
+    now = now or datetime.datetime.now()
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += datetime.timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+class BriefingScheduler(threading.Thread):
+    """Daemon thread that precomputes every site's briefing once a day at `at` (HH:MM)."""
+
+    def __init__(self, at: str = BRIEFING_TIME):
+        super().__init__(name="kafeai-briefing-scheduler", daemon=True)
+        self.at = at
+        self._stop_event = threading.Event()
+
+    def run(self):
+        log.info(f"Scheduled nightly briefing at {self.at}")
+        while not self._stop_event.wait(seconds_until(self.at)):
+            try:
+                precompute_all()
+            except Exception as e:
+                log.error(f"Precompute failed: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler():
+    """Process-wide scheduler, started once. None when BRIEFING_TIME is "off"."""
+    global _scheduler
+    if not BRIEFING_TIME or BRIEFING_TIME.lower() == "off":
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = BriefingScheduler()
+            _scheduler.start()
+        return _scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the kafeAI daily briefing.")
+    parser.add_argument("--now", action="store_true", help="Precompute immediately and exit")
+    parser.add_argument("--force", action="store_true", help="Recompute even if inputs are unchanged")
+    parser.add_argument("--tenant", default=None, help="Only this site (default: all sites)")
+    args = parser.parse_args()
+
+    if args.now or args.force:
+        results = {args.tenant: precompute(args.force, args.tenant)} if args.tenant else precompute_all(args.force)
+        for tenant_id, result in results.items():
+            print(result if isinstance(result, Exception) else result["summary"])
+        # 等待通知发出 (未发出的会留在发件箱，由下一个运行的调度线程发送)
+        if not outbox.start_dispatcher().wait_idle(60):
+            log.warning("Some notifications are still queued in the outbox")
+    else:
+        start_scheduler()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
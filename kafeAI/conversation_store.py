@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+import tenants
+
+# WhatsApp / SMS 对话记忆：与 LangGraph 运行状态分开保存
+# 每条消息都在一个新的运行线程 (thread_id) 上执行，运行结束后删除其检查点；
+# 对话本身只保留最近 HISTORY_MESSAGES 条 (截断)，更早的提问折叠成一行简短的 "Earlier topics"，
+# 所以 prompt 和存储大小不随聊天天数增长。超过 CONVERSATION_TTL 未活动的对话被清理。
+# 数据库位于当前门店的 cache/conversations.db
+
+HISTORY_MESSAGES = int(os.getenv("CONVERSATION_HISTORY", "6"))    # messages kept verbatim
+MESSAGE_CHARS = 400           # per stored message
+SUMMARY_CHARS = 400           # "Earlier topics" line
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL_HOURS", "72")) * 3600
+CLEANUP_INTERVAL = 3600       # seconds between TTL sweeps (per process and site)
+
+ROLE_LABELS = {"user": "Owner", "assistant": "kafeAI"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    summary         TEXT NOT NULL DEFAULT '',
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    ts              REAL NOT NULL,
+    role            TEXT NOT NULL,
+    text            TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id);
+"""
+
+_last_cleanup = {}            # db path -> time of the last TTL sweep
+_cleanup_lock = threading.Lock()
+
+
+def store_path() -> str:
+    return tenants.data_path("cache", "conversations.db")
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """Open the conversation store, creating the schema on first use."""
+    path = path or store_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def new_thread_id(conversation_id: str) -> str:
+    """Fresh LangGraph thread for one request of a conversation."""
+    return f"{conversation_id}_{uuid.uuid4().hex[:8]}"
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def append(conversation_id: str, role: str, text: str, path: str = None):
+    """
+    Add a message ("user" or "assistant"). Messages beyond the newest HISTORY_MESSAGES
+    are removed; their user questions are folded into the conversation's summary line.
+    """
+    now = time.time()
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO conversations (conversation_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (conversation_id, now),
+            )
+            conn.execute(
+                "INSERT INTO messages (conversation_id, ts, role, text) VALUES (?, ?, ?, ?)",
+                (conversation_id, now, role, _clip(text, MESSAGE_CHARS)),
+            )
+            overflow = conn.execute(
+                "SELECT id, role, text FROM messages WHERE conversation_id = ? "
+                "ORDER BY id DESC LIMIT -1 OFFSET ?",
+                (conversation_id, HISTORY_MESSAGES),
+            ).fetchall()
+            if overflow:
+                questions = [_clip(t, 80) for _, r, t in reversed(overflow) if r == "user"]
+                if questions:
+                    summary = conn.execute(
+                        "SELECT summary FROM conversations WHERE conversation_id = ?", (conversation_id,)
+                    ).fetchone()[0]
+                    summary = "; ".join(filter(None, [summary] + questions))
+                    # 保留最近的话题
+                    if len(summary) > SUMMARY_CHARS:
+                        summary = "..." + summary[-(SUMMARY_CHARS - 3):]
+                    conn.execute(
+                        "UPDATE conversations SET summary = ? WHERE conversation_id = ?",
+                        (summary, conversation_id),
+                    )
+                conn.execute(
+                    "DELETE FROM messages WHERE conversation_id = ? AND id <= ?",
+                    (conversation_id, overflow[0][0]),
+                )
+    finally:
+        conn.close()
+    _maybe_cleanup(path or store_path())
+
+
+def history_text(conversation_id: str, path: str = None) -> str:
+    """Compact recent history for prompts ("" for a new or expired conversation)."""
+    conn = connect(path)
+    try:
+        row = conn.execute(
+            "SELECT summary, updated_at FROM conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if not row or time.time() - row[1] > CONVERSATION_TTL:
+            return ""
+        messages = conn.execute(
+            "SELECT role, text FROM messages WHERE conversation_id = ? ORDER BY id", (conversation_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    lines = [f"Earlier topics: {row[0]}"] if row[0] else []
+    lines.extend(f"{ROLE_LABELS.get(role, role)}: {text}" for role, text in messages)
+    return "\n".join(lines)
+
+
+def cleanup(ttl: float = None, path: str = None) -> int:
+    """Delete conversations idle for longer than ttl seconds. Returns how many were removed."""
+    cutoff = time.time() - (CONVERSATION_TTL if ttl is None else ttl)
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "DELETE FROM messages WHERE conversation_id IN "
+                "(SELECT conversation_id FROM conversations WHERE updated_at < ?)",
+                (cutoff,),
+            )
+            return conn.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+    finally:
+        conn.close()
+
+
+def _maybe_cleanup(path: str):
+    now = time.time()
+    with _cleanup_lock:
+        if now - _last_cleanup.get(path, 0) < CLEANUP_INTERVAL:
+            return
+        _last_cleanup[path] = now
+    cleanup(path=path)
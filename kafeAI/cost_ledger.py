@@ -0,0 +1,336 @@
+import os
+import json
+import base64
+import hashlib
+import sqlite3
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_core.messages import SystemMessage, HumanMessage
+import report_index
+import tenants
+
+# 供应商收据 -> 成本账本 (替代固定 COGS_RATE)
+# 收据照片位于 tant_cost_reciep/<YYYY_MM>/，提取结果存入 cache/cost_ledger.db (均在当前门店的数据目录下)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+MAX_WORKERS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    file_hash    TEXT PRIMARY KEY,
+    file_path    TEXT NOT NULL,
+    supplier     TEXT,
+    receipt_date TEXT,
+    month        TEXT,
+    total_gross  REAL DEFAULT 0,
+    total_vat    REAL DEFAULT 0,
+    total_net    REAL DEFAULT 0,
+    vat_details  TEXT,
+    extracted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(receipt_date);
+CREATE INDEX IF NOT EXISTS idx_receipts_month ON receipts(month);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    file_hash   TEXT NOT NULL,
+    line_no     INTEGER NOT NULL,
+    description TEXT,
+    quantity    REAL,
+    unit        TEXT,
+    amount      REAL,
+    vat_rate    REAL,
+    PRIMARY KEY (file_hash, line_no)
+);
+CREATE INDEX IF NOT EXISTS idx_line_items_hash ON line_items(file_hash);
+"""
+
+EXTRACTION_PROMPT = (
+    "You are the Bookkeeping Assistant for kafeAI, a café in Sweden. "
+    "The image is a supplier receipt or invoice (Swedish, amounts in SEK).\n"
+    "Extract it into a valid JSON object with this schema:\n"
+    "{\n"
+    "  \"supplier\": \"Supplier name\",\n"
+    "  \"date\": \"YYYY-MM-DD\",\n"
+    "  \"total_gross\": 0.0,\n"
+    "  \"total_vat\": 0.0,\n"
+    "  \"vat_details\": [{\"rate\": \"12%\", \"vat_amount\": 0.0, \"total\": 0.0}],\n"
+    "  \"line_items\": [{\"description\": \"...\", \"quantity\": 1, \"unit\": \"st\", \"amount\": 0.0, \"vat_rate\": 12}]\n"
+    "}\n"
+    "Use numbers (not strings) for all amounts. If a field is unreadable, use null. "
+    "Return ONLY the JSON object."
+)
+
+
+def ledger_path() -> str:
+    return tenants.data_path("cache", "cost_ledger.db")
+
+
+def receipts_dir() -> str:
+    return tenants.data_path("tant_cost_reciep")
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """Open the ledger database, creating the schema on first use."""
+    path = path or ledger_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def list_receipt_files(directory: str = None) -> list:
+    """All receipt images under tant_cost_reciep/, sorted by path."""
+    files = []
+    for root, _, names in os.walk(directory or receipts_dir()):
+        for name in names:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def _folder_month(path: str) -> str:
+    """Fallback month from the folder name, e.g. tant_cost_reciep/2026_01/ -> 2026-01"""
+    folder = os.path.basename(os.path.dirname(path))
+    parts = folder.split("_")
+    if len(parts) == 2 and all(p.isdigit() for p in parts):
+        return f"{parts[0]}-{parts[1]}"
+    return ""
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def extract_receipt(path: str, llm) -> dict:
+    """Run one receipt image through the vision model and return the parsed JSON."""
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    mime = "jpeg" if ext in ("jpg", "jpeg") else ext
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("ascii")
+
+    response = llm.invoke([
+        SystemMessage(content=EXTRACTION_PROMPT),
+        HumanMessage(content=[
+            {"type": "text", "text": "Extract this receipt."},
+            {"type": "image_url", "image_url": f"data:image/{mime};base64,{b64}"},
+        ]),
+    ])
+
+    res_text = response.content
+    if isinstance(res_text, list):
+        res_text = "".join([c.get("text", "") if isinstance(c, dict) else str(c) for c in res_text])
+    json_str = res_text.replace("```json", "").replace("```", "").strip()
+    if "{" in json_str:
+        json_str = json_str[json_str.find("{"):json_str.rfind("}") + 1]
+    return json.loads(json_str)
+
+
+def _store_receipt(conn: sqlite3.Connection, file_hash: str, path: str, data: dict):
+    month = _folder_month(path)
+    receipt_date = data.get("date") or ""
+    if len(receipt_date) >= 7 and receipt_date[4] == "-":
+        month = receipt_date[:7]
+    elif month:
+        # 日期无法识别时，按所在月份文件夹记到当月第一天
+        receipt_date = f"{month}-01"
+
+    gross = _to_float(data.get("total_gross"))
+    vat = _to_float(data.get("total_vat"))
+    if not vat and data.get("vat_details"):
+        vat = sum(_to_float(v.get("vat_amount")) for v in data["vat_details"])
+
+    conn.execute("DELETE FROM line_items WHERE file_hash = ?", (file_hash,))
+    conn.execute(
+        "INSERT OR REPLACE INTO receipts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            file_hash,
+            os.path.relpath(path, tenants.data_path()),
+            data.get("supplier") or "Unknown",
+            receipt_date,
+            month,
+            gross,
+            vat,
+            gross - vat,
+            json.dumps(data.get("vat_details") or [], ensure_ascii=False),
+            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO line_items VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                file_hash, i,
+                item.get("description"),
+                _to_float(item.get("quantity")),
+                item.get("unit"),
+                _to_float(item.get("amount")),
+                _to_float(item.get("vat_rate")),
+            )
+            for i, item in enumerate(data.get("line_items") or [])
+        ],
+    )
+
+
+def sync_ledger(llm, directory: str = None, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Extract every receipt that is not yet in the ledger.
+    Receipts are keyed by content hash, so unchanged photos are never re-sent to the LLM.
+    """
+    conn = connect()
+    try:
+        known = {row[0] for row in conn.execute("SELECT file_hash FROM receipts")}
+        pending = {}
+        for path in list_receipt_files(directory):
+            file_hash = _file_hash(path)
+            if file_hash not in known and file_hash not in pending:
+                pending[file_hash] = path
+
+        result = {"cached": len(known), "extracted": 0, "failed": []}
+        if not pending:
+            return result
+
+        # LLM 调用并行执行，写库只在当前线程进行 (sqlite 连接不跨线程)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(extract_receipt, path, llm): (h, path) for h, path in pending.items()}
+            for future in as_completed(futures):
+                file_hash, path = futures[future]
+                try:
+                    _store_receipt(conn, file_hash, path, future.result())
+                    conn.commit()
+                    result["extracted"] += 1
+                except Exception as e:
+                    result["failed"].append(f"{os.path.basename(path)}: {str(e)}")
+        return result
+    finally:
+        conn.close()
+
+
+# ── COGS Queries ──────────────────────────────────────────────
+def _month_net_sales(month: str, until: str = None) -> float:
+    """Sum of total_net over reports in month (YYYY-MM), optionally up to an ISO date."""
+    end = until or f"{month}-31"
+    return sum(
+        report.get("sales_summary", {}).get("total_net", 0)
+        for _, report in report_index.iter_reports(f"{month}-01", end)
+    )
+
+
+def cogs_ratio_for(report_date: str, default: float = None):
+    """
+    Actual COGS ratio for the month of report_date (YYYY-MM-DD):
+    purchases (net of VAT) / net sales. Returns (ratio, source).
+    Falls back to default when the ledger has no receipts for that month.
+    """
+    month = report_date[:7]
+    if os.path.exists(ledger_path()):
+        conn = connect()
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total_net), 0) FROM receipts WHERE month = ?", (month,)
+            ).fetchone()
+        finally:
+            conn.close()
+        count, purchases = row
+        if count:
+            net_sales = _month_net_sales(month)
+            if net_sales > 0:
+                return purchases / net_sales, f"receipts ({count} for {month})"
+    return default, "default rate"
+
+
+def load_receipts_frame():
+    """Receipts ledger as a DataFrame with a parsed date column."""
+    import pandas as pd
+    if not os.path.exists(ledger_path()):
+        return pd.DataFrame(columns=["supplier", "date", "month", "total_gross", "total_vat", "total_net"])
+    conn = connect()
+    try:
+        df = pd.read_sql_query(
+            "SELECT supplier, receipt_date AS date, month, total_gross, total_vat, total_net FROM receipts",
+            conn,
+        )
+    finally:
+        conn.close()
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return df
+
+
+def load_sales_frame(start: str = None, end: str = None):
+    """Daily sales history (date, gross, net, vat) from the report index."""
+    import pandas as pd
+    rows = []
+    for date, report in report_index.iter_reports(start, end):
+        s = report.get("sales_summary", {})
+        rows.append({
+            "date": date,
+            "gross": s.get("total_gross", 0),
+            "net": s.get("total_net", 0),
+            "vat": s.get("total_vat", 0),
+        })
+    df = pd.DataFrame(rows, columns=["date", "gross", "net", "vat"])
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return df
+
+
+def cost_margins(freq: str = "M", sales=None, receipts=None):
+    """
+    Join sales history with actual COGS.
+    freq="M" -> per month. freq="D" -> per sales day, each month's COGS spread evenly over
+    that month's sales days (receipts are dated by delivery, not by when stock is used).
+    Months without receipts get NaN cogs / margin, not a 100% margin.
+    Columns: period, net, cogs, gross_margin, margin_pct
+    """
+    import pandas as pd
+    sales = load_sales_frame() if sales is None else sales
+    receipts = load_receipts_frame() if receipts is None else receipts
+
+    # Empty frames come back with object columns
+    sales = pd.DataFrame({
+        "date": pd.to_datetime(sales["date"], errors="coerce"),
+        "net": pd.to_numeric(sales["net"], errors="coerce").fillna(0.0),
+    }).dropna(subset=["date"])
+    receipts = pd.DataFrame({
+        "date": pd.to_datetime(receipts["date"], errors="coerce"),
+        "total_net": pd.to_numeric(receipts["total_net"], errors="coerce").fillna(0.0),
+    }).dropna(subset=["date"])
+
+    month_net = sales.groupby(sales["date"].dt.to_period("M"))["net"].sum().rename("net")
+    month_cogs = receipts.groupby(receipts["date"].dt.to_period("M"))["total_net"].sum().rename("cogs")
+    months = pd.concat([month_net, month_cogs], axis=1).rename_axis("period")
+    months["net"] = months["net"].fillna(0.0)
+
+    if freq == "D":
+        df = sales.groupby(sales["date"].dt.normalize())["net"].sum().rename_axis("period").to_frame()
+        month = df.index.to_period("M")
+        sales_days = df.groupby(month)["net"].transform("size").to_numpy()
+        df["cogs"] = months["cogs"].reindex(month).to_numpy() / sales_days
+    else:
+        df = months
+
+    df = df.reset_index()
+    df["gross_margin"] = df["net"] - df["cogs"]
+    df["margin_pct"] = df["gross_margin"] / df["net"].where(df["net"] != 0) * 100
+    return df.sort_values("period").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from llm_models import get_llm
+
+    load_dotenv()
+    result = sync_ledger(get_llm("receipts"))
+    print("--- Cost Ledger Sync ---")
+    print(f"Cached: {result['cached']} | Extracted: {result['extracted']} | Failed: {len(result['failed'])}")
+    for err in result["failed"]:
+        print(f"  ! {err}")
@@ -1,72 +1,143 @@
 import json
 import os
+import re
+import datetime
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+from structured_log import get_logger
+from llm_models import get_llm
+from menu_model import get_menu
+from pricing_rules import evaluate_triggers, expected_traffic, promotion_skeleton
+from agent_reports import report, context_text, ERROR
 
-# Reuse the same LLM configuration as manageragent
-llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0)
+log = get_logger("Dynamic Pricing Agent")
 
-def dynamic_pricing_agent(state):
+# Copywriting only; the model chain for "pricing" is configured in llm_models
+llm = get_llm("pricing")
+
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:_?PERCENT|%)", re.IGNORECASE)
+_AMOUNT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*_?(?:SEK|KR)_?OFF", re.IGNORECASE)
+
+
+def promo_price(price: float, discount_type: str):
     """
-    Analyzes weather and inventory context to generate a structured promotion.
+    Effective unit price after a discount: "30_PERCENT_OFF", "20_SEK_OFF",
+    "BOGO_FREE" (two for the price of one). None if the type is not understood.
     """
-    print("\n[Dynamic Pricing Agent] Analyzing market conditions...")
-    
-    # Extract context
-    context_str = "\n".join(state.get("context", []))
-    
+    dt = (discount_type or "").upper()
+    if "BOGO" in dt:
+        return round(price / 2)
+    m = _PERCENT_RE.search(dt)
+    if m:
+        return round(price * (1 - min(float(m.group(1)), 100) / 100))
+    m = _AMOUNT_RE.search(dt)
+    if m:
+        return round(max(price - float(m.group(1)), 0))
+    return None
+
+
+def apply_menu_prices(promotion_data: dict, menu=None) -> dict:
+    """Fill price_original / price_promo from the parsed menu instead of trusting the LLM."""
+    menu = menu or get_menu()
+    item = menu.item(promotion_data.get("product_item"))
+    if item and item["price"] is not None:
+        original = item["price"]
+    else:
+        # ALL_CATEGORY: 以该分区最低价作为 "from" 价格
+        prices = [it["price"] for it in menu.section_items(promotion_data.get("product_category")) if it["price"] is not None]
+        original = min(prices) if prices else None
+
+    promotion_data.pop("price_original", None)
+    promotion_data.pop("price_promo", None)
+    if original is None:
+        return promotion_data
+    promotion_data["price_original"] = f"{original:g}"
+    promo = promo_price(original, promotion_data.get("discount_type"))
+    if promo is not None:
+        promotion_data["price_promo"] = f"{promo:g}"
+    return promotion_data
+
+
+def _default_copy(promotion_data: dict) -> dict:
+    """Template copy used when the copywriting call fails."""
+    item = promotion_data["product_item"]
+    if item == "ALL_CATEGORY":
+        item = promotion_data["product_category"]
+    offer = promotion_data["discount_type"].replace("_", " ").title()
+    return {
+        "visual_prompt": f"{item}, cozy Swedish cafe, warm lighting",
+        "marketing_copy_headline": f"{offer}: {item}",
+        "marketing_copy_body": f"{promotion_data['theme']} at kafeAI. Valid until {promotion_data['valid_until'][:10]}.",
+    }
+
+
+def write_copy(promotion_data: dict, context_str: str) -> dict:
+    """LLM copywriting for an already decided promotion."""
     system_prompt = (
-        "You are the Revenue Manager for kafeAI. Your goal is to maximize daily revenue.\n"
-        "Analyze the provided context (Weather, Inventory, Events) and decide if a promotion is needed.\n"
-        "Triggers:\n"
-        "- Bad weather (Snow, Rain, Temp < -10C) -> Boost comfort food/warm drinks.\n"
-        "- High perishable inventory (Stock > Target) -> Discount to clear.\n"
-        "- Low traffic expected -> High value offer (BOGO).\n\n"
-        "If NO promotion is needed, return an empty JSON object: {}.\n"
-        "If a promotion IS needed, return a valid JSON object with this schema:\n"
+        "You are the Copywriter for kafeAI, a café in Sweden. "
+        "The promotion below has already been decided; do not change the offer or the price.\n"
+        f"{json.dumps(promotion_data, ensure_ascii=False, indent=2)}\n\n"
+        "Return ONLY a valid JSON object with this schema:\n"
         "{\n"
-        "  \"promotion_id\": \"PROMO_NAME\",\n"
         "  \"theme\": \"Marketing Theme (e.g. Cozy Winter)\",\n"
-        "  \"product_category\": \"Target Category\",\n"
-        "  \"product_item\": \"Specific Item or ALL_CATEGORY\",\n"
-        "  \"discount_type\": \"e.g. BOGO_FREE, 50_PERCENT_OFF\",\n"
-        "  \"valid_until\": \"YYYY-MM-DD HH:MM:SS\",\n"
-        "  \"reason\": \"Brief strategy explanation\",\n"
         "  \"visual_prompt\": \"Keywords for AI image generator (atmosphere, lighting, subject)\",\n"
         "  \"marketing_copy_headline\": \"Catchy Headline (Short)\",\n"
-        "  \"marketing_copy_body\": \"Engaging body text (max 20 words)\",\n"
-        "  \"price_original\": \"Original Price SEK\",\n"
-        "  \"price_promo\": \"Promo Price SEK\"\n"
+        "  \"marketing_copy_body\": \"Engaging body text (max 20 words)\"\n"
         "}"
     )
-    
     response = llm.invoke([
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"Current Context:\n{context_str}")
     ])
-    
+
+    res_text = response.content
+    if isinstance(res_text, list):
+        res_text = "".join([c.get("text", "") if isinstance(c, dict) else str(c) for c in res_text])
+    json_str = res_text.replace("```json", "").replace("```", "").strip()
+    if "{" in json_str:
+        json_str = json_str[json_str.find("{"):json_str.rfind("}")+1]
+    copy = json.loads(json_str)
+    return {k: copy[k] for k in ("theme", "visual_prompt", "marketing_copy_headline", "marketing_copy_body") if copy.get(k)}
+
+
+def dynamic_pricing_agent(state):
+    """
+    Evaluates the pricing triggers locally (weather, stock vs target, forecast traffic).
+    The LLM is only called for copywriting when a trigger fires.
+    """
+    log.info("Analyzing market conditions...")
+
+    menu = get_menu()
+    target_date = state.get("target_date") or (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+
     try:
-        # Clean up response
-        res_text = response.content
-        if isinstance(res_text, list):
-            res_text = "".join([c.get("text", "") if isinstance(c, dict) else str(c) for c in res_text])
-            
-        json_str = res_text.replace("```json", "").replace("```", "").strip()
-        
-        # Handle cases where the model might return text before/after JSON
-        if "{" in json_str:
-            json_str = json_str[json_str.find("{"):json_str.rfind("}")+1]
-            
-        promotion_data = json.loads(json_str)
-        
-        if not promotion_data:
-            return {"context": ["Dynamic Pricing: No promotion active."]}
-            
-        print(f"  > Generated Promo: {promotion_data.get('promotion_id')}")
-        return {
-            "promotion_data": promotion_data,
-            "context": [f"Dynamic Pricing: Active Promo [{promotion_data.get('promotion_id')}] - {promotion_data.get('reason')}"]
-        }
-        
+        # The forecast node runs first; its parsed EXPECTED_GROSS drives the low-traffic trigger
+        expected_gross = (state.get("sales_forecast") or {}).get("expected_gross")
+        traffic = expected_traffic(target_date, expected_gross=expected_gross)
+        triggers = evaluate_triggers(weather=state.get("weather"), target_date=target_date,
+                                     traffic=traffic, menu=menu)
     except Exception as e:
-        return {"context": [f"Dynamic Pricing Error: {str(e)}"]}
+        log.error(f"Failed to evaluate triggers: {str(e)}")
+        return report("pricing", str(e), status=ERROR)
+
+    if not triggers:
+        log.info("No trigger fired, skipping promotion.")
+        return report("pricing", "No promotion active (no trigger fired).")
+
+    trigger = triggers[0]
+    promotion_data = apply_menu_prices(promotion_skeleton(trigger, target_date), menu)
+    promotion_data.update(_default_copy(promotion_data))
+
+    context_str = context_text(state)
+    try:
+        promotion_data.update(write_copy(promotion_data, context_str))
+    except Exception as e:
+        log.warning(f"Copywriting failed, using template copy: {str(e)}")
+
+    others = "; ".join(t["reason"] for t in triggers[1:])
+    log.info(f"Generated Promo: {promotion_data.get('promotion_id')}")
+    return report(
+        "pricing",
+        f"Active Promo [{promotion_data.get('promotion_id')}] - {promotion_data.get('reason')}"
+        + (f" (also triggered: {others})" if others else ""),
+        promotion_data=promotion_data,
+    )
@@ -1,15 +1,35 @@
 import os
+import re
 import json
 import requests
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
+from structured_log import get_logger
+from agent_reports import report, context_text, ERROR
+import sales_cube
+import tenants
+
+log = get_logger("Forecasting")
+
+# 预测报告最后一行给出明天的总销售额，解析后写入 sales_forecast 通道
+EXPECTED_GROSS_RE = re.compile(r"EXPECTED_GROSS\W*?:\W*?(\d[\d ,.]*)")
+
+
+def parse_expected_gross(text: str):
+    """Expected gross (SEK) from the report's EXPECTED_GROSS line, or None."""
+    match = EXPECTED_GROSS_RE.search(text or "")
+    if not match:
+        return None
+    try:
+        return float(re.sub(r"[ ,]", "", match.group(1)).rstrip("."))
+    except ValueError:
+        return None
 
 def forecasting_agent(state, llm):
     """
     结合历史销售数据和天气预测明天的销售目标。
     """
-    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    reports_dir = os.path.join(base_path, "daily_reports")
+    reports_dir = tenants.data_path("daily_reports")
     
     try:
         # 1. 获取最近 3 天的历史数据
@@ -24,15 +44,21 @@ def forecasting_agent(state, llm):
                     "categories": data["sales_by_category"]
                 })
         
+        # 预先聚合的 月 / 星期 / 类别周趋势 (sales_cube，只读取新增或改动的日报)
+        trends = sales_cube.get_cube(reports_dir).prompt_summary()
+
         # 2. 获取天气预测 (从 state 里的 predictor 节点获取)
-        forecast_context = "\n".join(state.get("context", []))
+        forecast_context = context_text(state)
         
         system_prompt = (
             "You are the Sales Forecasting Expert for kafeAI. "
             "Based on the provided historical sales and weather forecast, predict tomorrow's sales targets. "
-            "Output your prediction in a clear, structured way.\n\n"
+            "Output your prediction in a clear, structured way, and end with one line "
+            "'EXPECTED_GROSS: <number>' giving tomorrow's total gross sales in SEK.\n\n"
             "History (Last 3 days):\n"
             f"{json.dumps(history, indent=2)}\n\n"
+            "Longer-term Trends (month / weekday / category by week):\n"
+            f"{trends or 'No history yet.'}\n\n"
             "Forecast Context:\n"
             f"{forecast_context}"
         )
@@ -46,7 +72,12 @@ def forecasting_agent(state, llm):
         if isinstance(res_text, list):
             res_text = "".join([c.get("text", "") if isinstance(c, dict) else str(c) for c in res_text])
             
-        return {"context": [f"Sales Forecast Report:\n{res_text}"]}
+        sales_forecast = {
+            "expected_gross": parse_expected_gross(res_text),
+            "history": [{"date": h["date"], "total_gross": h["total_gross"]} for h in history],
+        }
+        return report("forecast", res_text, sales_forecast=sales_forecast)
         
     except Exception as e:
-        return {"context": [f"Forecasting Error: {str(e)}"]}
+        log.error(str(e))
+        return report("forecast", str(e), status=ERROR)
@@ -0,0 +1,353 @@
+"""
+KafeAI Frontend — Incremental Backup Store
+Content-addressed backups: each snapshot is a manifest of {path: sha256}; file contents
+are stored once under backups/objects/. Restores are staged, validated and merged in:
+files in the backup replace their live copies, newer files that are not in it are kept.
+"""
+import os
+import io
+import gzip
+import json
+import shutil
+import hashlib
+import zipfile
+import datetime
+from typing import Optional
+
+from config import (
+    STOCK_PATH, MENU_PATH, MEMORY_PATH, REPORTS_DIR,
+    DECISION_HISTORY_DIR, BASE
+)
+from structured_log import get_logger
+
+log = get_logger("Backup")
+
+BACKUP_DIR = os.path.join(BASE, "backups")
+OBJECTS_DIR = os.path.join(BACKUP_DIR, "objects")
+MANIFESTS_DIR = os.path.join(BACKUP_DIR, "manifests")
+EXPORTS_DIR = os.path.join(BACKUP_DIR, "exports")
+
+CORE_FILES = [STOCK_PATH, MENU_PATH, MEMORY_PATH]
+DATA_DIRS = [REPORTS_DIR, DECISION_HISTORY_DIR]
+
+# Retention defaults: newest N snapshots + the last snapshot of each day for D days
+KEEP_LAST = 10
+KEEP_DAILY_DAYS = 30
+
+CHUNK = 1 << 20
+
+
+# ── Snapshot ───────────────────────────────────────────────────
+def _tracked_files() -> list:
+    """Relative paths of all files that belong in a backup."""
+    rel = [os.path.relpath(f, BASE) for f in CORE_FILES if os.path.exists(f)]
+    for d in DATA_DIRS:
+        if os.path.isdir(d):
+            for name in sorted(os.listdir(d)):
+                if name.endswith(".json") and os.path.isfile(os.path.join(d, name)):
+                    rel.append(os.path.relpath(os.path.join(d, name), BASE))
+    return [p.replace(os.sep, "/") for p in rel]
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _object_path(digest: str) -> str:
+    return os.path.join(OBJECTS_DIR, digest[:2], digest)
+
+
+def _store_object(src: str, digest: str) -> bool:
+    """Gzip the file into the object store. Returns False if it was already stored."""
+    dest = _object_path(digest)
+    if os.path.exists(dest):
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + ".tmp"
+    with open(src, "rb") as fin, gzip.open(tmp, "wb") as fout:
+        shutil.copyfileobj(fin, fout, CHUNK)
+    os.replace(tmp, dest)
+    return True
+
+
+def list_snapshots() -> list:
+    """Snapshot manifest names, newest first."""
+    try:
+        names = [f for f in os.listdir(MANIFESTS_DIR) if f.endswith(".json")]
+        return sorted(names, reverse=True)
+    except FileNotFoundError:
+        return []
+
+
+def read_manifest(name: str) -> dict:
+    try:
+        with open(os.path.join(MANIFESTS_DIR, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def create_snapshot() -> Optional[dict]:
+    """
+    Record the current data as a new snapshot. Files whose size and mtime match the
+    previous snapshot reuse its hash; only new content is written to the object store.
+    Returns the manifest (with stats) or None on failure.
+    """
+    try:
+        os.makedirs(MANIFESTS_DIR, exist_ok=True)
+        previous = list_snapshots()
+        parent = read_manifest(previous[0]) if previous else {}
+        parent_files = parent.get("files", {})
+
+        files = {}
+        new_objects = new_bytes = 0
+        for rel in _tracked_files():
+            full = os.path.join(BASE, rel)
+            st = os.stat(full)
+            prev = parent_files.get(rel)
+            if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                digest = prev["sha256"]
+            else:
+                digest = _hash_file(full)
+            if _store_object(full, digest):
+                new_objects += 1
+                new_bytes += st.st_size
+            files[rel] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+        now = datetime.datetime.now()
+        name = f"snapshot_{now.strftime('%Y%m%d_%H%M%S_%f')}.json"
+        manifest = {
+            "name": name,
+            "created": now.isoformat(timespec="seconds"),
+            "parent": previous[0] if previous else None,
+            "files": files,
+            "stats": {
+                "files": len(files),
+                "new_objects": new_objects,
+                "new_bytes": new_bytes,
+                "total_bytes": sum(f["size"] for f in files.values()),
+            },
+        }
+        tmp = os.path.join(MANIFESTS_DIR, name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, os.path.join(MANIFESTS_DIR, name))
+
+        apply_retention()
+        return manifest
+    except Exception as e:
+        log.error(f"Snapshot failed: {type(e).__name__}: {e}")
+        return None
+
+
+def export_snapshot_zip(name: str) -> Optional[str]:
+    """Write a self-contained zip (manifest.json + files) for download. Returns zip path."""
+    manifest = read_manifest(name)
+    if not manifest:
+        return None
+    try:
+        os.makedirs(EXPORTS_DIR, exist_ok=True)
+        # Only the latest export is kept on disk
+        for old in os.listdir(EXPORTS_DIR):
+            os.remove(os.path.join(EXPORTS_DIR, old))
+        zip_path = os.path.join(EXPORTS_DIR, f"kafeai_backup_{name[len('snapshot_'):-len('.json')]}.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("manifest.json", json.dumps(manifest, indent=1))
+            for rel, meta in manifest["files"].items():
+                with gzip.open(_object_path(meta["sha256"]), "rb") as src, zf.open(rel, "w") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK)
+        return zip_path
+    except Exception as e:
+        log.error(f"Export of {name} failed: {type(e).__name__}: {e}")
+        return None
+
+
+# ── Retention ──────────────────────────────────────────────────
+def apply_retention(keep_last: int = KEEP_LAST, keep_daily_days: int = KEEP_DAILY_DAYS) -> int:
+    """Delete snapshots outside the policy, then unreferenced objects. Returns snapshots removed."""
+    names = list_snapshots()
+    keep = set(names[:keep_last])
+    cutoff = (datetime.date.today() - datetime.timedelta(days=keep_daily_days)).strftime("%Y%m%d")
+    seen_days = set()
+    for name in names:  # newest first -> first seen is the day's last snapshot
+        day = name[len("snapshot_"):len("snapshot_") + 8]
+        if day >= cutoff and day not in seen_days:
+            keep.add(name)
+            seen_days.add(day)
+
+    removed = 0
+    for name in names:
+        if name not in keep:
+            os.remove(os.path.join(MANIFESTS_DIR, name))
+            removed += 1
+
+    if removed and os.path.isdir(OBJECTS_DIR):
+        referenced = set()
+        for name in list_snapshots():
+            referenced.update(f["sha256"] for f in read_manifest(name).get("files", {}).values())
+        for bucket in os.listdir(OBJECTS_DIR):
+            bucket_dir = os.path.join(OBJECTS_DIR, bucket)
+            for digest in os.listdir(bucket_dir):
+                if digest not in referenced:
+                    os.remove(os.path.join(bucket_dir, digest))
+    return removed
+
+
+# ── Restore ────────────────────────────────────────────────────
+def _allowed_target(rel: str) -> bool:
+    """Only known data files may be restored (no absolute paths, no '..')."""
+    rel = rel.replace("\\", "/")
+    if rel.startswith("/") or ".." in rel.split("/"):
+        return False
+    if rel in [os.path.relpath(f, BASE).replace(os.sep, "/") for f in CORE_FILES]:
+        return True
+    parts = rel.split("/")
+    data_dirs = [os.path.relpath(d, BASE).replace(os.sep, "/") for d in DATA_DIRS]
+    return len(parts) == 2 and parts[0] in data_dirs and parts[1].endswith(".json")
+
+
+def _validate_file(rel: str, path: str) -> Optional[str]:
+    """Schema check for a staged file. Returns an error message or None."""
+    name = os.path.basename(rel)
+    try:
+        if name.endswith(".md"):
+            with open(path, "r", encoding="utf-8") as f:
+                f.read()
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return f"{rel}: unreadable ({e})"
+
+    if not isinstance(data, dict):
+        return f"{rel}: expected a JSON object"
+    if name == "stock.json":
+        inventory = data.get("inventory")
+        if not isinstance(inventory, list) or not all(
+            isinstance(i, dict) and "item" in i and isinstance(i.get("quantity"), (int, float)) for i in inventory
+        ):
+            return f"{rel}: 'inventory' must be a list of {{item, quantity}}"
+    elif name == "memory.json":
+        if not isinstance(data.get("episodes"), list):
+            return f"{rel}: 'episodes' must be a list"
+    elif rel.startswith(os.path.basename(REPORTS_DIR) + "/"):
+        if not isinstance(data.get("sales_summary"), dict):
+            return f"{rel}: missing 'sales_summary'"
+    return None
+
+
+def _stage_from_zip(source, staging: str) -> list:
+    """Stream zip members into staging/. Returns a list of errors."""
+    errors = []
+    with zipfile.ZipFile(source, "r") as zf:
+        manifest = {}
+        if "manifest.json" in zf.namelist():
+            manifest = json.loads(zf.read("manifest.json")).get("files", {})
+        for info in zf.infolist():
+            if info.is_dir() or info.filename == "manifest.json":
+                continue
+            rel = info.filename.replace("\\", "/")
+            if rel.startswith("/") or ".." in rel.split("/"):
+                errors.append(f"{rel}: unsafe path")
+                continue
+            if not _allowed_target(rel):
+                continue  # unrelated files in the archive are ignored
+            dest = os.path.join(staging, rel)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            h = hashlib.sha256()
+            with zf.open(info) as src, open(dest, "wb") as dst:
+                for block in iter(lambda: src.read(CHUNK), b""):
+                    h.update(block)
+                    dst.write(block)
+            expected = manifest.get(rel, {}).get("sha256")
+            if expected and expected != h.hexdigest():
+                errors.append(f"{rel}: checksum mismatch")
+    return errors
+
+
+def _stage_from_snapshot(name: str, staging: str) -> list:
+    manifest = read_manifest(name)
+    if not manifest:
+        return [f"{name}: snapshot not found"]
+    errors = []
+    for rel, meta in manifest["files"].items():
+        obj = _object_path(meta["sha256"])
+        if not os.path.exists(obj):
+            errors.append(f"{rel}: object missing from store")
+            continue
+        dest = os.path.join(staging, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with gzip.open(obj, "rb") as src, open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK)
+    return errors
+
+
+def _swap_in(staging: str) -> int:
+    """
+    Move staged data into place with os.replace per file. Data directories are merged:
+    reports / decisions written after the backup are kept. Returns how many were kept.
+    """
+    for live in CORE_FILES:
+        staged = os.path.join(staging, os.path.relpath(live, BASE))
+        if os.path.exists(staged):
+            os.replace(staged, live)
+    kept = 0
+    for live in DATA_DIRS:
+        staged = os.path.join(staging, os.path.relpath(live, BASE))
+        if not os.path.isdir(staged):
+            continue
+        os.makedirs(live, exist_ok=True)
+        restored = set(os.listdir(staged))
+        for name in restored:
+            os.replace(os.path.join(staged, name), os.path.join(live, name))
+        kept += sum(1 for name in os.listdir(live) if name.endswith(".json") and name not in restored)
+    return kept
+
+
+def restore(source=None, snapshot: str = None) -> dict:
+    """
+    Restore from an uploaded zip (file-like or bytes) or a local snapshot name.
+    Everything is staged and validated first; live data is only touched if all checks
+    pass, and a safety snapshot of the current state is taken before the swap.
+    Returns {"ok": bool, "errors": [...], "restored": n, "kept": live data files not in the backup}.
+    """
+    staging = os.path.join(BACKUP_DIR, f"staging_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+    os.makedirs(staging, exist_ok=True)
+    try:
+        if snapshot:
+            errors = _stage_from_snapshot(snapshot, staging)
+        else:
+            if isinstance(source, (bytes, bytearray)):
+                source = io.BytesIO(source)
+            try:
+                errors = _stage_from_zip(source, staging)
+            except zipfile.BadZipFile:
+                return {"ok": False, "errors": ["Not a valid zip archive"], "restored": 0, "kept": 0}
+
+        staged_files = []
+        for root, _, names in os.walk(staging):
+            for name in names:
+                full = os.path.join(root, name)
+                staged_files.append((os.path.relpath(full, staging).replace(os.sep, "/"), full))
+        for rel, full in staged_files:
+            err = _validate_file(rel, full)
+            if err:
+                errors.append(err)
+
+        if not staged_files:
+            errors.append("Backup contains no KafeAI data files")
+        if errors:
+            return {"ok": False, "errors": errors, "restored": 0, "kept": 0}
+
+        if create_snapshot() is None:
+            return {"ok": False, "errors": ["Safety snapshot of the current data failed (see logs)"],
+                    "restored": 0, "kept": 0}
+        kept = _swap_in(staging)
+        log.info(f"Restored {len(staged_files)} files ({kept} newer data files kept)")
+        return {"ok": True, "errors": [], "restored": len(staged_files), "kept": kept}
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
@@ -0,0 +1,195 @@
+"""
+KafeAI Frontend — Chat History Store
+Dashboard conversations persisted per user in cache/chat_history.db, read back a page at a
+time (newest first) so the chat tab only renders a fixed window. An FTS5 index covers every
+message for searching past conversations.
+"""
+import os
+import re
+import time
+import uuid
+import sqlite3
+
+from config import CACHE_DIR
+
+CHAT_DB_PATH = os.path.join(CACHE_DIR, "chat_history.db")
+PAGE_SIZE = 30            # messages per page (the chat tab's initial window)
+TITLE_CHARS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id    TEXT PRIMARY KEY,
+    user_id    TEXT NOT NULL,
+    title      TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chats_user ON chats(user_id, updated_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    role    TEXT NOT NULL,
+    content TEXT NOT NULL,
+    node    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages(chat_id, id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    """Open the chat history store, creating the schema on first use."""
+    path = path or CHAT_DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def new_chat(user_id: str, path: str = None) -> str:
+    chat_id = uuid.uuid4().hex[:12]
+    now = time.time()
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO chats (chat_id, user_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (chat_id, user_id, now, now),
+            )
+    finally:
+        conn.close()
+    return chat_id
+
+
+def latest_chat(user_id: str, path: str = None):
+    """The user's most recently active chat id (None if they have none)."""
+    conn = connect(path)
+    try:
+        row = conn.execute(
+            "SELECT chat_id FROM chats WHERE user_id = ? ORDER BY updated_at DESC LIMIT 1", (user_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row["chat_id"] if row else None
+
+
+def append(chat_id: str, role: str, content: str, node: str = None, path: str = None) -> dict:
+    """Store a message; the first user message becomes the chat's title. Returns the message."""
+    now = time.time()
+    conn = connect(path)
+    try:
+        with conn:
+            msg_id = conn.execute(
+                "INSERT INTO messages (chat_id, ts, role, content, node) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, now, role, content, node),
+            ).lastrowid
+            conn.execute("UPDATE chats SET updated_at = ? WHERE chat_id = ?", (now, chat_id))
+            if role == "user":
+                conn.execute(
+                    "UPDATE chats SET title = ? WHERE chat_id = ? AND title = ''",
+                    (" ".join(content.split())[:TITLE_CHARS], chat_id),
+                )
+    finally:
+        conn.close()
+    return _message({"id": msg_id, "ts": now, "role": role, "content": content, "node": node})
+
+
+def _message(row) -> dict:
+    msg = {"id": row["id"], "ts": row["ts"], "role": row["role"], "content": row["content"]}
+    if row["node"]:
+        msg["node"] = row["node"]
+    return msg
+
+
+def page(chat_id: str, before_id: int = None, limit: int = PAGE_SIZE, path: str = None) -> list:
+    """Up to `limit` messages older than before_id (newest when None), oldest first."""
+    conn = connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT id, ts, role, content, node FROM messages WHERE chat_id = ? AND id < ? "
+            "ORDER BY id DESC LIMIT ?",
+            (chat_id, before_id if before_id is not None else 2 ** 62, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [_message(r) for r in reversed(rows)]
+
+
+def has_older(chat_id: str, before_id: int, path: str = None) -> bool:
+    conn = connect(path)
+    try:
+        return conn.execute(
+            "SELECT 1 FROM messages WHERE chat_id = ? AND id < ? LIMIT 1", (chat_id, before_id)
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+
+def iter_messages(chat_id: str, path: str = None):
+    """Every message of a chat, oldest first (for export)."""
+    conn = connect(path)
+    try:
+        for row in conn.execute(
+            "SELECT id, ts, role, content, node FROM messages WHERE chat_id = ? ORDER BY id", (chat_id,)
+        ):
+            yield _message(row)
+    finally:
+        conn.close()
+
+
+def list_chats(user_id: str, limit: int = 20, path: str = None) -> list:
+    """The user's chats, most recently active first."""
+    conn = connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT c.chat_id, c.title, c.updated_at, COUNT(m.id) AS messages "
+            "FROM chats c LEFT JOIN messages m ON m.chat_id = c.chat_id "
+            "WHERE c.user_id = ? GROUP BY c.chat_id ORDER BY c.updated_at DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
+
+
+def _fts_query(text: str) -> str:
+    """User text -> FTS5 query: every word must match (prefix match on the last one)."""
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(user_id: str, text: str, limit: int = 20, path: str = None) -> list:
+    """Messages of the user's chats matching text, best match first, with a highlighted snippet."""
+    query = _fts_query(text)
+    if not query:
+        return []
+    conn = connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT m.id, m.chat_id, m.ts, m.role, c.title, "
+            "snippet(messages_fts, 0, '**', '**', ' … ', 12) AS snippet "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN chats c ON c.chat_id = m.chat_id "
+            "WHERE messages_fts MATCH ? AND c.user_id = ? ORDER BY bm25(messages_fts) LIMIT ?",
+            (query, user_id, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(r) for r in rows]
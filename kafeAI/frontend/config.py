@@ -4,6 +4,7 @@ Centralized config for paths, colors, and app settings.
 Color system follows kafeAI Brand Guidelines v2.0 (Deep Green)
 """
 import os
+import sys
 
 # ── Project Root (kafeAI v2/) ──────────────────────────────────
 def get_base_path() -> str:
@@ -14,8 +15,15 @@ def get_backend_path() -> str:
     """Returns the backend directory: kafeAI/"""
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+def get_data_path() -> str:
+    """Data root of the site this dashboard serves (KAFEAI_TENANT, see tenants.json)"""
+    sys.path.insert(0, get_backend_path())
+    import tenants
+    return tenants.get_tenant()["data_root"]
+
 # ── File Paths ─────────────────────────────────────────────────
-BASE = get_base_path()
+# One dashboard per site: start with KAFEAI_TENANT=<site id> to serve another site
+BASE = get_data_path()
 STOCK_PATH = os.path.join(BASE, "stock.json")
 MENU_PATH = os.path.join(BASE, "Menu.md")
 MEMORY_PATH = os.path.join(BASE, "memory.json")
@@ -23,7 +31,7 @@ REPORTS_DIR = os.path.join(BASE, "daily_reports")
 DECISION_HISTORY_DIR = os.path.join(BASE, "decision_history")
 CACHE_DIR = os.path.join(BASE, "cache")
 ENV_PATH = os.path.join(get_backend_path(), ".env")
-LOGO_PATH = os.path.join(BASE, "kafeAI v2 logo.png")
+LOGO_PATH = os.path.join(get_base_path(), "kafeAI v2 logo.png")
 
 # ── Color Palette (Brand Guidelines v2.0 — Deep Green) ────────
 # Inspiration: dark terminal aesthetic meets botanical intelligence
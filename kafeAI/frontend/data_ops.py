@@ -4,8 +4,6 @@ All local file I/O abstracted here for future cloud DB swap.
 """
 import os
 import json
-import shutil
-import zipfile
 import datetime
 from typing import Optional
 from dotenv import dotenv_values
@@ -14,6 +12,11 @@ from config import (
     STOCK_PATH, MENU_PATH, MEMORY_PATH, REPORTS_DIR,
     DECISION_HISTORY_DIR, CACHE_DIR, ENV_PATH, BASE
 )
+import backup_store
+import menu_model
+import sales_cube
+
+SALES_CUBE_PATH = os.path.join(CACHE_DIR, "sales_cube.npz")
 
 
 # ── Stock Operations ───────────────────────────────────────────
@@ -47,6 +50,28 @@ def read_menu() -> str:
         return ""
 
 
+def read_menu_model() -> menu_model.MenuModel:
+    """Parsed Menu.md (sections, items, prices, storage targets), cached by file mtime"""
+    return menu_model.get_menu(MENU_PATH)
+
+
+def stock_vs_targets() -> list:
+    """Current stock joined with the Menu.md Storage targets"""
+    menu = read_menu_model()
+    rows = []
+    for item in read_stock().get("inventory", []):
+        target = menu.target(item["item"])
+        qty = item.get("quantity", 0)
+        rows.append({
+            "item": item["item"],
+            "quantity": qty,
+            "unit": item.get("unit", ""),
+            "target": target[0] if target else None,
+            "ratio": qty / target[0] if target and target[0] else None,
+        })
+    return rows
+
+
 def write_menu(content: str) -> bool:
     """Save Menu.md content"""
     try:
@@ -104,9 +129,23 @@ def save_report(filename: str, data: bytes) -> bool:
         path = os.path.join(REPORTS_DIR, filename)
         with open(path, "wb") as f:
             f.write(data)
-        return True
     except Exception:
         return False
+    _refresh_sales_cube()
+    return True
+
+
+def _refresh_sales_cube():
+    """Fold a just-saved report into the sales cube (only new or changed reports are read)"""
+    try:
+        sales_cube.refresh(REPORTS_DIR, SALES_CUBE_PATH)
+    except Exception:
+        pass  # The cube catches up on its next read
+
+
+def get_sales_cube() -> sales_cube.SalesCube:
+    """Precomputed weekday / ISO week / month / category aggregates of the daily reports"""
+    return sales_cube.get_cube(REPORTS_DIR, SALES_CUBE_PATH)
 
 
 def delete_report(filename: str) -> bool:
@@ -231,49 +270,35 @@ def validate_project_files() -> dict:
 
 
 # ── Backup & Restore ───────────────────────────────────────────
-def create_backup() -> Optional[str]:
-    """Create a zip backup of all core project data. Returns zip path."""
-    try:
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_path = os.path.join(BASE, f"kafeai_backup_{ts}.zip")
-
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            # Core files
-            for f in [STOCK_PATH, MENU_PATH, MEMORY_PATH]:
-                if os.path.exists(f):
-                    zf.write(f, os.path.relpath(f, BASE))
-
-            # Daily reports
-            if os.path.isdir(REPORTS_DIR):
-                for rf in os.listdir(REPORTS_DIR):
-                    full = os.path.join(REPORTS_DIR, rf)
-                    zf.write(full, os.path.relpath(full, BASE))
-
-            # Decision history
-            if os.path.isdir(DECISION_HISTORY_DIR):
-                for df in os.listdir(DECISION_HISTORY_DIR):
-                    full = os.path.join(DECISION_HISTORY_DIR, df)
-                    zf.write(full, os.path.relpath(full, BASE))
-
-        return zip_path
-    except Exception:
-        return None
+def create_backup() -> Optional[dict]:
+    """Take an incremental snapshot of all core project data. Returns its manifest."""
+    return backup_store.create_snapshot()
+
+
+def export_backup(snapshot_name: str) -> Optional[str]:
+    """Build a downloadable zip for a snapshot. Returns zip path."""
+    return backup_store.export_snapshot_zip(snapshot_name)
+
 
+def list_backups() -> list:
+    """Snapshot manifests, newest first"""
+    return [backup_store.read_manifest(name) for name in backup_store.list_snapshots()]
 
-def restore_backup(zip_data: bytes) -> bool:
-    """Restore from a zip backup"""
+
+def restore_backup(source) -> dict:
+    """Restore from an uploaded zip (file-like or bytes) via staging + validation"""
     try:
-        tmp_zip = os.path.join(BASE, "_restore_tmp.zip")
-        with open(tmp_zip, "wb") as f:
-            f.write(zip_data)
+        return backup_store.restore(source=source)
+    except Exception as e:
+        return {"ok": False, "errors": [str(e)], "restored": 0, "kept": 0}
 
-        with zipfile.ZipFile(tmp_zip, "r") as zf:
-            zf.extractall(BASE)
 
-        os.remove(tmp_zip)
-        return True
-    except Exception:
-        return False
+def restore_snapshot(snapshot_name: str) -> dict:
+    """Restore a local snapshot via staging + validation"""
+    try:
+        return backup_store.restore(snapshot=snapshot_name)
+    except Exception as e:
+        return {"ok": False, "errors": [str(e)], "restored": 0, "kept": 0}
 
 
 # ── File Info Helpers ──────────────────────────────────────────
@@ -0,0 +1,190 @@
+"""
+KafeAI Frontend — Background Resource Sampler
+A daemon thread samples CPU, memory, disk, network and the KafeAI worker processes
+into fixed-size array-backed ring buffers, so the Monitor tab never blocks on psutil.
+"""
+import time
+import threading
+from array import array
+
+from config import BASE
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+SAMPLE_INTERVAL = 1.0      # seconds between samples
+CAPACITY = 300             # samples kept (5 minutes at 1s)
+PROCESS_RESCAN_EVERY = 10  # re-discover worker processes every N samples
+
+# Worker roles, matched against the process command line
+PROCESS_ROLES = {
+    "streamlit": "Streamlit",
+    "whatsapp_twilio.py": "Twilio",
+    "whatsapp_bot.py": "WhatsApp",
+    "agent_service.py": "Agents",
+}
+
+SERIES = ["ts", "cpu", "mem", "rss_mb", "threads", "disk", "net_sent_kbs", "net_recv_kbs"]
+
+
+class RingBuffer:
+    """Fixed-capacity float ring buffer backed by array('d')."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = array("d", [0.0]) * capacity
+        self.index = 0
+        self.count = 0
+
+    def append(self, value: float):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def values(self) -> list:
+        """Chronological copy of the stored samples."""
+        if self.count < self.capacity:
+            return self.data[:self.count].tolist()
+        return (self.data[self.index:] + self.data[:self.index]).tolist()
+
+    def last(self, default: float = 0.0) -> float:
+        if not self.count:
+            return default
+        return self.data[(self.index - 1) % self.capacity]
+
+
+class ResourceSampler(threading.Thread):
+    """Daemon thread filling ring buffers; readers call snapshot() without blocking."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, capacity: int = CAPACITY):
+        super().__init__(name="kafeai-resource-sampler", daemon=True)
+        self.interval = interval
+        self.capacity = capacity
+        self.series = {name: RingBuffer(capacity) for name in SERIES}
+        self.processes = {}   # pid -> {"role", "proc", "rss": RingBuffer, "cpu": RingBuffer}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._last_net = None
+        self._samples = 0
+
+    # ── Sampling ──────────────────────────────────────────────
+    def _discover_processes(self):
+        """Find KafeAI worker processes by command line."""
+        found = {}
+        for proc in psutil.process_iter(["pid", "cmdline"]):
+            try:
+                cmdline = " ".join(proc.info.get("cmdline") or [])
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            for marker, role in PROCESS_ROLES.items():
+                if marker in cmdline:
+                    found[proc.info["pid"]] = (role, proc)
+                    break
+
+        with self._lock:
+            for pid in list(self.processes):
+                if pid not in found:
+                    del self.processes[pid]
+            for pid, (role, proc) in found.items():
+                if pid not in self.processes:
+                    proc.cpu_percent(None)  # prime the counter; first reading is always 0
+                    self.processes[pid] = {
+                        "role": role,
+                        "proc": proc,
+                        "rss": RingBuffer(self.capacity),
+                        "cpu": RingBuffer(self.capacity),
+                        "threads": 0,
+                    }
+
+    def _sample(self):
+        now = time.time()
+        cpu = psutil.cpu_percent(None)
+        mem = psutil.virtual_memory().percent
+        try:
+            disk = psutil.disk_usage(BASE).percent
+        except Exception:
+            disk = 0.0
+
+        net = psutil.net_io_counters()
+        sent_kbs = recv_kbs = 0.0
+        if self._last_net:
+            last_ts, last_sent, last_recv = self._last_net
+            elapsed = max(now - last_ts, 1e-6)
+            sent_kbs = (net.bytes_sent - last_sent) / 1024 / elapsed
+            recv_kbs = (net.bytes_recv - last_recv) / 1024 / elapsed
+        self._last_net = (now, net.bytes_sent, net.bytes_recv)
+
+        if self._samples % PROCESS_RESCAN_EVERY == 0:
+            self._discover_processes()
+
+        total_rss = 0.0
+        total_threads = 0
+        with self._lock:
+            for pid, entry in list(self.processes.items()):
+                proc = entry["proc"]
+                try:
+                    with proc.oneshot():
+                        rss = proc.memory_info().rss / (1024 ** 2)
+                        pcpu = proc.cpu_percent(None)
+                        threads = proc.num_threads()
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    del self.processes[pid]
+                    continue
+                entry["rss"].append(rss)
+                entry["cpu"].append(pcpu)
+                entry["threads"] = threads
+                total_rss += rss
+                total_threads += threads
+
+            for name, value in zip(SERIES, (now, cpu, mem, total_rss, total_threads, disk, sent_kbs, recv_kbs)):
+                self.series[name].append(value)
+        self._samples += 1
+
+    def run(self):
+        psutil.cpu_percent(None)
+        while not self._stop_event.is_set():
+            try:
+                self._sample()
+            except Exception:
+                pass
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    # ── Reading ───────────────────────────────────────────────
+    def snapshot(self) -> dict:
+        """Chronological copies of all series plus a per-process breakdown."""
+        with self._lock:
+            data = {name: buf.values() for name, buf in self.series.items()}
+            data["processes"] = [
+                {
+                    "pid": pid,
+                    "role": entry["role"],
+                    "rss_mb": entry["rss"].last(),
+                    "cpu": entry["cpu"].last(),
+                    "threads": entry["threads"],
+                    "rss_history": entry["rss"].values(),
+                }
+                for pid, entry in sorted(self.processes.items(), key=lambda kv: kv[1]["role"])
+            ]
+        return data
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Process-wide sampler, started on first use. None if psutil is missing."""
+    global _sampler
+    if not HAS_PSUTIL:
+        return None
+    with _sampler_lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = ResourceSampler()
+            _sampler.start()
+        return _sampler
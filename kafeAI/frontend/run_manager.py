@@ -0,0 +1,125 @@
+"""
+KafeAI Frontend — Background Graph Runs
+Each browser session gets at most one LangGraph run at a time, executed on a worker
+thread. The tabs poll it from a fragment and render node outputs as they arrive, so the
+Streamlit script never blocks, tab switches don't interrupt a run, and a run can be cancelled.
+"""
+import time
+import uuid
+import threading
+
+from structured_log import get_logger, run_context
+import tenants
+
+log = get_logger("Streamlit")
+
+RUNNING, WAITING_HITL, DONE, CANCELLED, ERROR = "running", "waiting_hitl", "done", "cancelled", "error"
+FINISHED_TTL = 3600     # seconds a finished run stays registered for late polls
+
+
+class GraphRun(threading.Thread):
+    """
+    One app.stream() call (inputs=None resumes from the checkpoint). Node updates are
+    collected as (node, content) events; readers page through them with events_since().
+    Cancellation is checked between graph steps: the node in flight finishes within its
+    time budget (resilience.NODE_BUDGETS) and no further nodes start.
+    """
+
+    def __init__(self, key: str, phase: str, app, config: dict, inputs: dict = None,
+                 run_id: str = None, tenant_id: str = None, on_finish=None):
+        super().__init__(daemon=True, name=f"graph-run-{key}")
+        self.key = key
+        self.phase = phase
+        self.app = app
+        self.config = config
+        self.inputs = inputs
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.tenant_id = tenant_id or tenants.current_tenant_id()
+        self.on_finish = on_finish
+        self.status = RUNNING
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._events = []
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    @property
+    def thread_id(self) -> str:
+        return self.config["configurable"]["thread_id"]
+
+    @property
+    def finished(self) -> bool:
+        return self.status != RUNNING
+
+    def cancel(self):
+        self._cancel.set()
+
+    def events_since(self, cursor: int = 0):
+        """(new events, next cursor)."""
+        with self._lock:
+            return self._events[cursor:], len(self._events)
+
+    def events(self) -> list:
+        return self.events_since(0)[0]
+
+    def run(self):
+        try:
+            with tenants.tenant_scope(self.tenant_id), run_context(thread_id=self.thread_id, run_id=self.run_id):
+                for output in self.app.stream(self.inputs, config=self.config):
+                    with self._lock:
+                        self._events.extend(output.items())
+                    if self._cancel.is_set():
+                        log.info(f"Run {self.run_id} cancelled after {len(self._events)} node(s)")
+                        break
+            if self._cancel.is_set():
+                self.status = CANCELLED
+            else:
+                self.status = WAITING_HITL if self.app.get_state(self.config).next else DONE
+        except Exception as e:
+            log.error(f"Run {self.run_id} failed: {e}")
+            self.error = str(e)
+            self.status = ERROR
+        self.finished_at = time.time()
+        if self.on_finish:
+            try:
+                self.on_finish(self)
+            except Exception as e:
+                log.error(f"Run {self.run_id} finish handler failed: {e}")
+
+
+_runs = {}              # session key -> latest GraphRun
+_runs_lock = threading.Lock()
+
+
+def start(key: str, phase: str, app, config: dict, inputs: dict = None, **kwargs) -> GraphRun:
+    """Start a run for a session. Raises RuntimeError if that session already has one in flight."""
+    with _runs_lock:
+        _prune()
+        current = _runs.get(key)
+        if current and not current.finished:
+            raise RuntimeError("A workflow is already running for this session")
+        run = GraphRun(key, phase, app, config, inputs, **kwargs)
+        _runs[key] = run
+    run.start()
+    return run
+
+
+def get(key: str) -> GraphRun:
+    with _runs_lock:
+        return _runs.get(key)
+
+
+def cancel(key: str) -> bool:
+    run = get(key)
+    if not run or run.finished:
+        return False
+    run.cancel()
+    return True
+
+
+def _prune():
+    """Forget finished runs nobody polled for FINISHED_TTL (caller holds _runs_lock)."""
+    cutoff = time.time() - FINISHED_TTL
+    for key in [k for k, r in _runs.items() if r.finished and r.finished_at < cutoff]:
+        del _runs[key]
@@ -0,0 +1,146 @@
+"""
+KafeAI Frontend — Sales Frames for Charts
+daily_reports/ flattened once into DataFrames (cached until the directory changes), with
+vectorized weekly/monthly rollups and Largest-Triangle-Three-Buckets downsampling, so the
+analytics charts send a bounded number of points however long the history is.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import report_index
+
+MAX_POINTS = 400          # points per chart trace
+MAX_CATEGORIES = 8        # stacked-area series; the rest are summed into "Other"
+FREQS = {"Daily": "D", "Weekly": "W", "Monthly": "M"}
+COLUMNS = ["date", "gross", "net", "vat", "transactions", "avg_purchase"]
+
+_cache = {}               # reports_dir -> (directory mtime, daily frame, category frame)
+_cache_lock = threading.Lock()
+
+
+def _build(reports_dir: str):
+    rows, category_rows = [], []
+    for date, report in report_index.iter_reports(reports_dir=reports_dir):
+        s = report.get("sales_summary", {})
+        rows.append((
+            date,
+            s.get("total_gross", 0) or 0,
+            s.get("total_net", 0) or 0,
+            s.get("total_vat", 0) or 0,
+            report.get("payment_methods", {}).get("total_transactions", 0) or 0,
+            report.get("performance_metrics", {}).get("average_purchase_per_customer", 0) or 0,
+        ))
+        for c in report.get("sales_by_category", []):
+            category_rows.append((date, c.get("category", "?"), c.get("amount", 0) or 0))
+
+    daily = pd.DataFrame(rows, columns=COLUMNS)
+    daily["date"] = pd.to_datetime(daily["date"])
+
+    categories = pd.DataFrame(category_rows, columns=["date", "category", "amount"])
+    categories["date"] = pd.to_datetime(categories["date"])
+    categories = categories.pivot_table(index="date", columns="category", values="amount",
+                                        aggfunc="sum", fill_value=0)
+    return daily, categories
+
+
+def load_frames(reports_dir: str = None):
+    """
+    (daily, categories) for a site's daily_reports/.
+    daily: one row per report with COLUMNS. categories: date index x category columns (SEK).
+    Rebuilt only when the directory changes (same rule as report_index).
+    """
+    reports_dir = reports_dir or report_index.default_reports_dir()
+    try:
+        mtime = os.stat(reports_dir).st_mtime_ns
+    except FileNotFoundError:
+        return pd.DataFrame(columns=COLUMNS).astype({"date": "datetime64[ns]"}), pd.DataFrame()
+
+    with _cache_lock:
+        cached = _cache.get(reports_dir)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        daily, categories = _build(reports_dir)
+        _cache[reports_dir] = (mtime, daily, categories)
+        return daily, categories
+
+
+def in_range(frame: pd.DataFrame, start, end, column: str = None) -> pd.DataFrame:
+    """Rows with start <= date <= end (the date column, or the index when column is None)."""
+    dates = frame.index if column is None else frame[column]
+    return frame[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+
+
+def rollup(daily: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Daily rows summed per period ("D", "W" or "M"); date is the period start."""
+    if freq == "D" or daily.empty:
+        return daily
+    grouped = daily.groupby(daily["date"].dt.to_period(freq))
+    agg = grouped[["gross", "net", "vat", "transactions"]].sum()
+    agg["avg_purchase"] = (agg["gross"] / agg["transactions"].where(agg["transactions"] != 0)).fillna(0.0)
+    agg["date"] = agg.index.start_time
+    return agg.reset_index(drop=True)[COLUMNS]
+
+
+def category_mix(categories: pd.DataFrame, freq: str, max_points: int = MAX_POINTS,
+                 max_categories: int = MAX_CATEGORIES):
+    """
+    Category amounts per period for a stacked area, and the frequency actually used.
+    A finer frequency is coarsened (D -> W -> M) until there are at most max_points periods;
+    only the max_categories largest categories are kept, the rest become "Other".
+    """
+    if categories.empty:
+        return categories, freq
+    order = list(FREQS.values())
+    for f in order[order.index(freq):]:
+        mix = categories if f == "D" else categories.groupby(categories.index.to_period(f)).sum()
+        if len(mix) <= max_points:
+            break
+    freq = f
+    if freq != "D":
+        mix.index = mix.index.start_time
+
+    totals = mix.sum().sort_values(ascending=False)
+    if len(totals) > max_categories:
+        top = list(totals.index[:max_categories - 1])
+        mix = pd.concat([mix[top], mix.drop(columns=top).sum(axis=1).rename("Other")], axis=1)
+    else:
+        mix = mix[list(totals.index)]
+    return mix, freq
+
+
+def lttb(x, y, threshold: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+    Keeps the first and last points and, per bucket, the point forming the largest
+    triangle with the previously kept point and the next bucket's average.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # threshold - 2 buckets over the inner points [1, n - 1)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        kept[i + 1] = a
+    return kept
+
+
+def downsample(frame: pd.DataFrame, column: str, max_points: int = MAX_POINTS) -> pd.DataFrame:
+    """At most max_points rows of a date-sorted frame, chosen by LTTB on `column`."""
+    if len(frame) <= max_points:
+        return frame
+    x = frame["date"].to_numpy(dtype="datetime64[ns]").astype("int64")
+    return frame.iloc[lttb(x, frame[column].to_numpy(), max_points)]
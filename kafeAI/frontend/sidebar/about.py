@@ -27,19 +27,46 @@ def render():
 
     # ── Data Backup / Restore ──────────────────────────
     with st.expander("💾 Data Backup", expanded=False):
-        if st.button("📦 Create Backup (ZIP)", use_container_width=True, key="create_backup"):
-            zip_path = data_ops.create_backup()
-            if zip_path:
-                with open(zip_path, "rb") as f:
-                    st.download_button(
-                        "📥 Download Backup",
-                        data=f.read(),
-                        file_name=os.path.basename(zip_path),
-                        mime="application/zip",
-                    )
-                st.success(f"Backup created: {os.path.basename(zip_path)}")
+        notice = st.session_state.pop("restore_notice", None)
+        if notice:
+            st.success(notice)
+        if st.button("📦 Create Backup", use_container_width=True, key="create_backup"):
+            manifest = data_ops.create_backup()
+            if manifest:
+                stats = manifest["stats"]
+                st.success(
+                    f"Snapshot saved: {stats['files']} files, "
+                    f"{stats['new_objects']} changed ({stats['new_bytes'] / 1024:.1f} KB new)"
+                )
             else:
-                st.error("Backup failed.")
+                st.error("Backup failed (details in the Monitor tab logs).")
+
+        backups = data_ops.list_backups()
+        if backups:
+            labels = {b["name"]: f"{b['created']} — {b['stats']['files']} files" for b in backups}
+            selected = st.selectbox(
+                "Snapshots",
+                list(labels.keys()),
+                format_func=lambda n: labels[n],
+                key="backup_select",
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("📥 Export ZIP", use_container_width=True, key="export_backup"):
+                    zip_path = data_ops.export_backup(selected)
+                    if zip_path:
+                        with open(zip_path, "rb") as f:
+                            st.download_button(
+                                "📥 Download Backup",
+                                data=f,
+                                file_name=os.path.basename(zip_path),
+                                mime="application/zip",
+                            )
+                    else:
+                        st.error("Export failed (details in the Monitor tab logs).")
+            with col2:
+                if st.button("⏪ Restore", use_container_width=True, key="restore_snapshot"):
+                    _show_restore_result(data_ops.restore_snapshot(selected))
 
         st.divider()
         uploaded_zip = st.file_uploader(
@@ -48,12 +75,10 @@ def render():
             key="restore_zip",
         )
         if uploaded_zip:
+            st.caption("Files in the backup replace the current ones; newer reports and decisions are kept. "
+                       "A snapshot of the current data is taken first.")
             if st.button("⚠️ Restore (Overwrites Current Data)", use_container_width=True, key="do_restore"):
-                if data_ops.restore_backup(uploaded_zip.read()):
-                    st.success("✅ Data restored successfully!")
-                    st.rerun()
-                else:
-                    st.error("Restore failed.")
+                _show_restore_result(data_ops.restore_backup(uploaded_zip))
 
     # ── Issue Template ─────────────────────────────────
     with st.expander("🐛 Report Issue", expanded=False):
@@ -79,6 +104,21 @@ def render():
         st.link_button("View Releases", f"{GITHUB_REPO}/releases", use_container_width=True)
 
 
+def _show_restore_result(result: dict):
+    """Report a staged restore: success reruns the app, failures list validation errors"""
+    if result["ok"]:
+        # 显示在重绘之后 (st.rerun 会清掉本次输出)
+        notice = f"✅ Restored {result['restored']} files."
+        if result.get("kept"):
+            notice += f" {result['kept']} newer reports / decisions not in the backup were kept."
+        st.session_state.restore_notice = notice + " The previous state was saved as a snapshot."
+        st.rerun()
+    else:
+        st.error("Restore aborted — current data was not changed.")
+        for err in result["errors"][:10]:
+            st.caption(f"⚠️ {err}")
+
+
 def _generate_issue_template(description: str) -> str:
     """Generate a GitHub issue template with system info"""
     import platform
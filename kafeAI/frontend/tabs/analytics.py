@@ -5,8 +5,13 @@ Sales dashboards, inventory status, trend charts from daily_reports.
 import streamlit as st
 import json
 import io
+import datetime
 from config import COLORS
 import data_ops
+import report_index
+import sales_cube
+import sales_frame
+import tenants
 
 # Lazy import plotly to avoid import errors if not installed
 try:
@@ -27,18 +32,14 @@ def render():
         st.warning("No daily reports found. Upload sales data in the File Manager.")
         return
 
-    # ── Load All Report Data ───────────────────────────
-    all_data = []
-    for rf in reports:
-        report = data_ops.read_report(rf)
-        if report:
-            date_str = rf.replace(".json", "").replace("_", "-")
-            report["_date"] = date_str
-            report["_filename"] = rf
-            all_data.append(report)
+    # ── Report Data ────────────────────────────────────
+    # Charts read the cached frames (rebuilt only when daily_reports/ changes); only the
+    # latest report is loaded in full
+    daily, categories = sales_frame.load_frames()
+    latest = data_ops.read_report(reports[0]) or {}
+    latest["_date"] = reports[0].replace(".json", "").replace("_", "-")
 
     # ── KPI Cards (Latest Report) ──────────────────────
-    latest = all_data[0] if all_data else {}
     sales = latest.get("sales_summary", {})
     payment = latest.get("payment_methods", {})
     perf = latest.get("performance_metrics", {})
@@ -57,55 +58,93 @@ def render():
 
     st.divider()
 
+    start, end, freq = _render_range_controls(daily)
+
     # ── Sales Trend Chart ──────────────────────────────
-    tab_trend, tab_category, tab_inventory, tab_export = st.tabs([
-        "📈 Sales Trend", "📊 Category Breakdown", "📦 Inventory Status", "📥 Export Data"
-    ])
+    labels = ["📈 Sales Trend", "📊 Category Breakdown", "📦 Inventory Status", "💸 Costs & Margins", "📥 Export Data"]
+    site_ids = tenants.tenant_ids()
+    if len(site_ids) > 1:
+        labels.append("🏢 Sites")
+    tab_trend, tab_category, tab_inventory, tab_costs, tab_export, *tab_sites = st.tabs(labels)
 
     with tab_trend:
-        _render_sales_trend(all_data)
+        _render_sales_trend(daily, start, end, freq)
+        _render_weekday_pattern(data_ops.get_sales_cube())
 
     with tab_category:
-        _render_category_breakdown(all_data)
+        _render_category_breakdown(latest)
+        _render_category_mix(categories, start, end, freq)
 
     with tab_inventory:
         _render_inventory_status()
 
+    with tab_costs:
+        _render_costs_margins()
+
     with tab_export:
-        _render_export(all_data)
+        _render_export(daily)
+
+    if tab_sites:
+        with tab_sites[0]:
+            _render_sites(site_ids)
+
+
+def _render_range_controls(daily):
+    """Date range + granularity shared by the trend and category mix charts"""
+    if daily.empty:
+        today = datetime.date.today()
+        return today, today, "D"
+    first, last = daily["date"].min().date(), daily["date"].max().date()
+    default_start = max(first, last - datetime.timedelta(days=365))
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        picked = st.date_input("Date range", value=(default_start, last), min_value=first, max_value=last,
+                               key="analytics_range")
+    with col2:
+        granularity = st.radio("Granularity", list(sales_frame.FREQS), horizontal=True, key="analytics_granularity")
+
+    # While the user is still picking, date_input returns only the start date
+    picked = picked if isinstance(picked, (tuple, list)) else (picked,)
+    start = picked[0] if picked else default_start
+    end = picked[1] if len(picked) > 1 else last
+    return start, end, sales_frame.FREQS[granularity]
 
 
-def _render_sales_trend(all_data: list):
-    """Line chart of gross/net sales over time"""
+def _render_sales_trend(daily, start, end, freq: str):
+    """Line chart of gross/net sales over the selected range (at most MAX_POINTS points per trace)"""
+    frame = sales_frame.rollup(sales_frame.in_range(daily, start, end, "date"), freq)
+    if frame.empty:
+        st.caption("No reports in the selected range.")
+        return
+    points = sales_frame.downsample(frame, "gross")
+    if len(points) < len(frame):
+        st.caption(f"Showing {len(points)} of {len(frame)} points (LTTB downsampling). "
+                   "Pick a shorter range or a coarser granularity for every point.")
+
     if not HAS_PLOTLY:
         st.warning("Install `plotly` for interactive charts: `pip install plotly`")
-        _render_sales_trend_fallback(all_data)
+        _render_sales_trend_fallback(points)
         return
 
-    dates = []
-    gross = []
-    net = []
-
-    for d in reversed(all_data):  # Chronological order
-        dates.append(d["_date"])
-        s = d.get("sales_summary", {})
-        gross.append(s.get("total_gross", 0))
-        net.append(s.get("total_net", 0))
+    dates = points["date"].dt.strftime("%Y-%m-%d")
+    # Markers only while they are still readable
+    mode = "lines+markers" if len(points) <= 60 else "lines"
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=dates, y=gross,
+        x=dates, y=points["gross"],
         name="Gross Sales",
-        mode="lines+markers",
+        mode=mode,
         line=dict(color=COLORS["smart_amber"], width=3),
         marker=dict(size=8),
         fill="tozeroy",
         fillcolor="rgba(180, 230, 142, 0.08)",
     ))
     fig.add_trace(go.Scatter(
-        x=dates, y=net,
+        x=dates, y=points["net"],
         name="Net Sales",
-        mode="lines+markers",
+        mode=mode,
         line=dict(color=COLORS["paper_cream"], width=2, dash="dot"),
         marker=dict(size=6),
     ))
@@ -124,21 +163,111 @@ def _render_sales_trend(all_data: list):
     st.plotly_chart(fig, use_container_width=True)
 
 
-def _render_sales_trend_fallback(all_data: list):
+def _render_weekday_pattern(cube, months: int = 6):
+    """Average gross per weekday x month and monthly mix ratios, read from the precomputed sales cube"""
+    month_keys = cube.levels["month"]["keys"][-months:]
+    if not len(month_keys):
+        return
+
+    st.markdown("#### Weekday Pattern")
+    labels = [sales_cube.period_label("month", m) for m in month_keys]
+    grid = []
+    for wd in range(7):
+        cells = [cube.row("weekday_month", m * 10 + wd) for m in month_keys]
+        grid.append([round(c["avg_gross"]) if c else None for c in cells])
+
+    if HAS_PLOTLY:
+        fig = go.Figure(go.Heatmap(
+            z=grid, x=labels, y=list(sales_cube.WEEKDAYS),
+            colorscale="Greens", colorbar=dict(title="SEK/day"),
+            hovertemplate="%{y} %{x}: %{z:,.0f} SEK/day<extra></extra>",
+        ))
+        fig.update_layout(
+            title="AVG GROSS BY WEEKDAY",
+            template="plotly_dark",
+            height=340,
+            font=dict(family="Inter", color=COLORS["text_primary"]),
+            paper_bgcolor="rgba(0,0,0,0)",
+            plot_bgcolor="rgba(10,37,25,0.6)",
+            yaxis=dict(autorange="reversed"),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.dataframe({"Weekday": list(sales_cube.WEEKDAYS),
+                      **{label: [row[i] for row in grid] for i, label in enumerate(labels)}},
+                     use_container_width=True, hide_index=True)
+
+    table = cube.table("month")
+    recent = slice(len(table["keys"]) - len(month_keys), None)
+    st.dataframe({
+        "Month": labels,
+        "Days": table["days"][recent],
+        "Gross (SEK)": table["gross"][recent].round(),
+        "Avg / Day (SEK)": table["avg_gross"][recent].round(),
+        "Hot Drinks %": (table["hot_drink_ratio"][recent] * 100).round(1),
+        "Bakery Attach %": (table["bakery_attach_rate"][recent] * 100).round(1),
+    }, use_container_width=True, hide_index=True)
+    st.caption("Bakery attach = bakery items per transaction (reports without item counts show blank).")
+
+
+def _render_sites(site_ids: list, days: int = 30):
+    """Consolidated view across all sites: last-N-days KPIs per site and daily gross per site"""
+    st.markdown(f"#### 🏢 All Sites — last {days} days")
+    start = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+
+    rows, series = [], {}
+    for site_id in site_ids:
+        site = tenants.get_tenant(site_id)
+        reports_dir = tenants.data_path("daily_reports", tenant_id=site_id)
+        gross_total, tx_total, daily = 0, 0, {}
+        for date, report in report_index.iter_reports(start=start, reports_dir=reports_dir):
+            gross = report.get("sales_summary", {}).get("total_gross", 0) or 0
+            gross_total += gross
+            tx_total += report.get("payment_methods", {}).get("total_transactions", 0) or 0
+            daily[date] = gross
+        series[site["name"]] = daily
+        rows.append({
+            "Site": site["name"],
+            "City": site["city"],
+            "Days": len(daily),
+            "Gross (SEK)": round(gross_total),
+            "Avg / Day (SEK)": round(gross_total / len(daily)) if daily else 0,
+            "Transactions": tx_total,
+        })
+
+    cols = st.columns(3)
+    cols[0].metric("🏢 Sites", len(site_ids))
+    cols[1].metric("💰 Gross Sales", f"{sum(r['Gross (SEK)'] for r in rows):,.0f} SEK")
+    cols[2].metric("🧾 Transactions", sum(r["Transactions"] for r in rows))
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+    if HAS_PLOTLY:
+        fig = go.Figure()
+        for name, daily in series.items():
+            dates = sorted(daily)
+            fig.add_trace(go.Scatter(x=dates, y=[daily[d] for d in dates], name=name, mode="lines+markers"))
+        fig.update_layout(
+            title="GROSS SALES BY SITE",
+            xaxis_title="Date",
+            yaxis_title="SEK",
+            template="plotly_dark",
+            height=400,
+            font=dict(family="Inter", color=COLORS["text_primary"]),
+            paper_bgcolor="rgba(0,0,0,0)",
+            plot_bgcolor="rgba(10,37,25,0.6)",
+            legend=dict(orientation="h", yanchor="bottom", y=1.02),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def _render_sales_trend_fallback(points):
     """Simple Streamlit bar chart fallback without Plotly"""
-    import pandas as pd
-    dates = []
-    gross = []
-    for d in reversed(all_data):
-        dates.append(d["_date"])
-        gross.append(d.get("sales_summary", {}).get("total_gross", 0))
-    df = pd.DataFrame({"Date": dates, "Gross Sales (SEK)": gross})
-    st.bar_chart(df.set_index("Date"))
+    df = points.assign(Date=points["date"].dt.strftime("%Y-%m-%d")).rename(columns={"gross": "Gross Sales (SEK)"})
+    st.bar_chart(df.set_index("Date")[["Gross Sales (SEK)"]])
 
 
-def _render_category_breakdown(all_data: list):
+def _render_category_breakdown(latest: dict):
     """Bar chart of sales by category from latest report"""
-    latest = all_data[0] if all_data else {}
     categories = latest.get("sales_by_category", [])
 
     if not categories:
@@ -186,40 +315,82 @@ def _render_category_breakdown(all_data: list):
             st.markdown(f"**{c['category']}**: {c['amount']:,.0f} SEK ({c['count']} items)")
 
 
+def _render_category_mix(categories, start, end, freq: str):
+    """Stacked area of category sales over the selected range"""
+    mix, used = sales_frame.category_mix(sales_frame.in_range(categories, start, end), freq)
+    if mix.empty:
+        return
+
+    st.markdown("#### Category Mix Over Time")
+    if used != freq:
+        name = {v: k for k, v in sales_frame.FREQS.items()}[used]
+        st.caption(f"Shown {name.lower()} to keep the chart under {sales_frame.MAX_POINTS} points per category.")
+    share = st.radio("Show", ["Share %", "SEK"], horizontal=True, key="category_mix_mode") == "Share %"
+
+    if not HAS_PLOTLY:
+        st.area_chart(mix)
+        return
+
+    dates = mix.index.strftime("%Y-%m-%d")
+    fig = go.Figure()
+    for category in mix.columns:
+        fig.add_trace(go.Scatter(
+            x=dates, y=mix[category],
+            name=str(category),
+            mode="lines",
+            line=dict(width=0.5),
+            stackgroup="mix",
+            groupnorm="percent" if share else "",
+        ))
+    fig.update_layout(
+        title="CATEGORY MIX",
+        template="plotly_dark",
+        height=400,
+        font=dict(family="Inter", color=COLORS["text_primary"]),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(10,37,25,0.6)",
+        yaxis=dict(title="% of sales" if share else "SEK"),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02),
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def _render_inventory_status():
-    """Table of current inventory with low-stock highlighting"""
-    stock = data_ops.read_stock()
-    inventory = stock.get("inventory", [])
-    metadata = stock.get("metadata", {})
+    """Table of current inventory compared against the Menu.md storage targets"""
+    metadata = data_ops.read_stock().get("metadata", {})
+    rows = data_ops.stock_vs_targets()
 
-    if not inventory:
+    if not rows:
         st.caption("No inventory data loaded.")
         return
 
-    st.caption(f"Last updated: {metadata.get('last_updated', 'N/A')}")
+    st.caption(f"Last updated: {metadata.get('last_updated', 'N/A')} · Targets from the Menu.md Storage section")
 
     # Build table with status indicators
     table_data = []
-    for item in inventory:
-        qty = item.get("quantity", 0)
-        # Simple low-stock heuristic
-        if qty <= 1:
+    for row in rows:
+        ratio = row["ratio"]
+        if ratio is None:
+            status = "⚪ No target"
+        elif ratio < 0.5:
             status = "🔴 Critical"
-        elif qty <= 3:
+        elif ratio < 1:
             status = "🟡 Low"
         else:
             status = "🟢 OK"
 
         table_data.append({
-            "Item": item["item"],
-            "Qty": qty,
-            "Unit": item.get("unit", ""),
+            "Item": row["item"],
+            "Qty": row["quantity"],
+            "Target": row["target"],
+            "Unit": row["unit"],
+            "% of Target": round(ratio * 100) if ratio is not None else None,
             "Status": status,
         })
 
-    # Sort by status priority (critical first)
-    priority = {"🔴 Critical": 0, "🟡 Low": 1, "🟢 OK": 2}
-    table_data.sort(key=lambda x: priority.get(x["Status"], 9))
+    # Sort by status priority (critical first), then by fill level
+    priority = {"🔴 Critical": 0, "🟡 Low": 1, "🟢 OK": 2, "⚪ No target": 3}
+    table_data.sort(key=lambda x: (priority.get(x["Status"], 9), x["% of Target"] or 0))
 
     st.dataframe(
         table_data,
@@ -227,36 +398,102 @@ def _render_inventory_status():
         hide_index=True,
         column_config={
             "Item": st.column_config.TextColumn("Item", width="medium"),
-            "Qty": st.column_config.NumberColumn("Quantity", format="%d"),
+            "Qty": st.column_config.NumberColumn("Quantity", format="%.2f"),
+            "Target": st.column_config.NumberColumn("Target", format="%g"),
             "Unit": st.column_config.TextColumn("Unit", width="small"),
+            "% of Target": st.column_config.ProgressColumn("% of Target", format="%d%%", min_value=0, max_value=100),
             "Status": st.column_config.TextColumn("Status", width="small"),
         },
     )
 
 
-def _render_export(all_data: list):
+def _render_costs_margins():
+    """Actual COGS from supplier receipts joined against sales history"""
+    import cost_ledger
+
+    receipts = cost_ledger.load_receipts_frame()
+    receipt_files = cost_ledger.list_receipt_files()
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption(f"Ledger: {len(receipts)} of {len(receipt_files)} receipts extracted from `tant_cost_reciep/`")
+    with col2:
+        if st.button("🔄 Sync Receipts", use_container_width=True, key="sync_receipts"):
+            with st.spinner("Extracting new receipts..."):
+                from llm_models import get_llm
+                result = cost_ledger.sync_ledger(get_llm("receipts"))
+            st.toast(f"Extracted {result['extracted']} new receipts ({len(result['failed'])} failed)")
+            for err in result["failed"]:
+                st.caption(f"⚠️ {err}")
+            st.rerun()
+
+    if receipts.empty:
+        st.info("No receipts in the cost ledger yet. Profit falls back to the fixed COGS rate.")
+        return
+
+    granularity = st.radio("Granularity", ["Monthly", "Daily"], horizontal=True, key="cost_granularity")
+    margins = cost_ledger.cost_margins(freq="M" if granularity == "Monthly" else "D", receipts=receipts)
+    margins["period"] = margins["period"].astype(str)
+    if granularity == "Daily":
+        st.caption("Daily COGS is each month's receipts spread evenly over its sales days.")
+    if margins["cogs"].isna().any():
+        st.caption("Periods without receipts show no COGS or margin (post-mortems use the fixed COGS rate there).")
+
+    if HAS_PLOTLY:
+        fig = go.Figure()
+        fig.add_trace(go.Bar(
+            x=margins["period"], y=margins["net"],
+            name="Net Sales", marker_color=COLORS["smart_amber"],
+        ))
+        fig.add_trace(go.Bar(
+            x=margins["period"], y=margins["cogs"],
+            name="COGS (Receipts)", marker_color=COLORS["warning"],
+        ))
+        fig.add_trace(go.Scatter(
+            x=margins["period"], y=margins["margin_pct"],
+            name="Gross Margin %", mode="lines+markers",
+            line=dict(color=COLORS["info"], width=2),
+            yaxis="y2",
+        ))
+        fig.update_layout(
+            title="ACTUAL COGS & MARGINS",
+            template="plotly_dark",
+            height=400,
+            font=dict(family="Inter", color=COLORS["text_primary"]),
+            paper_bgcolor="rgba(0,0,0,0)",
+            plot_bgcolor="rgba(10,37,25,0.6)",
+            barmode="group",
+            yaxis=dict(title="SEK"),
+            yaxis2=dict(title="Margin %", overlaying="y", side="right"),
+            legend=dict(orientation="h", yanchor="bottom", y=1.02),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(
+        margins.rename(columns={
+            "period": "Period", "net": "Net Sales", "cogs": "COGS",
+            "gross_margin": "Gross Margin", "margin_pct": "Margin %",
+        }),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Net Sales": st.column_config.NumberColumn(format="%.0f SEK"),
+            "COGS": st.column_config.NumberColumn(format="%.0f SEK"),
+            "Gross Margin": st.column_config.NumberColumn(format="%.0f SEK"),
+            "Margin %": st.column_config.NumberColumn(format="%.1f%%"),
+        },
+    )
+
+
+def _render_export(daily):
     """Export sales data as CSV"""
     st.markdown("#### Download Reports Data")
 
-    # Build CSV
-    rows = []
-    for d in all_data:
-        s = d.get("sales_summary", {})
-        p = d.get("payment_methods", {})
-        perf = d.get("performance_metrics", {})
-        rows.append({
-            "date": d["_date"],
-            "gross_sales": s.get("total_gross", 0),
-            "net_sales": s.get("total_net", 0),
-            "vat": s.get("total_vat", 0),
-            "transactions": p.get("total_transactions", 0),
-            "avg_purchase": perf.get("average_purchase_per_customer", 0),
-        })
-
-    if rows:
-        import pandas as pd
-        df = pd.DataFrame(rows)
+    # Newest first, like the report list
+    df = daily.sort_values("date", ascending=False).rename(columns={"gross": "gross_sales", "net": "net_sales"})
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
 
+    if not df.empty:
         csv = df.to_csv(index=False)
         st.download_button(
             "📥 Download CSV",
@@ -281,3 +518,59 @@ def _render_export(all_data: list):
             st.caption("Install `openpyxl` for Excel export: `pip install openpyxl`")
     else:
         st.caption("No data to export.")
+
+    _render_accounting_export()
+
+
+def _render_accounting_export():
+    """Accounting entries for any month / quarter / year (Excel + SIE4)"""
+    import os
+    import tempfile
+    import accounting_export
+
+    st.markdown("#### Accounting Export")
+    period = st.text_input(
+        "Period",
+        value=datetime.date.today().strftime("%Y-%m"),
+        help="YYYY-MM (month), YYYY-Qn (quarter) or YYYY (year)",
+        key="accounting_period",
+    )
+    if st.button("🧾 Generate Accounting Files", use_container_width=True, key="gen_accounting"):
+        try:
+            _, _, label = accounting_export.parse_period(period)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            xlsx_path = os.path.join(tmp, f"{label}_Accounting_Report.xlsx")
+            sie_path = os.path.join(tmp, f"{label}_Accounting.se")
+            try:
+                result = accounting_export.export_period(period, xlsx_path=xlsx_path, sie_path=sie_path)
+                with open(xlsx_path, "rb") as f:
+                    st.session_state.accounting_xlsx = (os.path.basename(xlsx_path), f.read())
+            except ImportError:
+                st.caption("Install `openpyxl` for the Excel file: `pip install openpyxl`")
+                result = accounting_export.export_period(period, sie_path=sie_path)
+                st.session_state.accounting_xlsx = None
+            with open(sie_path, "rb") as f:
+                st.session_state.accounting_sie = (os.path.basename(sie_path), f.read())
+        st.caption(f"{result['days']} reports in {result['label']}")
+
+    if st.session_state.get("accounting_xlsx"):
+        name, data = st.session_state.accounting_xlsx
+        st.download_button(
+            "📥 Download Accounting Excel",
+            data=data,
+            file_name=name,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True,
+        )
+    if st.session_state.get("accounting_sie"):
+        name, data = st.session_state.accounting_sie
+        st.download_button(
+            "📥 Download SIE4",
+            data=data,
+            file_name=name,
+            mime="text/plain",
+            use_container_width=True,
+        )
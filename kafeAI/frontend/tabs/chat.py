@@ -4,6 +4,9 @@ Core chatbox with LangGraph backend integration.
 """
 import sys
 import os
+import time
+import uuid
+import datetime
 import streamlit as st
 
 # Ensure backend is importable
@@ -12,12 +15,22 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import QUICK_PROMPTS, AGENT_NODES, COLORS
 from theme import render_status_badge
 import data_ops
+import agent_reports
+import chat_history
+import run_manager
+import tenants
+
+# Poll the background run where st.fragment is available (otherwise it refreshes on the next interaction)
+_live_fragment = st.fragment(run_every=1) if hasattr(st, "fragment") else (lambda f: f)
 
 
 def _init_chat_state():
     """Initialize chat session state on first load"""
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if "chat_id" not in st.session_state:
+        # Resume the user's latest chat from the history store (only its newest page is loaded)
+        st.session_state.chat_user = _user_id()
+        chat_id = chat_history.latest_chat(st.session_state.chat_user)
+        _open_chat(chat_id or chat_history.new_chat(st.session_state.chat_user))
     if "workflow_running" not in st.session_state:
         st.session_state.workflow_running = False
     if "phase" not in st.session_state:
@@ -28,57 +41,138 @@ def _init_chat_state():
         st.session_state.workflow_config = None
     if "workflow_app" not in st.session_state:
         st.session_state.workflow_app = None
+    if "session_key" not in st.session_state:
+        st.session_state.session_key = uuid.uuid4().hex[:12]   # background runs are keyed by this
+
+
+def _user_id() -> str:
+    """History owner: ?user=<name> in the URL, else KAFEAI_USER, else "local"."""
+    return st.query_params.get("user") or os.getenv("KAFEAI_USER", "local")
+
+
+def _open_chat(chat_id: str):
+    """Show a chat: session state holds only a window of its newest messages"""
+    st.session_state.chat_id = chat_id
+    st.session_state.messages = chat_history.page(chat_id)
+    st.session_state.history_window = chat_history.PAGE_SIZE
+
 
+def post_message(role: str, content: str, node: str = None):
+    """Add a message to the current chat (persisted; the rendered window keeps its size)"""
+    msg = chat_history.append(st.session_state.chat_id, role, content, node)
+    st.session_state.messages.append(msg)
+    del st.session_state.messages[:-st.session_state.history_window]
 
-def _run_phase1(issue: str):
-    """Execute LangGraph Phase 1: gather agent inputs until HITL interrupt"""
+
+def _load_earlier():
+    """Prepend the previous page of the current chat to the window"""
+    messages = st.session_state.messages
+    older = chat_history.page(st.session_state.chat_id, before_id=messages[0]["id"] if messages else None)
+    st.session_state.messages = older + messages
+    st.session_state.history_window += chat_history.PAGE_SIZE
+
+
+def _start_phase1(issue: str):
+    """Start LangGraph Phase 1 (agent inputs until the HITL interrupt) in the background"""
     try:
         # Dynamic import to avoid circular dependencies at module level
-        from manageragent import app
+        from agent_client import get_app, release_thread
+        app = get_app()
 
-        config = {"configurable": {"thread_id": f"streamlit_{id(st.session_state)}"}}
-        inputs = {"issue": issue, "context": [], "feedback": ""}
+        # A fresh graph thread per run; the previous run's checkpoints are no longer needed
+        previous = st.session_state.workflow_config
+        if previous:
+            release_thread(previous["configurable"]["thread_id"])
+        thread_id = f"streamlit_{st.session_state.session_key}_{uuid.uuid4().hex[:8]}"
+        config = {"configurable": {"thread_id": thread_id}}
+        inputs = {"issue": issue, "feedback": "", "tenant_id": tenants.current_tenant_id()}
 
         st.session_state.workflow_app = app
         st.session_state.workflow_config = config
+        st.session_state.workflow_run_id = uuid.uuid4().hex[:12]
         st.session_state.agent_outputs = {}
+        st.session_state.phase = "phase1"
+        st.session_state.workflow_running = True
 
-        # Stream Phase 1
-        for output in app.stream(inputs, config=config):
-            for node_name, content in output.items():
-                st.session_state.agent_outputs[node_name] = content
-                if "context" in content:
-                    ctx = content["context"][-1] if content["context"] else ""
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": f"**{_get_agent_label(node_name)}**: {ctx[:1000]}",
-                        "node": node_name,
-                    })
-                elif "decision" in content:
-                    decision = content["decision"]
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": f"**{_get_agent_label(node_name)}**:\n\n{decision}",
-                        "node": node_name,
-                    })
-
-        # Check for HITL state
-        snapshot = app.get_state(config)
-        if snapshot.next:
-            st.session_state.phase = "waiting_hitl"
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": "⏸️ **HITL Checkpoint** — All agents have reported. Awaiting your approval in the **Decision Review** tab.",
-            })
-        else:
-            st.session_state.phase = "done"
-
+        run_manager.start(st.session_state.session_key, "phase1", app, config, inputs,
+                          run_id=st.session_state.workflow_run_id)
     except Exception as e:
-        st.session_state.messages.append({
+        post_message("assistant", f"❌ **System Error**: {str(e)}")
+        st.session_state.phase = "idle"
+        st.session_state.workflow_running = False
+
+
+def _format_output(node_name: str, content: dict):
+    """Chat message for one Phase 1 node update (None if it has nothing to show)"""
+    entry = agent_reports.report_of(content or {}, node_name)
+    if entry:
+        return {
+            "role": "assistant",
+            "content": f"**{_get_agent_label(node_name)}**: {entry['text'][:1000]}",
+            "node": node_name,
+        }
+    if content and "decision" in content:
+        return {
             "role": "assistant",
-            "content": f"❌ **System Error**: {str(e)}",
-        })
+            "content": f"**{_get_agent_label(node_name)}**:\n\n{content['decision']}",
+            "node": node_name,
+        }
+    return None
+
+
+def _finish_phase1(run):
+    """Move a finished Phase 1 run into the chat history and set the next phase"""
+    for node_name, content in run.events():
+        st.session_state.agent_outputs[node_name] = content
+        message = _format_output(node_name, content)
+        if message:
+            post_message(**message)
+
+    if run.status == run_manager.WAITING_HITL:
+        st.session_state.phase = "waiting_hitl"
+        post_message(
+            "assistant",
+            "⏸️ **HITL Checkpoint** — All agents have reported. Awaiting your approval in the **Decision Review** tab.",
+        )
+    elif run.status == run_manager.DONE:
+        st.session_state.phase = "done"
+    else:
         st.session_state.phase = "idle"
+        post_message(
+            "assistant",
+            "🛑 **Run cancelled.**" if run.status == run_manager.CANCELLED
+            else f"❌ **System Error**: {run.error}",
+        )
+    st.session_state.workflow_running = False
+
+
+@_live_fragment
+def _render_live_run():
+    """Node outputs of the run in flight, refreshed without rerunning the page"""
+    run = run_manager.get(st.session_state.session_key)
+    if not run or run.phase != "phase1":
+        # The run is gone (e.g. the server restarted)
+        st.session_state.phase = "idle"
+        st.session_state.workflow_running = False
+        st.rerun()
+    if run.finished:
+        _finish_phase1(run)
+        st.rerun()
+
+    for node_name, content in run.events():
+        message = _format_output(node_name, content)
+        if message:
+            with st.chat_message("assistant"):
+                st.markdown(message["content"])
+
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        elapsed = time.time() - run.started_at
+        st.caption(f"🔄 Agents are analyzing... {len(run.events())} step(s), {elapsed:.0f}s")
+    with col2:
+        if st.button("🛑 Cancel", key="cancel_phase1", use_container_width=True):
+            run_manager.cancel(st.session_state.session_key)
+            st.toast("Cancelling after the current agent finishes...", icon="🛑")
 
 
 def _get_agent_label(node_id: str) -> str:
@@ -101,20 +195,23 @@ def render():
     cols = st.columns(len(QUICK_PROMPTS))
     for i, qp in enumerate(QUICK_PROMPTS):
         with cols[i]:
-            if st.button(qp["label"], key=f"qp_{i}", use_container_width=True):
-                st.session_state.messages.append({
-                    "role": "user",
-                    "content": qp["prompt"],
-                })
-                st.session_state.phase = "phase1"
-                st.session_state.workflow_running = True
+            if st.button(qp["label"], key=f"qp_{i}", use_container_width=True,
+                         disabled=st.session_state.workflow_running):
+                post_message("user", qp["prompt"])
+                _start_phase1(qp["prompt"])
 
     st.divider()
 
     # ── Chat History ───────────────────────────────────────
+    # Only the window is rendered, so a rerun costs the same however long the chat gets
     chat_container = st.container(height=480)
     with chat_container:
-        for msg in st.session_state.messages:
+        messages = st.session_state.messages
+        if messages and chat_history.has_older(st.session_state.chat_id, messages[0]["id"]):
+            if st.button("⬆️ Load earlier messages", key="load_earlier", use_container_width=True):
+                _load_earlier()
+                st.rerun()
+        for msg in messages:
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
 
@@ -122,25 +219,24 @@ def render():
     if st.session_state.phase == "waiting_hitl":
         st.info("🔔 Agents have completed analysis. Go to **Decision Review** tab to approve/modify the strategy.")
     elif st.session_state.phase == "phase1":
-        with st.spinner("🔄 Agents are analyzing..."):
-            issue = st.session_state.messages[-1]["content"] if st.session_state.messages else "General Analysis"
-            _run_phase1(issue)
-            st.session_state.workflow_running = False
-            st.rerun()
+        # Runs in the background: other tabs stay usable while the agents work
+        _render_live_run()
 
     # ── Chat Input ─────────────────────────────────────────
     user_input = st.chat_input("Ask KafeAI anything...", disabled=st.session_state.workflow_running)
     if user_input:
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        st.session_state.phase = "phase1"
-        st.session_state.workflow_running = True
+        post_message("user", user_input)
+        _start_phase1(user_input)
         st.rerun()
 
     # ── Bottom Actions ─────────────────────────────────────
     col1, col2, col3 = st.columns([1, 1, 4])
     with col1:
-        if st.button("🗑️ Clear Chat", use_container_width=True):
-            st.session_state.messages = []
+        if st.button("🆕 New Chat", use_container_width=True):
+            # The previous chat stays in the history store (see Search past conversations)
+            run_manager.cancel(st.session_state.session_key)
+            st.session_state.workflow_running = False
+            _open_chat(chat_history.new_chat(st.session_state.chat_user))
             st.session_state.phase = "idle"
             st.session_state.agent_outputs = {}
             st.rerun()
@@ -148,14 +244,46 @@ def render():
         if st.button("💾 Export Chat", use_container_width=True):
             _export_chat()
 
+    _render_search()
+
+
+def _render_search():
+    """Full-text search over the user's past chats, or the recent chats when empty"""
+    with st.expander("🔎 Search past conversations"):
+        query = st.text_input("Search", key="chat_search", placeholder="e.g. sallad promotion",
+                              label_visibility="collapsed")
+        if query:
+            results = chat_history.search(st.session_state.chat_user, query, limit=10)
+            if not results:
+                st.caption("No matching messages.")
+            for r in results:
+                _render_chat_link(r["chat_id"], r["title"], r["ts"], r["snippet"], key=f"hit_{r['id']}")
+        else:
+            for c in chat_history.list_chats(st.session_state.chat_user, limit=10):
+                _render_chat_link(c["chat_id"], c["title"], c["updated_at"], f"{c['messages']} messages",
+                                  key=f"chat_{c['chat_id']}")
+
+
+def _render_chat_link(chat_id: str, title: str, ts: float, detail: str, key: str):
+    col1, col2 = st.columns([5, 1])
+    with col1:
+        when = datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
+        current = " (current)" if chat_id == st.session_state.chat_id else ""
+        st.markdown(f"**{title or 'Untitled chat'}**{current} · {when}  \n{detail}")
+    with col2:
+        if st.button("Open", key=key, use_container_width=True,
+                     disabled=chat_id == st.session_state.chat_id or st.session_state.workflow_running):
+            _open_chat(chat_id)
+            st.rerun()
+
 
 def _export_chat():
-    """Export chat history as text file"""
+    """Export the whole current chat (not just the rendered window) as a text file"""
     if not st.session_state.messages:
         st.toast("No messages to export.", icon="⚠️")
         return
     lines = []
-    for msg in st.session_state.messages:
+    for msg in chat_history.iter_messages(st.session_state.chat_id):
         role = "USER" if msg["role"] == "user" else "KAFEAI"
         lines.append(f"[{role}] {msg['content']}\n")
     content = "\n".join(lines)
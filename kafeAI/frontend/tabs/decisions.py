@@ -4,9 +4,19 @@ HITL approval interface: view agent analysis, approve/modify/reject, trigger exe
 """
 import streamlit as st
 import datetime
+import time
 from config import COLORS, AGENT_NODES
 from theme import render_status_badge
 import data_ops
+import briefing_scheduler
+import agent_reports
+import run_manager
+from tabs.chat import post_message
+
+# Poll the background run where st.fragment is available (otherwise it refreshes on the next interaction)
+_live_fragment = st.fragment(run_every=1) if hasattr(st, "fragment") else (lambda f: f)
+
+BRIEFING_CHECK_INTERVAL = 300   # seconds between precomputed-briefing checks (each hashes inputs + weather)
 
 
 def _init_decision_state():
@@ -17,16 +27,49 @@ def _init_decision_state():
         st.session_state.decision_feedback = ""
 
 
+def _load_precomputed_briefing():
+    """Restore the overnight Phase 1 run into this session if it is still current (once per run)"""
+    # 空闲时每次重绘都会调用：限制检查频率
+    if time.time() - st.session_state.get("briefing_checked_at", 0) < BRIEFING_CHECK_INTERVAL:
+        return None
+    st.session_state.briefing_checked_at = time.time()
+    record = briefing_scheduler.load_precomputed()
+    if not record or st.session_state.get("briefing_loaded") == record["created_at"]:
+        return None
+
+    from agent_client import get_app
+    app = get_app()
+
+    thread_id = f"streamlit_{id(st.session_state)}_briefing_{record['target_date']}"
+    config = {"configurable": {"thread_id": thread_id}}
+    briefing_scheduler.restore(app, config, record)
+
+    st.session_state.workflow_app = app
+    st.session_state.workflow_config = config
+    st.session_state.workflow_run_id = None
+    st.session_state.agent_outputs = {}
+    st.session_state.phase = "waiting_hitl"
+    st.session_state.briefing_loaded = record["created_at"]
+    return record
+
+
 def render():
     """Render the Decision Review Center tab"""
     _init_decision_state()
 
+    if st.session_state.get("phase", "idle") in ("idle", "done"):
+        record = _load_precomputed_briefing()
+        if record:
+            st.caption(f"🌙 Precomputed briefing for {record['target_date']} (generated {record['created_at']}).")
+
     st.markdown("### 🧠 Decision Review Center")
     st.caption("Review AI recommendations. Approve, modify, or reject before execution.")
 
     # ── Active Decision Panel ──────────────────────────────
     if st.session_state.get("phase") == "waiting_hitl":
         _render_active_decision()
+    elif st.session_state.get("phase") == "phase2":
+        _render_live_execution()
     elif st.session_state.get("phase") == "done":
         st.success("✅ Latest workflow completed. All decisions have been executed.")
         _render_execution_results()
@@ -50,29 +93,19 @@ def _render_active_decision():
         return
 
     snapshot = app.get_state(config)
-    current_context = snapshot.values.get("context", [])
+    reports = agent_reports.ordered(snapshot.values)
     promotion_data = snapshot.values.get("promotion_data")
     poster_path = snapshot.values.get("poster_path")
 
     # ── Agent Reports ──────────────────────────────────
     st.markdown("#### 📊 Agent Analysis Summary")
 
-    for i, ctx in enumerate(current_context):
-        # Determine which agent this context belongs to
-        agent_icon = "📋"
-        if "Predictor:" in ctx:
-            agent_icon = "🌤️"
-        elif "Inventory" in ctx:
-            agent_icon = "📦"
-        elif "Forecast" in ctx:
-            agent_icon = "📈"
-        elif "Post-mortem" in ctx or "Financial" in ctx:
-            agent_icon = "📋"
-        elif "Pricing" in ctx:
-            agent_icon = "💰"
-
-        with st.expander(f"{agent_icon} Report #{i+1}", expanded=(i == len(current_context) - 1)):
-            st.markdown(ctx)
+    for i, (node, entry) in enumerate(reports):
+        title = agent_reports.label(node)
+        if entry["status"] != agent_reports.OK:
+            title += f" ({entry['status']})"
+        with st.expander(title, expanded=(i == len(reports) - 1)):
+            st.markdown(entry["text"])
 
     # ── Promotion Preview ──────────────────────────────
     if promotion_data:
@@ -119,22 +152,19 @@ def _render_active_decision():
         _execute_phase2(feedback if modify else "", "APPROVED" if approve else "MODIFIED")
     elif reject:
         st.session_state.phase = "idle"
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": "🚫 Decision rejected. Workflow halted.",
-        })
+        post_message("assistant", "🚫 Decision rejected. Workflow halted.")
         # Save rejection to history
         data_ops.save_decision({
             "timestamp": datetime.datetime.now().isoformat(),
             "status": "REJECTED",
-            "context": current_context,
+            "reports": {node: entry["text"] for node, entry in reports},
             "feedback": feedback,
         })
         st.rerun()
 
 
 def _execute_phase2(feedback: str, status: str):
-    """Run LangGraph Phase 2: manager → executor"""
+    """Start LangGraph Phase 2 (manager → executor) in the background"""
     app = st.session_state.get("workflow_app")
     config = st.session_state.get("workflow_config")
 
@@ -143,46 +173,97 @@ def _execute_phase2(feedback: str, status: str):
         return
 
     try:
-        with st.spinner("🔄 Executing decision..."):
-            # Inject human feedback if provided
-            if feedback:
-                app.update_state(config, {"context": [f"Human Feedback: {feedback}"]}, as_node="stock_manager")
-
-            decision_text = ""
-            execution_result = ""
-
-            for output in app.stream(None, config=config):
-                for node_name, content in output.items():
-                    if node_name == "manager" and "decision" in content:
-                        decision_text = content["decision"]
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": f"**🧠 COO Decision:**\n{decision_text[:800]}",
-                        })
-                    elif "context" in content:
-                        execution_result = content["context"][-1]
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": f"**✅ {node_name}:** {execution_result}",
-                        })
-
-            # Save to decision history
-            data_ops.save_decision({
-                "timestamp": datetime.datetime.now().isoformat(),
-                "status": status,
-                "decision": decision_text[:1000],
-                "execution": execution_result,
-                "feedback": feedback,
-            })
-
-            st.session_state.phase = "done"
-            st.rerun()
+        # Inject human feedback if provided (resumes straight into the manager)
+        if feedback:
+            app.update_state(config, {"feedback": feedback}, as_node=briefing_scheduler.RESUME_AS_NODE)
+
+        run_manager.start(
+            st.session_state.session_key, "phase2", app, config,
+            run_id=st.session_state.get("workflow_run_id"),
+            # Saved from the worker thread, so the record is kept even if the browser goes away
+            on_finish=lambda run: _save_execution(run, status, feedback),
+        )
+        st.session_state.phase = "phase2"
+        st.session_state.workflow_running = True
+        st.rerun()
 
     except Exception as e:
         st.error(f"Execution error: {str(e)}")
         st.session_state.phase = "idle"
 
 
+def _phase2_results(run):
+    """(decision text, execution result) from a Phase 2 run's node updates"""
+    decision_text = ""
+    execution_result = ""
+    for node_name, content in run.events():
+        if node_name == "manager" and "decision" in (content or {}):
+            decision_text = content["decision"]
+        elif agent_reports.update_text(node_name, content):
+            execution_result = agent_reports.update_text(node_name, content)
+    return decision_text, execution_result
+
+
+def _save_execution(run, status: str, feedback: str):
+    """Save a finished Phase 2 run to decision history"""
+    decision_text, execution_result = _phase2_results(run)
+    if run.status == run_manager.CANCELLED:
+        status = "CANCELLED"
+    elif run.status == run_manager.ERROR:
+        status = "FAILED"
+    data_ops.save_decision({
+        "timestamp": datetime.datetime.now().isoformat(),
+        "status": status,
+        "decision": decision_text[:1000],
+        "execution": execution_result or run.error or "",
+        "feedback": feedback,
+    })
+
+
+def _phase2_messages(run) -> list:
+    messages = []
+    for node_name, content in run.events():
+        if node_name == "manager" and "decision" in (content or {}):
+            messages.append(f"**🧠 COO Decision:**\n{content['decision'][:800]}")
+        elif agent_reports.update_text(node_name, content):
+            messages.append(f"**✅ {node_name}:** {agent_reports.update_text(node_name, content)}")
+    return messages
+
+
+@_live_fragment
+def _render_live_execution():
+    """Progress of the Phase 2 run in flight, refreshed without rerunning the page"""
+    run = run_manager.get(st.session_state.session_key)
+    if not run or run.phase != "phase2" or run.finished:
+        if run and run.phase == "phase2":
+            for text in _phase2_messages(run):
+                post_message("assistant", text)
+            if run.status == run_manager.DONE:
+                st.session_state.phase = "done"
+            else:
+                st.session_state.phase = "idle"
+                post_message(
+                    "assistant",
+                    "🛑 **Execution cancelled.**" if run.status == run_manager.CANCELLED
+                    else f"❌ **Execution error**: {run.error}",
+                )
+        else:
+            st.session_state.phase = "idle"
+        st.session_state.workflow_running = False
+        st.rerun()
+
+    for text in _phase2_messages(run):
+        st.markdown(text)
+
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.caption(f"🔄 Executing decision... {time.time() - run.started_at:.0f}s")
+    with col2:
+        if st.button("🛑 Cancel", key="cancel_phase2", use_container_width=True):
+            run_manager.cancel(st.session_state.session_key)
+            st.toast("Cancelling after the current step finishes...", icon="🛑")
+
+
 def _render_execution_results():
     """Show the results of the last completed execution"""
     # Show latest stock update
@@ -1,43 +1,45 @@
 """
 KafeAI Frontend — System Monitor Tab
-Agent status, resource usage, and live log viewer.
+Agent status, resource usage, LLM rate limiter counters, and a live view of the shared structured log store.
 """
 import streamlit as st
 import datetime
-import logging
-import io
+import html
 from config import COLORS, AGENT_NODES
 from theme import render_status_badge, render_agent_card
 
-# Lazy import psutil
-try:
-    import psutil
-    HAS_PSUTIL = True
-except ImportError:
-    HAS_PSUTIL = False
+from resource_sampler import get_sampler
+import structured_log
+import llm_limiter
+import llm_models
+import resilience
+import agent_reports
+from structured_log import get_logger
+
+# Auto-refresh the resource panel where st.fragment is available
+_live_fragment = st.fragment(run_every=2) if hasattr(st, "fragment") else (lambda f: f)
+
+
+MAX_LOG_BUFFER = 500   # entries kept in the session view
+LOG_BATCH = 200        # rows fetched per refresh
 
 
 def _init_monitor_state():
     """Initialize monitor session state"""
     if "log_entries" not in st.session_state:
         st.session_state.log_entries = []
-    if "log_filter" not in st.session_state:
-        st.session_state.log_filter = "ALL"
+    if "log_cursor" not in st.session_state:
+        st.session_state.log_cursor = 0      # last log id shown
+    if "log_floor" not in st.session_state:
+        st.session_state.log_floor = 0       # ids <= floor were cleared from the view
+    if "log_filter_key" not in st.session_state:
+        st.session_state.log_filter_key = None
 
 
 def add_log(level: str, message: str, source: str = "System"):
-    """Add a log entry to session state (callable from other modules)"""
-    if "log_entries" not in st.session_state:
-        st.session_state.log_entries = []
-    st.session_state.log_entries.append({
-        "timestamp": datetime.datetime.now().strftime("%H:%M:%S"),
-        "level": level.upper(),
-        "source": source,
-        "message": message,
-    })
-    # Keep max 500 entries
-    if len(st.session_state.log_entries) > 500:
-        st.session_state.log_entries = st.session_state.log_entries[-500:]
+    """Write a log entry to the shared log store (callable from other modules)"""
+    log = get_logger(source)
+    {"ERROR": log.error, "WARN": log.warning, "WARNING": log.warning}.get(level.upper(), log.info)(message)
 
 
 def render():
@@ -61,9 +63,8 @@ def render():
 
             if has_output:
                 output = agent_outputs[node_id]
-                # Check if output contains error
-                ctx = output.get("context", [""])[0] if output.get("context") else ""
-                if "Error" in ctx:
+                # Check if the node reported an error (or was skipped)
+                if agent_reports.failed(agent_reports.report_of(output or {}, node_id)):
                     status = "error"
                     status_text = "Error"
                 else:
@@ -85,59 +86,158 @@ def render():
     col_res, col_log = st.columns([1, 2])
 
     with col_res:
-        st.markdown("#### 💻 System Resources")
-        if HAS_PSUTIL:
-            cpu = psutil.cpu_percent(interval=0.5)
-            mem = psutil.virtual_memory()
-
-            # CPU gauge
-            st.markdown(f"**CPU Usage**")
-            st.progress(min(cpu / 100, 1.0), text=f"{cpu:.1f}%")
-
-            # Memory gauge
-            mem_pct = mem.percent / 100
-            st.markdown(f"**Memory Usage**")
-            st.progress(min(mem_pct, 1.0), text=f"{mem.percent:.1f}% ({mem.used // (1024**2)} MB / {mem.total // (1024**2)} MB)")
-
-            # Disk
-            try:
-                disk = psutil.disk_usage("D:\\")
-                disk_pct = disk.percent / 100
-                st.markdown(f"**Disk Usage (D:)**")
-                st.progress(min(disk_pct, 1.0), text=f"{disk.percent:.1f}%")
-            except Exception:
-                pass
-        else:
-            st.info("Install `psutil` for system monitoring:\n`pip install psutil`")
+        _render_resources()
+        _render_llm_usage()
 
     with col_log:
         _render_log_viewer()
 
 
+@_live_fragment
+def _render_resources():
+    """Resource gauges and sparklines read from the background sampler (never blocks)"""
+    st.markdown("#### 💻 System Resources")
+    sampler = get_sampler()
+    if sampler is None:
+        st.info("Install `psutil` for system monitoring:\n`pip install psutil`")
+        return
+
+    data = sampler.snapshot()
+    if not data["ts"]:
+        st.caption("Collecting samples...")
+        return
+
+    def _gauge(label: str, series: str, text: str):
+        values = data[series]
+        st.markdown(f"**{label}**")
+        st.progress(min(values[-1] / 100, 1.0), text=text)
+        st.line_chart(values, height=60)
+
+    _gauge("CPU Usage", "cpu", f"{data['cpu'][-1]:.1f}%")
+    _gauge("Memory Usage", "mem", f"{data['mem'][-1]:.1f}%")
+    _gauge("Disk Usage", "disk", f"{data['disk'][-1]:.1f}%")
+
+    st.markdown("**Network (KB/s)**")
+    st.line_chart(
+        {"sent": data["net_sent_kbs"], "recv": data["net_recv_kbs"]},
+        height=80,
+    )
+
+    st.markdown(f"**KafeAI Processes** — {data['rss_mb'][-1]:.0f} MB RSS, {data['threads'][-1]:.0f} threads")
+    st.line_chart(data["rss_mb"], height=60)
+    if data["processes"]:
+        st.dataframe(
+            [
+                {
+                    "Worker": p["role"],
+                    "PID": p["pid"],
+                    "RSS (MB)": round(p["rss_mb"], 1),
+                    "CPU %": round(p["cpu"], 1),
+                    "Threads": p["threads"],
+                }
+                for p in data["processes"]
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+    else:
+        st.caption("No Streamlit / Twilio / WhatsApp workers detected.")
+
+
+@_live_fragment
+def _render_llm_usage():
+    """Shared LLM limiter counters (all processes) and this process's adaptive concurrency"""
+    st.markdown("#### 🧠 LLM Usage")
+    s = llm_limiter.stats()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Requests", f"{s['requests']:.0f}")
+    col2.metric("Retries", f"{s['retries']:.0f}")
+    col3.metric("429s", f"{s['rate_limited']:.0f}")
+    col1.metric("Failed", f"{s['failed']:.0f}")
+    col2.metric("Timeouts", f"{s['timeouts']:.0f}")
+    col3.metric("Waited", f"{s['wait_seconds']:.0f}s")
+
+    st.progress(min(max(s["requests_available"] / s["rpm_limit"], 0.0), 1.0),
+                text=f"RPM budget {s['requests_available']:.0f} / {s['rpm_limit']:.0f}")
+    st.progress(min(max(s["tokens_available"] / s["tpm_limit"], 0.0), 1.0),
+                text=f"TPM budget {s['tokens_available']:,.0f} / {s['tpm_limit']:,.0f}")
+    st.caption(
+        f"Tokens in/out: {s['prompt_tokens']:,.0f} / {s['output_tokens']:,.0f} · "
+        f"Concurrency (this process): {s['in_flight']} in flight, limit {s['concurrency']}"
+    )
+
+    open_circuits = [name for name, state in resilience.breaker_states().items() if state != "closed"]
+    if open_circuits:
+        st.warning(f"Circuit open (failing fast): {', '.join(open_circuits)}")
+
+    models = llm_models.model_stats()
+    if models:
+        st.markdown(f"**Per Model** — total ${sum(m['cost_usd'] for m in models):.4f}")
+        st.dataframe(
+            [
+                {
+                    "Model": m["model"],
+                    "Calls": m["calls"],
+                    "Errors": m["errors"],
+                    "Fallbacks": m["fallbacks"],
+                    "Avg (s)": m["avg_latency_s"],
+                    "Tokens": m["prompt_tokens"] + m["output_tokens"],
+                    "Cost ($)": m["cost_usd"],
+                }
+                for m in models
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
+
+
+def _refresh_log_buffer(level: str, node: str, run_id: str):
+    """Pull only records newer than the cursor; reload when the filters change."""
+    key = (level, node, run_id, st.session_state.log_floor)
+    if key != st.session_state.log_filter_key:
+        entries = structured_log.recent(st.session_state.log_floor, level, node, run_id, limit=MAX_LOG_BUFFER)
+        st.session_state.log_filter_key = key
+        st.session_state.log_entries = entries
+    else:
+        entries = structured_log.tail(st.session_state.log_cursor, level, node, run_id, limit=LOG_BATCH)
+        if entries:
+            st.session_state.log_entries = (st.session_state.log_entries + entries)[-MAX_LOG_BUFFER:]
+    if st.session_state.log_entries:
+        st.session_state.log_cursor = st.session_state.log_entries[-1]["id"]
+    else:
+        st.session_state.log_cursor = st.session_state.log_floor
+
+
+def _format_ts(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+
+
+@_live_fragment
 def _render_log_viewer():
-    """Real-time log viewer with level filter"""
+    """Live log viewer over the shared log store, filterable by level / node / run"""
     st.markdown("#### 📝 Runtime Logs")
 
     # Filter controls
-    col1, col2 = st.columns([2, 1])
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
     with col1:
-        st.session_state.log_filter = st.selectbox(
-            "Filter",
-            ["ALL", "INFO", "WARN", "ERROR"],
-            index=0,
-            label_visibility="collapsed",
-        )
+        level = st.selectbox("Level", ["ALL", "INFO", "WARN", "ERROR"], key="log_filter")
     with col2:
+        node = st.selectbox("Node", ["ALL"] + structured_log.distinct_values("node"), key="log_node_filter")
+    with col3:
+        run_id = st.selectbox("Run", ["ALL"] + structured_log.distinct_values("run_id"), key="log_run_filter")
+    with col4:
+        st.write("")
         if st.button("🗑️ Clear Logs", use_container_width=True):
-            st.session_state.log_entries = []
-            st.rerun()
+            # Only hides older entries from this view; the shared store is left intact
+            st.session_state.log_floor = structured_log.latest_id()
 
-    # Log display
+    _refresh_log_buffer(
+        None if level == "ALL" else level,
+        None if node == "ALL" else node,
+        None if run_id == "ALL" else run_id,
+    )
     logs = st.session_state.log_entries
-    filter_level = st.session_state.log_filter
-
-    if filter_level != "ALL":
-        logs = [l for l in logs if l["level"] == filter_level]
 
     log_container = st.container(height=300)
     with log_container:
@@ -152,19 +252,20 @@ def _render_log_viewer():
                     "ERROR": COLORS["error"],
                 }.get(level, COLORS["text_mid"])
 
+                run_tag = f' <span style="color:{COLORS["text_light"]};">({entry["run_id"]})</span>' if entry["run_id"] else ""
                 st.markdown(
                     f'<div class="log-line"><span style="color:{color_class};font-weight:600;">[{level}]</span> '
-                    f'<span style="color:{COLORS["text_light"]};">{entry["timestamp"]}</span> '
-                    f'<span style="color:{COLORS["text_mid"]};">{entry["source"]}:</span> '
-                    f'{entry["message"]}</div>',
+                    f'<span style="color:{COLORS["text_light"]};">{_format_ts(entry["ts"])}</span> '
+                    f'<span style="color:{COLORS["text_mid"]};">{entry["node"]}:</span> '
+                    f'{html.escape(entry["message"] or "")}{run_tag}</div>',
                     unsafe_allow_html=True,
                 )
 
     # Download logs
-    if st.session_state.log_entries:
+    if logs:
         log_text = "\n".join(
-            f"[{e['level']}] {e['timestamp']} {e['source']}: {e['message']}"
-            for e in st.session_state.log_entries
+            f"[{e['level']}] {_format_ts(e['ts'])} {e['node']} {e['run_id'] or '-'}: {e['message']}"
+            for e in logs
         )
         st.download_button(
             "📥 Download Logs",
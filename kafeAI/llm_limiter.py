@@ -0,0 +1,378 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
+from structured_log import get_logger
+from resilience import remaining
+
+# 全局 LLM 限流：所有 Agent 节点、所有门店、所有进程 (Streamlit / Twilio / WhatsApp) 共用同一个配额
+# - 令牌桶 (每分钟请求数 + 每分钟 token 数) 存在 SQLite 里，跨进程共享
+# - 429 / 5xx / 超时 (按 HTTP 状态码或异常类型判断)：指数退避 + 随机抖动重试；429 时清空请求桶，让其他进程也一起退让
+# - 自适应并发 (AIMD)：成功时并发上限 +1，被限流时减半
+# - 计数器写入同一个库，Monitor 页读取
+#
+# LLM_RPM / LLM_TPM: 每分钟请求数 / token 数上限
+# LLM_MAX_CONCURRENCY: 每个进程的并发上限；LLM_MAX_RETRIES / LLM_TIMEOUT: 重试次数 / 单次超时 (秒)
+# LLM_CACHE_SIZE: 相同 prompt 的响应缓存条数 (默认 256, 0 关闭)；同城门店的相同天气分析等只调用一次
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIMITER_DB_PATH = os.path.join(BASE_PATH, "cache", "llm_limiter.db")
+
+LLM_RPM = float(os.getenv("LLM_RPM", "60"))
+LLM_TPM = float(os.getenv("LLM_TPM", "250000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+
+BACKOFF_BASE = 1.0     # seconds, doubled per attempt
+BACKOFF_CAP = 30.0
+MAX_WAIT = 120.0       # give up acquiring after this long
+CHARS_PER_TOKEN = 4    # prompt estimate before the real usage is known
+
+# Retry policy by HTTP status, or by exception class name (google.api_core / httpx / requests)
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+RATE_LIMIT_STATUS = (429,)
+RATE_LIMIT_TYPES = ("ResourceExhausted", "TooManyRequests", "RateLimitError")
+TIMEOUT_TYPES = ("TimeoutError", "DeadlineExceeded", "Timeout", "ConnectTimeout", "ReadTimeout",
+                 "TimeoutException", "APITimeoutError")
+RETRYABLE_TYPES = RATE_LIMIT_TYPES + TIMEOUT_TYPES + (
+    "ServiceUnavailable", "InternalServerError", "BadGateway", "GatewayTimeout",
+    "ConnectionError", "ConnectError", "APIConnectionError",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name     TEXT PRIMARY KEY,
+    tokens   REAL NOT NULL,
+    updated  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name     TEXT PRIMARY KEY,
+    value    REAL NOT NULL
+);
+"""
+
+COUNTERS = ("requests", "succeeded", "failed", "retries", "rate_limited", "timeouts",
+            "prompt_tokens", "output_tokens", "wait_seconds")
+
+log = get_logger("LLM Limiter")
+
+_cache_enabled = False
+_cache_lock = threading.Lock()
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    path = path or LIMITER_DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _causes(error: Exception):
+    """The error and the exceptions it wraps (SDKs often re-raise transport errors)."""
+    seen = []
+    while error is not None and error not in seen and len(seen) < 5:
+        seen.append(error)
+        error = error.__cause__ or error.__context__
+    return seen
+
+
+def _status_code(error: Exception):
+    """HTTP status carried by the error or its response (None if there is none)."""
+    for e in _causes(error):
+        for obj in (e, getattr(e, "response", None)):
+            for attr in ("status_code", "code", "status"):
+                value = getattr(obj, attr, None)
+                value = getattr(value, "value", value)   # enum-valued codes
+                if isinstance(value, int) and 100 <= value < 600:
+                    return value
+    return None
+
+
+def _type_names(error: Exception) -> set:
+    return {cls.__name__ for e in _causes(error) for cls in type(e).__mro__}
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status in RATE_LIMIT_STATUS
+    return bool(_type_names(error) & set(RATE_LIMIT_TYPES))
+
+
+def _is_timeout(error: Exception) -> bool:
+    return _status_code(error) == 408 or bool(_type_names(error) & set(TIMEOUT_TYPES))
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, TimeoutError):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return bool(_type_names(error) & set(RETRYABLE_TYPES))
+
+
+def estimate_tokens(messages) -> int:
+    """Rough prompt size (chars / 4) used to reserve TPM budget before the call."""
+    if isinstance(messages, str):
+        return max(1, len(messages) // CHARS_PER_TOKEN)
+    total = 0
+    for m in messages:
+        content = getattr(m, "content", m)
+        total += len(content) if isinstance(content, str) else len(str(content))
+    return max(1, total // CHARS_PER_TOKEN)
+
+
+class SharedRateLimiter:
+    """
+    Cross-process token buckets (requests/min and tokens/min) in SQLite, plus a
+    per-process AIMD concurrency limit. acquire() blocks until both budgets allow the call.
+    """
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, path: str = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.path = path or LIMITER_DB_PATH
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    # ── Token Buckets ─────────────────────────────────────────
+    def _take(self, tokens: int) -> float:
+        """Deduct 1 request and `tokens` from the buckets. 0 on success, else seconds to wait."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = {}
+            for name, capacity in (("requests", self.rpm), ("tokens", self.tpm)):
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60.0)
+                levels[name] = (level, capacity)
+
+            need = {"requests": 1.0, "tokens": float(min(tokens, self.tpm))}
+            wait = max(
+                (need[name] - level) * 60.0 / capacity
+                for name, (level, capacity) in levels.items()
+            )
+            if wait <= 0:
+                for name, (level, _) in levels.items():
+                    conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (name, level - need[name], now))
+            conn.execute("COMMIT")
+            return max(0.0, wait)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _adjust_tokens(self, delta: float):
+        """Charge (or refund) the difference between estimated and actual token usage."""
+        if delta:
+            self._conn().execute("UPDATE buckets SET tokens = tokens - ? WHERE name = 'tokens'", (delta,))
+
+    def drain(self):
+        """Empty the request bucket so every process backs off after a 429."""
+        self._conn().execute("UPDATE buckets SET tokens = 0, updated = ? WHERE name = 'requests'", (time.time(),))
+
+    # ── Adaptive Concurrency ──────────────────────────────────
+    def _enter(self, timeout: float):
+        """Take a concurrency slot, waiting at most `timeout` seconds."""
+        give_up = time.time() + timeout
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                left = give_up - time.time()
+                if left <= 0:
+                    raise TimeoutError(f"LLM concurrency limit: no slot within {timeout:.0f}s")
+                self._cond.wait(left)
+            self._in_flight += 1
+
+    def _exit(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            self._limit = min(self.max_concurrency, self._limit + 1.0 / max(self._limit, 1.0))
+            self._cond.notify()
+
+    def on_rate_limited(self):
+        with self._cond:
+            self._limit = max(1.0, self._limit / 2)
+        self.drain()
+
+    @property
+    def concurrency(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, tokens: int = 1):
+        """Block until a concurrency slot and bucket budget are available."""
+        started = time.time()
+        max_wait = min(MAX_WAIT, remaining(MAX_WAIT))   # never wait past the node's deadline
+        self._enter(max_wait)
+        try:
+            while True:
+                wait = self._take(tokens)
+                if wait <= 0:
+                    break
+                if time.time() - started + wait > max_wait:
+                    raise TimeoutError(f"LLM rate limit: no budget within {max_wait:.0f}s")
+                time.sleep(min(wait, 5.0) + random.uniform(0, 0.05))
+        except Exception:
+            self._exit()
+            raise
+        if time.time() - started > 0.01:
+            self.count("wait_seconds", time.time() - started)
+
+    def release(self):
+        self._exit()
+
+    # ── Counters ──────────────────────────────────────────────
+    def count(self, name: str, amount: float = 1):
+        try:
+            self._conn().execute(
+                "INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount),
+            )
+        except sqlite3.Error:
+            pass
+
+
+class LimitedLLM:
+    """
+    Chat model wrapper: every invoke() goes through the shared limiter, with a timeout
+    (set on the model) and exponential backoff with full jitter on 429 / 5xx / timeouts.
+    Other attributes are passed through to the wrapped model.
+    """
+
+    def __init__(self, llm, limiter: SharedRateLimiter = None, max_retries: int = LLM_MAX_RETRIES):
+        self.llm = llm
+        self.limiter = limiter or get_rate_limiter()
+        self.max_retries = max_retries
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def invoke(self, messages, *args, **kwargs):
+        estimate = estimate_tokens(messages)
+        limiter = self.limiter
+        delay = 0.0
+        for attempt in range(self.max_retries + 1):
+            time.sleep(delay)   # backoff happens outside the concurrency slot
+            limiter.acquire(estimate)
+            limiter.count("requests")
+            try:
+                response = self.llm.invoke(messages, *args, **kwargs)
+            except Exception as e:
+                rate_limited = _is_rate_limit(e)
+                if rate_limited:
+                    limiter.count("rate_limited")
+                    limiter.on_rate_limited()
+                elif _is_timeout(e):
+                    limiter.count("timeouts")
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    limiter.count("failed")
+                    raise
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+                if delay >= remaining(BACKOFF_CAP + 1):
+                    limiter.count("failed")
+                    raise
+                limiter.count("retries")
+                log.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                continue
+            finally:
+                limiter.release()
+
+            limiter.on_success()
+            limiter.count("succeeded")
+            usage = getattr(response, "usage_metadata", None) or {}
+            if usage:
+                limiter.count("prompt_tokens", usage.get("input_tokens", 0))
+                limiter.count("output_tokens", usage.get("output_tokens", 0))
+                limiter._adjust_tokens(usage.get("total_tokens", estimate) - estimate)
+            return response
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> SharedRateLimiter:
+    """Process-wide limiter backed by the shared bucket database."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = SharedRateLimiter()
+        return _limiter
+
+
+def limited(llm, max_retries: int = LLM_MAX_RETRIES) -> LimitedLLM:
+    """Wrap a chat model so all its calls share the global RPM/TPM budget and retry policy."""
+    return LimitedLLM(llm, max_retries=max_retries)
+
+
+def stats(path: str = None) -> dict:
+    """Counters (all processes) plus this process's concurrency state, for the Monitor tab."""
+    try:
+        conn = _connect(path)
+        try:
+            rows = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            buckets = {name: (tokens, updated) for name, tokens, updated in conn.execute("SELECT * FROM buckets")}
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        rows, buckets = {}, {}
+    limiter = get_rate_limiter()
+    now = time.time()
+
+    def _available(name, capacity):
+        if name not in buckets:
+            return capacity
+        tokens, updated = buckets[name]
+        return min(capacity, tokens + (now - updated) * capacity / 60.0)
+
+    result = {name: rows.get(name, 0) for name in COUNTERS}
+    result.update({
+        "rpm_limit": limiter.rpm,
+        "tpm_limit": limiter.tpm,
+        "requests_available": _available("requests", limiter.rpm),
+        "tokens_available": _available("tokens", limiter.tpm),
+        "concurrency": limiter.concurrency,
+        "in_flight": limiter.in_flight,
+    })
+    return result
+
+
+def reset_stats(path: str = None):
+    conn = _connect(path)
+    try:
+        conn.execute("DELETE FROM counters")
+    finally:
+        conn.close()
+
+
+def enable_response_cache():
+    """Install the process-wide LangChain response cache once (no-op when LLM_CACHE_SIZE is 0)."""
+    global _cache_enabled
+    with _cache_lock:
+        if not _cache_enabled and LLM_CACHE_SIZE > 0:
+            set_llm_cache(InMemoryCache(maxsize=LLM_CACHE_SIZE))
+            _cache_enabled = True
@@ -0,0 +1,236 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from structured_log import get_logger
+from llm_limiter import limited, LIMITER_DB_PATH, LLM_TIMEOUT
+from resilience import get_breaker, CircuitOpenError, bounded_timeout, check_deadline
+
+# 按节点选择模型：抽取 / 分类类的简单任务用便宜快速的模型，COO 决策用更强的模型
+# 每个节点有一条回退链：主模型出错或近期延迟超过预算时，改用链上的下一个模型
+# 每个模型的调用次数、延迟、token 和费用记录在 cache/llm_limiter.db (Monitor 页读取)
+#
+# models.json (可选，覆盖默认配置)：
+# {
+#   "nodes": {"manager": {"models": ["gemini-pro-latest", "gemini-flash-latest"], "latency_budget": 20}},
+#   "prices": {"gemini-pro-latest": [1.25, 10.0]}
+# }
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_PATH = os.getenv("LLM_MODELS_PATH", os.path.join(BASE_PATH, "models.json"))
+
+FAST_MODEL = "gemini-flash-lite-latest"
+DEFAULT_MODEL = "gemini-flash-latest"
+STRONG_MODEL = "gemini-pro-latest"
+
+# node -> {"models": fallback chain, "temperature", "latency_budget": seconds}
+DEFAULT_NODES = {
+    "default":       {"models": [DEFAULT_MODEL, FAST_MODEL], "latency_budget": 20},
+    "manager":       {"models": [STRONG_MODEL, DEFAULT_MODEL], "latency_budget": 30},
+    "stock_manager": {"models": [DEFAULT_MODEL, FAST_MODEL], "latency_budget": 20},
+    "forecast":      {"models": [DEFAULT_MODEL, FAST_MODEL], "latency_budget": 20},
+    "pricing":       {"models": [FAST_MODEL, DEFAULT_MODEL], "latency_budget": 10},
+    "post_mortem":   {"models": [FAST_MODEL, DEFAULT_MODEL], "latency_budget": 10},
+    "executor":      {"models": [FAST_MODEL, DEFAULT_MODEL], "latency_budget": 10},
+    "quick_manager": {"models": [FAST_MODEL, DEFAULT_MODEL], "latency_budget": 5},
+    "receipts":      {"models": [DEFAULT_MODEL], "latency_budget": 30},
+}
+
+# USD per 1M tokens (input, output)
+DEFAULT_PRICES = {
+    FAST_MODEL: (0.10, 0.40),
+    DEFAULT_MODEL: (0.30, 2.50),
+    STRONG_MODEL: (1.25, 10.00),
+}
+
+EWMA_ALPHA = 0.3          # weight of the newest latency sample
+LATENCY_PROBE_AFTER = 300 # seconds; a skipped slow model is tried again after this
+FALLBACK_RETRIES = 1      # limiter retries per model before moving down the chain
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_stats (
+    model          TEXT PRIMARY KEY,
+    calls          INTEGER NOT NULL DEFAULT 0,
+    errors         INTEGER NOT NULL DEFAULT 0,
+    fallbacks      INTEGER NOT NULL DEFAULT 0,
+    latency_total  REAL NOT NULL DEFAULT 0,
+    prompt_tokens  INTEGER NOT NULL DEFAULT 0,
+    output_tokens  INTEGER NOT NULL DEFAULT 0,
+    cost_usd       REAL NOT NULL DEFAULT 0
+);
+"""
+
+log = get_logger("Model Router")
+
+_config_cache = {}
+_models = {}
+_latency = {}             # model -> (EWMA latency, last sample time) in this process
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def load_config(path: str = None) -> dict:
+    """{"nodes": {...}, "prices": {...}}: defaults merged with models.json (re-read when it changes)."""
+    path = path or MODELS_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {"nodes": DEFAULT_NODES, "prices": DEFAULT_PRICES}
+
+    with _lock:
+        cached = _config_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        nodes = {name: dict(cfg) for name, cfg in DEFAULT_NODES.items()}
+        for name, cfg in raw.get("nodes", {}).items():
+            nodes[name] = {**nodes.get(name, nodes["default"]), **cfg}
+        prices = {**DEFAULT_PRICES, **{m: tuple(p) for m, p in raw.get("prices", {}).items()}}
+        config = {"nodes": nodes, "prices": prices}
+        _config_cache[path] = (mtime, config)
+        return config
+
+
+def node_config(node: str) -> dict:
+    nodes = load_config()["nodes"]
+    return {"temperature": 0, **nodes.get(node, nodes["default"])}
+
+
+def _chat_model(model: str, temperature: float, timeout: float):
+    key = (model, temperature, timeout)
+    with _lock:
+        if key not in _models:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            _models[key] = limited(
+                ChatGoogleGenerativeAI(model=model, temperature=temperature, timeout=timeout, max_retries=0),
+                max_retries=FALLBACK_RETRIES,
+            )
+        return _models[key]
+
+
+# ── Stats ─────────────────────────────────────────────────────
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LIMITER_DB_PATH), exist_ok=True)
+        conn = _local.conn = sqlite3.connect(LIMITER_DB_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+    return conn
+
+
+def cost_of(model: str, prompt_tokens: int, output_tokens: int) -> float:
+    price_in, price_out = load_config()["prices"].get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+def recent_latency(model: str):
+    """EWMA latency of the model, or None when unknown or older than LATENCY_PROBE_AFTER."""
+    entry = _latency.get(model)
+    if not entry or time.time() - entry[1] > LATENCY_PROBE_AFTER:
+        return None
+    return entry[0]
+
+
+def record(model: str, latency: float = 0.0, usage: dict = None, error: bool = False,
+           fallback: bool = False, called: bool = True):
+    """Add one call (or a skip, called=False) to the model's cumulative stats."""
+    usage = usage or {}
+    prompt_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    if called:
+        # 失败的调用也计入延迟 (超时正是最需要回避的情况)
+        with _lock:
+            previous = _latency.get(model)
+            ewma = latency if previous is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * previous[0]
+            _latency[model] = (ewma, time.time())
+    try:
+        _conn().execute(
+            "INSERT INTO model_stats (model) VALUES (?) ON CONFLICT(model) DO NOTHING", (model,)
+        )
+        _conn().execute(
+            "UPDATE model_stats SET calls = calls + ?, errors = errors + ?, fallbacks = fallbacks + ?, "
+            "latency_total = latency_total + ?, prompt_tokens = prompt_tokens + ?, "
+            "output_tokens = output_tokens + ?, cost_usd = cost_usd + ? WHERE model = ?",
+            (int(called), int(error), int(fallback), latency, prompt_tokens, output_tokens,
+             cost_of(model, prompt_tokens, output_tokens), model),
+        )
+    except sqlite3.Error:
+        pass
+
+
+def model_stats() -> list:
+    """Per-model rows for the Monitor tab (all processes)."""
+    rows = _conn().execute("SELECT * FROM model_stats ORDER BY cost_usd DESC").fetchall()
+    return [
+        {
+            "model": r[0], "calls": r[1], "errors": r[2], "fallbacks": r[3],
+            "avg_latency_s": round(r[4] / r[1], 2) if r[1] else None,
+            "recent_latency_s": round(_latency[r[0]][0], 2) if r[0] in _latency else None,
+            "prompt_tokens": r[5], "output_tokens": r[6], "cost_usd": round(r[7], 4),
+        }
+        for r in rows
+    ]
+
+
+# ── Routing ───────────────────────────────────────────────────
+class NodeLLM:
+    """
+    Chat model for one graph node. invoke() tries the node's models in order, skipping
+    a model whose recent latency exceeds the node's budget (unless it is the last one)
+    and falling back to the next model when a call fails.
+    """
+
+    def __init__(self, node: str):
+        self.node = node
+
+    def invoke(self, messages, *args, **kwargs):
+        cfg = node_config(self.node)
+        chain = cfg["models"]
+        budget = cfg.get("latency_budget")
+        last_error = None
+        for i, model in enumerate(chain):
+            is_last = i == len(chain) - 1
+            breaker = get_breaker(f"llm:{model}")
+            if not breaker.allow():
+                # 熔断中的模型直接跳过 (全部熔断时立即失败，不等超时)
+                last_error = CircuitOpenError(f"{model} unavailable (circuit open)")
+                record(model, fallback=not is_last, called=False)
+                continue
+            recent = recent_latency(model)
+            if budget and recent and recent > budget and not is_last:
+                log.info(f"[{self.node}] Skipping {model} (recent latency {recent:.1f}s > {budget}s)")
+                record(model, fallback=True, called=False)
+                continue
+
+            # The call itself ends by the node's deadline (whole seconds keep the model cache small)
+            check_deadline(f"calling {model}")
+            timeout = math.ceil(bounded_timeout(cfg.get("timeout", LLM_TIMEOUT)))
+            started = time.time()
+            try:
+                response = breaker.call(
+                    _chat_model(model, cfg["temperature"], timeout).invoke,
+                    messages, *args, **kwargs
+                )
+            except Exception as e:
+                last_error = e
+                record(model, time.time() - started, error=True, fallback=not is_last)
+                if not is_last:
+                    log.warning(f"[{self.node}] {model} failed ({type(e).__name__}), falling back to {chain[i + 1]}")
+                continue
+
+            record(model, time.time() - started, getattr(response, "usage_metadata", None))
+            return response
+        raise last_error or RuntimeError(f"No model available for node '{self.node}'")
+
+
+_node_llms = {}
+
+
+def get_llm(node: str) -> NodeLLM:
+    """Shared NodeLLM for a node name (see DEFAULT_NODES / models.json)."""
+    with _lock:
+        if node not in _node_llms:
+            _node_llms[node] = NodeLLM(node)
+        return _node_llms[node]
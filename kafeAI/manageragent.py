@@ -1,15 +1,13 @@
 ﻿import os
-import operator
-import requests
 import json
 import datetime
-from typing import Annotated, TypedDict, List
+import time
+from typing import Annotated, TypedDict, List, Dict
 from dotenv import load_dotenv
 
 # 导入 LangGraph 和 LangChain 组件
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 
 # 1. 加载配置
@@ -20,100 +18,105 @@ from post_mortem_agent import post_mortem_agent
 from forecasting_agent import forecasting_agent
 from dynamic_pricing_agent import dynamic_pricing_agent
 from poster_agent import poster_agent
+from recipe_bom import project_stockouts, projection_table, add_orders, STOCKOUT_HORIZON
+from structured_log import get_logger
+from llm_limiter import enable_response_cache
+from llm_models import get_llm
+from resilience import run_guarded, check_deadline
+from weather_forecast import tomorrow
+from agent_reports import merge_reports, report, context_text, text_of, update_text, ERROR
+from agent_routing import route_for
+import tenants
+
+log_router = get_logger("Router")
+log_manager = get_logger("Manager Performance")
+log_rl = get_logger("RL System")
+log_predictor = get_logger("Predictor")
+log_inventory = get_logger("Inventory Steward")
+log_executor = get_logger("Order Executor")
 
 # 2. 定义状态结构
+# 每个 Agent 写自己的通道 (见 agent_reports.py)：reports[node] 是可读报告，其余是结构化数据
 class AgentState(TypedDict):
     issue: str
-    context: Annotated[List[str], operator.add]
+    history: str # Recent messages of the chat this run answers (conversation_store), "" otherwise
+    reports: Annotated[Dict[str, dict], merge_reports] # node -> {"status", "text"}, one entry per node
     decision: str
     feedback: str # 用户反馈
     promotion_data: dict
     poster_path: str
     target_date: str # NEW: For tracking prediction date in RL
+    tenant_id: str # Which location's data this run reads and writes (see tenants.py)
+    deadline: float # Epoch seconds by which the current phase must finish (see resilience.py)
+    weather: dict # Structured forecast for target_date (used by the pricing triggers)
+    financials: dict # post_mortem: yesterday's P&L figures and calibration notes
+    sales_forecast: dict # forecast: expected gross for target_date and the recent daily history
+    stock: dict # stock_manager: {"projection": recipe_bom.project_stockouts() rows}
+    execution: dict # executor: {"orders": [...], "updates": [...]}
     routing_mode: str # Added: "full" or "single"
-    target_node: str  # Added: The node to jump to
+    target_nodes: List[str]  # Nodes to jump to (several @mentions run in parallel)
 
 # 3. 初始化 Gemini (使用你之前验证成功的名称)
-llm = ChatGoogleGenerativeAI(model="gemini-flash-latest", temperature=0)
+# 每个节点的模型和回退链见 llm_models (get_llm)；所有调用共用 llm_limiter 的限流器和响应缓存
+enable_response_cache()
 
 # --- 定义 Agent 节点 ---
 
 # 预测 Agent：接入真实天气 API
 def prediction_agent(state: AgentState):
-    api_key = os.getenv("WEATHER_API_KEY")
-    city = os.getenv("CITY", "Sundsvall")
-    
-    # 获取预报数据 (forecast.json)
-    url = f"http://api.weatherapi.com/v1/forecast.json?key={api_key}&q={city}&days=2&aqi=no"
+    city = tenants.get_tenant()["city"]
     
     try:
-        response = requests.get(url)
-        data = response.json()
-        
-        # 提取明天（index 1）的预报，因为餐饮业通常为明天做决策
-        forecast = data['forecast']['forecastday'][1]['day']
-        condition = forecast['condition']['text']
-        rain_chance = forecast['daily_chance_of_rain']
-        avg_temp = forecast['avgtemp_c']
-        
-        weather_info = f"Forecast for tomorrow in {city}: {condition}, {avg_temp}°C. Rain Chance: {rain_chance}%."
+        # 提取明天的预报，因为餐饮业通常为明天做决策
+        target_date, weather = tomorrow(city)
+        weather_info = (f"Forecast for tomorrow in {city}: {weather['condition']}, {weather['avg_temp_c']}°C. "
+                        f"Rain Chance: {weather['rain_chance']}%.")
         
         # 基础节日逻辑
         event_info = "No major local events scheduled."
         # 如果需要恢复活动，取消下面这行的注释
         # event_info = "Local Event: Music Festival happening tomorrow."
         
-        target_date = data['forecast']['forecastday'][1]['date']
-        
-        return {
-            "context": [f"Predictor: {weather_info} | {event_info}"],
-            "target_date": target_date
-        }
+        return report("predictor", f"{weather_info} | {event_info}", target_date=target_date, weather=weather)
     except Exception as e:
-        return {"context": [f"Predictor Error: Failed to fetch weather. {str(e)}"]}
+        log_predictor.error(f"Failed to fetch weather. {str(e)}")
+        return report("predictor", f"Failed to fetch weather. {str(e)}", status=ERROR)
 
 # 库存 Agent：关联 Menu.md 和 stock.json
 def inventory_agent(state: AgentState):
     # 1. 加载库存数据
-    # 注意：根据 list_dir 结果，这些文件在父目录 d:\2026\kafeAI v2\ 下
-    # 但是在运行脚本时，路径取决于工作目录。
-    # 这里我们使用绝对路径或者相对路径（如果是在根目录运行）
-    # 既然 manageragent.py 在 d:\2026\kafeAI v2\kafeAI\ 下
-    # 而 Menu.md 在 d:\2026\kafeAI v2\ 下
-    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    menu_path = os.path.join(base_path, "Menu.md")
-    stock_path = os.path.join(base_path, "stock.json")
-
+    # 库存、目标库存与日均消耗由配方 BOM 计算 (recipe_bom)，不再把整份菜单交给 LLM 估算
     try:
-        with open(menu_path, 'r', encoding='utf-8') as f:
-            menu_content = f.read()
-        with open(stock_path, 'r', encoding='utf-8') as f:
-            stock_data = json.load(f)
+        projection = project_stockouts()
     except Exception as e:
-        return {"context": [f"Inventory Error: Failed to load data. {str(e)}"]}
+        log_inventory.error(f"Failed to load data. {str(e)}")
+        return report("stock_manager", f"Failed to load data. {str(e)}", status=ERROR)
+
+    # 单点提问 (@stock) 由 quick_manager 直接根据预测表回答，不需要 LLM 分析
+    if state.get("routing_mode") == "single":
+        return report("stock_manager", projection_table(projection), stock={"projection": projection})
 
     # 2. 结合预测背景进行分析
-    forecast_context = "\n".join(state["context"])
+    forecast_context = context_text(state)
     
     system_prompt = (
         "You are the Inventory Steward for kafeAI. "
         "Your goal is to analyze current stock against the menu and storage targets. "
         "CRITICAL: YOUR REPORT MUST BE IN ENGLISH ONLY.\n\n"
         "Data provided:\n"
-        "- Menu & Target Storage: (See text below)\n"
-        "- Current Stock: (See JSON below)\n"
+        "- Stock Projection: current quantity, storage target, average daily usage computed from "
+        "sales and recipes, and projected days until stockout (⚠️ = within "
+        f"{STOCKOUT_HORIZON} days)\n"
         "- External Context: (Weather, events, etc.)\n\n"
-        "Menu & Target Storage Content:\n"
-        f"{menu_content}\n\n"
-        "Current Stock JSON:\n"
-        f"{json.dumps(stock_data, indent=2)}\n\n"
+        "Stock Projection:\n"
+        f"{projection_table(projection)}\n\n"
         "Your report should be concise but professional, highlighting:\n"
-        "1. Critical shortages (Current < Target or expected high demand)\n"
+        "1. Critical shortages (Current < Target, projected stockouts or expected high demand)\n"
         "2. Recommended replenishment amounts\n"
         "3. Strategy adjustments based on the forecast provided."
     )
     
-    response = llm.invoke([
+    response = get_llm("stock_manager").invoke([
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"Analyze current situation based on context:\n{forecast_context}")
     ])
@@ -123,15 +126,14 @@ def inventory_agent(state: AgentState):
     if isinstance(res_text, list):
         res_text = "".join([c.get("text", "") if isinstance(c, dict) else str(c) for c in res_text])
     
-    return {"context": [f"Inventory Steward Analysis:\n{res_text}"]}
+    return report("stock_manager", res_text, stock={"projection": projection})
 
 # 决策中枢 Manager Agent
 def manager_agent(state: AgentState):
-    context_str = "\n".join(state["context"])
+    context_str = context_text(state)
     
     # --- RAG Retrieval: Continuous RL ---
-    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    memory_path = os.path.join(base_path, "memory.json")
+    memory_path = tenants.data_path("memory.json")
     lessons_learned = ""
     
     if os.path.exists(memory_path):
@@ -161,7 +163,9 @@ def manager_agent(state: AgentState):
     )
     
     start_time = datetime.datetime.now()
-    response = llm.invoke([
+    if state.get("history"):
+        context_str = f"Recent conversation with the owner:\n{state['history']}\n\n{context_str}"
+    response = get_llm("manager").invoke([
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"Current Context:\n{context_str}")
     ])
@@ -171,7 +175,7 @@ def manager_agent(state: AgentState):
     # 简单的 Token 估算 (或使用 response.response_metadata)
     usage = response.response_metadata.get("usage_metadata", {}) if hasattr(response, "response_metadata") else {}
     token_log = f"Latency: {latency:.2f}s | Tokens: {usage}"
-    print(f"\n[Manager Performance]: {token_log}")
+    log_manager.info(token_log)
     
     # 强制提取纯文本，过滤掉签名元数据
     res_text = response.content
@@ -183,8 +187,7 @@ def manager_agent(state: AgentState):
 # 自动化下单 Agent：执行决策并更新库存
 def order_execution_agent(state: AgentState):
     decision = state.get("decision", "")
-    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    stock_path = os.path.join(base_path, "stock.json")
+    stock_path = tenants.data_path("stock.json")
     
     # 加载现有库存以供 LLM 参考 key
     with open(stock_path, 'r', encoding='utf-8') as f:
@@ -201,7 +204,7 @@ def order_execution_agent(state: AgentState):
         "\n\nOutput format example: [{\"item\": \"sallad\", \"amount_to_add\": 10}]"
     )
     
-    response = llm.invoke([
+    response = get_llm("executor").invoke([
         SystemMessage(content=system_prompt),
         HumanMessage(content=f"Decision to parse:\n{decision}")
     ])
@@ -216,38 +219,13 @@ def order_execution_agent(state: AgentState):
         orders = json.loads(content)
         
         if not orders:
-            return {"context": ["Order Execution: No items to order based on decision."]}
+            return report("executor", "No items to order based on decision.", execution={"orders": [], "updates": []})
         
-        # 加载并更新库存
-        with open(stock_path, 'r', encoding='utf-8') as f:
-            stock_data = json.load(f)
-        
-        updates = []
-        for order in orders:
-            item_name = order['item'].lower()
-            amount = order['amount_to_add']
-            found = False
-            for entry in stock_data['inventory']:
-                if entry['item'].lower() == item_name:
-                    try:
-                        entry['quantity'] += int(amount)
-                    except (ValueError, TypeError):
-                        updates.append(f"{item_name} (Invalid amount: {amount})")
-                        continue
-                    updates.append(f"{item_name} (+{amount})")
-                    found = True
-                    break
-            if not found:
-                # 如果没找到，可以选择新增或忽略，这里暂定记录 log
-                updates.append(f"{item_name} (New item, ignored for safety)")
-
-        # 保存更新后的库存
-        stock_data['metadata']['last_updated'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(stock_path, 'w', encoding='utf-8') as f:
-            json.dump(stock_data, f, indent=4, ensure_ascii=False)
+        # 加载并更新库存 (与日报扣减共用同一把锁，原子写入)
+        updates = add_orders(orders, stock_path)
             
         # --- Recording Episode for RL ---
-        memory_path = os.path.join(base_path, "memory.json")
+        memory_path = tenants.data_path("memory.json")
         target_date = state.get("target_date")
         if target_date and os.path.exists(memory_path):
             try:
@@ -258,7 +236,7 @@ def order_execution_agent(state: AgentState):
                 existing = next((ep for ep in mem_db["episodes"] if ep["date"] == target_date), None)
                 if not existing:
                     # 简化 stored context，只取 predictor 的部分
-                    prediction_summary = next((c for c in state["context"] if "Predictor:" in c), "Unknown Context")
+                    prediction_summary = text_of(state, "predictor", "Unknown Context")
                     
                     new_episode = {
                         "date": target_date,
@@ -273,68 +251,119 @@ def order_execution_agent(state: AgentState):
                     if len(mem_db["episodes"]) > 60:
                         mem_db["episodes"] = mem_db["episodes"][-60:]
 
+                    check_deadline("episode recording")
                     with open(memory_path, 'w', encoding='utf-8') as mf:
                         json.dump(mem_db, mf, indent=2, ensure_ascii=False)
-                    print(f"[RL System]: Recorded new episode for {target_date}")
+                    log_rl.info(f"Recorded new episode for {target_date}")
             except Exception as ex:
-                print(f"[RL System Error]: Failed to record episode. {str(ex)}")
+                log_rl.error(f"Failed to record episode. {str(ex)}")
 
-        return {"context": [f"Order Execution Successful: Updated {', '.join(updates)}"]}
+        log_executor.info(f"Updated {', '.join(updates)}")
+        return report("executor", f"Successful: Updated {', '.join(updates)}",
+                      execution={"orders": orders, "updates": updates})
     except Exception as e:
-        return {"context": [f"Order Execution Error: {str(e)}"]}
+        log_executor.error(str(e))
+        return report("executor", str(e), status=ERROR)
 
 # --- On-demand Routing & Quick Response ---
 
+# @mention 路由在 agent_routing.py (客户端不加载整个图也能判断)
+
 def router_node(state: AgentState):
     """
     Analyzes the 'issue' (user input) for @mentions.
     If @AgentName is found, it sets routing_mode to 'single'.
     """
-    import re
-    issue = state.get("issue", "")
-    
-    # Mapping of user mentions to actual graph node IDs
-    agent_map = {
-        "weather": "predictor",
-        "stock": "stock_manager",
-        "inventory": "stock_manager",
-        "finance": "post_mortem",
-        "report": "post_mortem",
-        "forecast": "forecast",
-        "pricing": "pricing",
-        "creative": "creative",
-        "poster": "creative"
-    }
-    
-    match = re.search(r"@(\w+)", issue)
-    if match:
-        name = match.group(1).lower()
-        if name in agent_map:
-            target = agent_map[name]
-            print(f"[Router]: Detected @{name}, routing to {target} (Single Mode)")
-            return {
-                "routing_mode": "single",
-                "target_node": target
-            }
-            
-    print("[Router]: No @mention detected, proceeding with Full Report Mode")
+    mode, targets = route_for(state.get("issue", ""))
+    if mode == "single":
+        log_router.info(f"Detected @mention, routing to {', '.join(targets)} (Single Mode)")
+    else:
+        log_router.info("No @mention detected, proceeding with Full Report Mode")
     return {
-        "routing_mode": "full",
-        "target_node": "post_mortem"
+        "routing_mode": mode,
+        "target_nodes": targets
     }
 
+def _weather_answer(state: AgentState):
+    """Direct answer from the predictor's structured forecast (no LLM)."""
+    weather = state.get("weather")
+    if not weather:
+        return None
+    line = (
+        f"🌤️ {weather['city']} on {state.get('target_date', 'tomorrow')}: {weather['condition']}, "
+        f"{weather['avg_temp_c']}°C (min {weather.get('min_temp_c')}°C), "
+        f"rain {weather['rain_chance']}%, snow {weather.get('snow_chance', 0)}%."
+    )
+    if weather["rain_chance"] >= 60:
+        line += " Expect fewer walk-ins and no terrace traffic."
+    return line
+
+def _stock_answer(state: AgentState):
+    """Direct answer from the stock projection: items named in the question, else those at risk or below target."""
+    rows = (state.get("stock") or {}).get("projection")
+    if rows is None:
+        return None
+    issue = state.get("issue", "").lower()
+    asked = [r for r in rows if r["item"].lower() in issue]
+    shown = asked or [r for r in rows if r["at_risk"] or (r.get("target") and r["quantity"] < r["target"])]
+    if not shown:
+        return f"📦 All {len(rows)} stock items are at target and covered for the next {STOCKOUT_HORIZON} days."
+
+    lines = ["📦 Stock" + ("" if asked else " needing attention") + ":"]
+    for r in shown:
+        days = "no recent usage" if r["days_left"] is None else f"~{r['days_left']:g} days left"
+        target = f" / target {r['target']:g}" if r.get("target") else ""
+        flag = "⚠️ " if r["at_risk"] else ""
+        lines.append(f"- {flag}{r['item']}: {r['quantity']:g} {r['unit']}{target} ({days})")
+    return "\n".join(lines)
+
+# 可以不经 LLM 直接回答的节点
+DIRECT_ANSWERS = {
+    "predictor": _weather_answer,
+    "stock_manager": _stock_answer,
+}
+
+QUICK_PROMPT = (
+    "You are kafeAI's assistant for a restaurant in Sweden. "
+    "Answer the owner's question in at most 4 short sentences, using only the data given. "
+    "No headings, no report format."
+)
+
 def quick_manager(state: AgentState):
-    """A wrapper for manager_agent that bypasses HITL for quick questions."""
-    # We can reuse the same manager logic, or adjust the prompt for 'Quick Answer' mode
-    res = manager_agent(state)
-    return res
+    """
+    Quick-answer mode for @mentions (no HITL, no lesson retrieval); joins the outputs of all
+    mentioned nodes. A single node with structured output is answered directly; otherwise
+    the direct parts are followed by one short LLM answer over all node outputs.
+    """
+    targets = state.get("target_nodes") or []
+    parts = [DIRECT_ANSWERS[t](state) for t in targets if t in DIRECT_ANSWERS]
+    parts = [p for p in parts if p]
+    if len(targets) == 1 and parts:
+        return {"decision": parts[0]}
+
+    node_outputs = context_text(state, targets)
+    history = f"Recent conversation:\n{state['history']}\n\n" if state.get("history") else ""
+    start_time = time.time()
+    response = get_llm("quick_manager").invoke([
+        SystemMessage(content=QUICK_PROMPT),
+        HumanMessage(content=f"{history}Question: {state.get('issue', '')}\n\nData:\n{node_outputs}")
+    ])
+    log_manager.info(f"Quick answer latency ({len(targets)} nodes): {time.time() - start_time:.2f}s")
+
+    res_text = response.content
+    if isinstance(res_text, list):
+        res_text = "".join([c.get("text", "") if isinstance(c, dict) else str(c) for c in res_text])
+    return {"decision": "\n\n".join(parts + [res_text])}
 
 def route_to_target(state: AgentState):
-    """Entry point routing logic."""
-    return state.get("target_node", "post_mortem")
+    """Entry point routing logic. Several targets fan out and run in parallel in the same step."""
+    return state.get("target_nodes") or ["post_mortem"]
 
 def next_step_logic(state: AgentState, current_node: str, default_next: str):
-    """Decides whether to continue the full chain or jump to mini_manager."""
+    """
+    Decides whether to continue the full chain or jump to quick_manager.
+    Parallel single-mode branches all end here in the same step, so quick_manager runs once.
+    """
     if state.get("routing_mode") == "single":
         return "quick_manager"
     return default_next
@@ -343,19 +372,29 @@ def next_step_logic(state: AgentState, current_node: str, default_next: str):
 
 
 
+def guarded_node(name: str, fn):
+    """
+    Run a node inside the tenant scope of the run (state["tenant_id"]) with its time budget;
+    a node that times out or fails degrades instead of stalling the run (see resilience.py).
+    """
+    def _node(state: AgentState):
+        with tenants.tenant_scope(state.get("tenant_id")) as tenant:
+            return run_guarded(name, fn, state, tenant["id"])
+    return _node
+
 workflow = StateGraph(AgentState)
 
 # Nodes
-workflow.add_node("router", router_node) # Entry point
-workflow.add_node("post_mortem", lambda state: post_mortem_agent(state, llm))
-workflow.add_node("forecast", lambda state: forecasting_agent(state, llm))
-workflow.add_node("predictor", prediction_agent)
-workflow.add_node("stock_manager", inventory_agent)
-workflow.add_node("pricing", dynamic_pricing_agent)
-workflow.add_node("creative", poster_agent)
-workflow.add_node("manager", manager_agent) # Full report manager (HITL)
-workflow.add_node("quick_manager", quick_manager) # Quick response manager (Auto)
-workflow.add_node("executor", order_execution_agent)
+workflow.add_node("router", guarded_node("router", router_node)) # Entry point
+workflow.add_node("post_mortem", guarded_node("post_mortem", lambda state: post_mortem_agent(state, get_llm("post_mortem"))))
+workflow.add_node("forecast", guarded_node("forecast", lambda state: forecasting_agent(state, get_llm("forecast"))))
+workflow.add_node("predictor", guarded_node("predictor", prediction_agent))
+workflow.add_node("stock_manager", guarded_node("stock_manager", inventory_agent))
+workflow.add_node("pricing", guarded_node("pricing", dynamic_pricing_agent))
+workflow.add_node("creative", guarded_node("creative", poster_agent))
+workflow.add_node("manager", guarded_node("manager", manager_agent)) # Full report manager (HITL)
+workflow.add_node("quick_manager", guarded_node("quick_manager", quick_manager)) # Quick response manager (Auto)
+workflow.add_node("executor", guarded_node("executor", order_execution_agent))
 
 # Routing - Entry
 workflow.set_entry_point("router")
@@ -384,20 +423,28 @@ app = workflow.compile(
     interrupt_before=["manager"]
 )
 
+def release_thread(thread_id: str):
+    """Drop the checkpoints of a finished run (chat requests use a fresh thread each, see conversation_store)."""
+    if hasattr(checkpointer, "delete_thread"):
+        checkpointer.delete_thread(thread_id)
+    else:
+        checkpointer.storage.pop(thread_id, None)
+
 # --- 运行执行 ---
 
 if __name__ == "__main__":
     print(f"--- kafeAI v3.0: HITL & Order Loop Enabled ---")
     config = {"configurable": {"thread_id": "1"}}
-    inputs = {"issue": "Weekend Strategy", "context": [], "feedback": ""}
-    
+    inputs = {"issue": "Weekend Strategy", "feedback": ""}
+
     try:
         # 第一阶段：运行到中断点 (manager 之前)
         print("\n[Running Phase 1: Gathering inputs...]")
         for output in app.stream(inputs, config=config):
             for node_name, content in output.items():
-                if "context" in content:
-                    print(f"Node {node_name} Update: {content['context'][-1]}")
+                text = update_text(node_name, content)
+                if text:
+                    print(f"Node {node_name} Update: {text}")
 
         # 模拟人类在环操作
         print("\n" + "="*50)
@@ -405,8 +452,7 @@ if __name__ == "__main__":
         print("="*50)
         snapshot = app.get_state(config)
         
-        current_context = snapshot.values.get('context', [])
-        analysis = current_context[-1] if current_context else "No analysis available yet."
+        analysis = text_of(snapshot.values, "stock_manager", "No analysis available yet.")
         print(f"Current Analysis Context:\n{analysis}")
         
         # Display Promotion Details
@@ -427,17 +473,17 @@ if __name__ == "__main__":
         # 第二阶段：更新状态并继续运行
         print("\n[Running Phase 2: Finalizing decision and execution...]")
         if user_input:
-            # 注入人类反馈到 context 中
-            app.update_state(config, {"context": [f"Human Feedback: {user_input}"]}, as_node="stock_manager")
-        
+            # 人类反馈写入 feedback 通道 (manager 的 prompt 会带上)；以 creative 身份写入，恢复后直接进入 manager
+            app.update_state(config, {"feedback": user_input}, as_node="creative")
+
         for output in app.stream(None, config=config):
             for node_name, content in output.items():
                 print(f"\n[Node: {node_name}]")
                 if node_name == "manager":
                     decision = content['decision']
                     print(f"COO'S DECISION:\n{decision}")
-                elif "context" in content:
-                    print(f"Update: {content['context'][-1]}")
+                elif update_text(node_name, content):
+                    print(f"Update: {update_text(node_name, content)}")
                     
     except Exception as e:
         print(f"\n[System Error]: {e}")
@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+import tenants
+
+# Menu.md 的结构化模型：分区 / 菜品 / 价格 / 配方 / 目标库存 (## Storage)
+# 按文件 mtime 缓存，同一进程内的库存、定价、配方 BOM 和分析页共享同一份解析结果 (每个门店一份)
+
+STORAGE_SECTION = "Storage"
+
+_PRICE_RE = re.compile(r"\s*(\d+(?:[.,]\d+)?)\s*kr\s*$", re.IGNORECASE)
+_RECIPE_RE = re.compile(r"^(?P<name>[^(]+?)\s*\((?P<recipe>[^)]*)\)\s*$")
+_STORAGE_RE = re.compile(r"^(?P<item>.+?)\s+(?P<qty>\d+(?:[.,]\d+)?)\s*(?P<unit>\S+)\s*$")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class MenuModel:
+    """
+    Parsed Menu.md.
+      sections: {name: {"price": float|None, "items": [item names]}}  (menu order)
+      items:    [{"name", "section", "price", "recipe": [tokens]}]
+      storage:  {stock_item: {"target": float, "unit": str}}
+    """
+
+    def __init__(self, sections: dict, items: list, storage: dict):
+        self.sections = sections
+        self.items = items
+        self.storage = storage
+        self._by_name = {it["name"].lower(): it for it in items}
+
+    def item(self, name: str):
+        """Exact (case-insensitive) item lookup, then a unique substring match."""
+        if not name:
+            return None
+        key = name.strip().lower()
+        if key in self._by_name:
+            return self._by_name[key]
+        matches = [it for k, it in self._by_name.items() if key in k or k in key]
+        return matches[0] if len(matches) == 1 else None
+
+    def price(self, name: str):
+        it = self.item(name)
+        return it["price"] if it else None
+
+    def section_items(self, section: str) -> list:
+        """Items of a section (case-insensitive section name)."""
+        key = (section or "").strip().lower()
+        return [it for it in self.items if (it["section"] or "").lower() == key]
+
+    def target(self, stock_item: str):
+        """(target, unit) from the Storage section, or None."""
+        entry = self.storage.get(stock_item)
+        if entry is None:
+            lower = stock_item.lower()
+            entry = next((v for k, v in self.storage.items() if k.lower() == lower), None)
+        return (entry["target"], entry["unit"]) if entry else None
+
+    def price_list(self) -> str:
+        """Compact 'Section: item price, ...' text for prompts."""
+        lines = []
+        for section, info in self.sections.items():
+            if section == STORAGE_SECTION or not info["items"]:
+                continue
+            entries = ", ".join(f"{name} {self._by_name[name.lower()]['price']:g}kr"
+                                for name in info["items"] if self._by_name[name.lower()]["price"] is not None)
+            lines.append(f"{section}: {entries}")
+        return "\n".join(lines)
+
+
+def _split_price(text: str):
+    m = _PRICE_RE.search(text)
+    if not m:
+        return text.strip(), None
+    return text[:m.start()].strip(), float(m.group(1).replace(",", "."))
+
+
+def parse_menu(text: str) -> MenuModel:
+    """
+    Parse Menu.md text. Sections with a price and a comma list
+    ("## Wrap 109kr" + "Crispy chicken, Lax") become one item per variant;
+    a priced section without items ("## Räkmacka 109kr") is an item itself.
+    """
+    sections, items, storage = {}, [], {}
+    section, section_price = None, None
+
+    def _add(name, price, recipe):
+        items.append({"name": name, "section": section, "price": price, "recipe": recipe})
+        sections[section]["items"].append(name)
+
+    def _close_section():
+        if section and section_price is not None and not sections[section]["items"]:
+            _add(section, section_price, [])
+
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line == "---":
+            continue
+        if line.startswith("#"):
+            _close_section()
+            section, section_price = _split_price(line.lstrip("#").strip())
+            sections.setdefault(section, {"price": section_price, "items": []})
+            continue
+        if section is None:
+            continue
+        if section == STORAGE_SECTION:
+            m = _STORAGE_RE.match(line)
+            if m:
+                storage[m.group("item").strip()] = {
+                    "target": float(m.group("qty").replace(",", ".")),
+                    "unit": m.group("unit"),
+                }
+            continue
+
+        body, price = _split_price(line)
+        if price is None and section_price is not None and "," in body:
+            for variant in body.split(","):
+                variant = variant.strip()
+                if variant:
+                    _add(f"{section} {variant}", section_price, [variant])
+            continue
+
+        m = _RECIPE_RE.match(body)
+        name = m.group("name").strip() if m else body
+        recipe = [t.strip() for t in m.group("recipe").split("+") if t.strip()] if m else []
+        _add(name, price if price is not None else section_price, recipe)
+    _close_section()
+    return MenuModel(sections, items, storage)
+
+
+def get_menu(menu_path: str = None) -> MenuModel:
+    """Shared parsed menu of the current tenant, re-parsed only when Menu.md's mtime changes."""
+    menu_path = menu_path or tenants.data_path("Menu.md")
+    try:
+        mtime = os.stat(menu_path).st_mtime_ns
+    except FileNotFoundError:
+        return MenuModel({}, [], {})
+
+    with _cache_lock:
+        cached = _cache.get(menu_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(menu_path, "r", encoding="utf-8") as f:
+            model = parse_menu(f.read())
+        _cache[menu_path] = (mtime, model)
+        return model
@@ -0,0 +1,371 @@
+import os
+import time
+import random
+import sqlite3
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from structured_log import get_logger
+
+# Twilio 发送队列：回复先写入本地 SQLite 发件箱 (cache/outbox.db)，再由后台调度线程发送
+# - 按段落拆分长消息 (不在单词或 emoji 中间截断)
+# - 同一收件人按顺序发送；不同收件人并行发送，总速率受 OUTBOX_MPS 限制
+# - 429 / 5xx / 网络错误：指数退避 + 随机抖动重试；进程崩溃后未发送的消息在重启时继续发送
+# - Twilio 的状态回调 (StatusCallback) 更新 delivered / failed 等状态
+#
+# TWILIO_API_BASE: Twilio REST 地址 (测试时可指向本地的假 Twilio 服务)
+# TWILIO_STATUS_CALLBACK_URL: 公网可访问的 /twilio/status 地址 (可选)
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", os.path.join(BASE_PATH, "cache", "outbox.db"))
+
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com").rstrip("/")
+STATUS_CALLBACK_URL = os.getenv("TWILIO_STATUS_CALLBACK_URL")
+
+MAX_CHARS = 1500          # per message (Twilio's WhatsApp/SMS body limit is 1600)
+OUTBOX_MPS = float(os.getenv("OUTBOX_MPS", "10"))          # messages per second, all recipients
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))     # recipients sent to in parallel
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 2.0        # seconds, doubled per attempt
+BACKOFF_CAP = 300.0
+SEND_TIMEOUT = 15         # seconds per HTTP request
+STALE_SENDING = 120       # a "sending" row older than this was left by a dead process
+POLL_INTERVAL = 5.0       # seconds; enqueue() wakes the dispatcher immediately
+
+# Twilio statuses after which nothing more happens to the message
+FINAL_STATUSES = ("delivered", "read", "undelivered", "failed", "canceled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient       TEXT NOT NULL,
+    sender          TEXT NOT NULL,
+    body            TEXT NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'queued',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    sid             TEXT,
+    error           TEXT,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_pending ON messages(status, recipient, id);
+CREATE INDEX IF NOT EXISTS idx_outbox_sid ON messages(sid);
+"""
+
+log = get_logger("Outbox")
+
+
+class SendError(RuntimeError):
+    def __init__(self, message: str, retryable: bool, retry_after: float = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def connect(path: str = None) -> sqlite3.Connection:
+    path = path or OUTBOX_DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ── Splitting ─────────────────────────────────────────────────
+def _split_words(text: str, limit: int) -> list:
+    """Pack whitespace-separated words into chunks; a single over-long word is hard-split."""
+    chunks, current = [], ""
+    for word in text.split(" "):
+        while len(word) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(word[:limit])
+            word = word[limit:]
+        candidate = f"{current} {word}" if current else word
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_message(text: str, limit: int = MAX_CHARS) -> list:
+    """
+    Split text into chunks of at most `limit` characters at paragraph boundaries,
+    falling back to line and then word boundaries for over-long paragraphs.
+    """
+    text = (text or "").strip()
+    if len(text) <= limit:
+        return [text] if text else []
+
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= limit:
+            pieces.append((paragraph, "\n\n"))
+            continue
+        for line in paragraph.split("\n"):
+            for part in (_split_words(line, limit) if len(line) > limit else [line]):
+                pieces.append((part, "\n"))
+
+    chunks, current = [], ""
+    for piece, separator in pieces:
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return [c.strip() for c in chunks if c.strip()]
+
+
+# ── Twilio ────────────────────────────────────────────────────
+def send_via_twilio(sender: str, recipient: str, body: str) -> str:
+    """POST one message to the Twilio Messages API. Returns its SID; raises SendError."""
+    account_sid, token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")
+    data = {"From": sender, "To": recipient, "Body": body}
+    if STATUS_CALLBACK_URL:
+        data["StatusCallback"] = STATUS_CALLBACK_URL
+    try:
+        response = requests.post(
+            f"{TWILIO_API_BASE}/2010-04-01/Accounts/{account_sid}/Messages.json",
+            data=data, auth=(account_sid, token), timeout=SEND_TIMEOUT,
+        )
+    except requests.RequestException as e:
+        raise SendError(f"{type(e).__name__}: {e}", retryable=True)
+
+    if response.status_code in (200, 201):
+        return response.json().get("sid")
+    try:
+        detail = response.json()
+    except ValueError:
+        detail = {"message": response.text[:200]}
+    message = f"HTTP {response.status_code} (code {detail.get('code')}): {detail.get('message')}"
+    retry_after = response.headers.get("Retry-After")
+    raise SendError(
+        message,
+        retryable=response.status_code == 429 or response.status_code >= 500,
+        retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+    )
+
+
+# ── Dispatcher ────────────────────────────────────────────────
+class Dispatcher(threading.Thread):
+    """
+    Daemon thread that sends queued messages: the oldest pending message of each
+    recipient is claimed (so per-recipient order holds, also across processes) and
+    sent on a worker pool, throttled to `mps` messages per second overall.
+    """
+
+    def __init__(self, path: str = None, send=None, workers: int = OUTBOX_WORKERS, mps: float = OUTBOX_MPS):
+        super().__init__(name="kafeai-outbox", daemon=True)
+        self.path = path or OUTBOX_DB_PATH
+        self.send = send or send_via_twilio
+        self.workers = max(1, workers)
+        self.mps = mps
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="kafeai-outbox-send")
+        self._conn = connect(self.path)
+        self._db_lock = threading.Lock()
+        self._in_flight = 0
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._rate_lock = threading.Lock()
+        self._next_slot = 0.0
+        self._last_recovery = 0.0
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._db_lock:
+            return self._conn.execute(sql, params)
+
+    # ── Claiming ──────────────────────────────────────────────
+    def _recover_stale(self):
+        """Requeue rows left in "sending" by a process that died mid-send (at-least-once)."""
+        self._last_recovery = time.time()
+        cursor = self._execute(
+            "UPDATE messages SET status = 'queued', updated_at = ? WHERE status = 'sending' AND updated_at < ?",
+            (time.time(), time.time() - STALE_SENDING),
+        )
+        if cursor.rowcount:
+            log.warning(f"Requeued {cursor.rowcount} message(s) interrupted while sending")
+
+    def _claim(self, limit: int) -> list:
+        now = time.time()
+        with self._db_lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT m.id, m.recipient, m.sender, m.body, m.attempts FROM messages m "
+                    "JOIN (SELECT recipient, MIN(id) AS head FROM messages "
+                    "      WHERE status IN ('queued', 'sending') GROUP BY recipient) h ON m.id = h.head "
+                    "WHERE m.status = 'queued' AND m.next_attempt_at <= ? ORDER BY m.id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE messages SET status = 'sending', updated_at = ? WHERE id = ?",
+                    [(now, r[0]) for r in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _next_due(self) -> float:
+        row = self._execute("SELECT MIN(next_attempt_at) FROM messages WHERE status = 'queued'").fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    # ── Sending ───────────────────────────────────────────────
+    def _throttle(self):
+        if self.mps <= 0:
+            return
+        with self._rate_lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.mps
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _deliver(self, row):
+        message_id, recipient, sender, body, attempts = row
+        try:
+            self._throttle()
+            sid = self.send(sender, recipient, body)
+            self._execute(
+                "UPDATE messages SET status = 'sent', sid = ?, attempts = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (sid, attempts + 1, time.time(), message_id),
+            )
+        except Exception as e:
+            attempts += 1
+            retryable = getattr(e, "retryable", True)
+            if retryable and attempts < MAX_ATTEMPTS:
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1)))
+                delay = max(delay, getattr(e, "retry_after", None) or 0)
+                log.warning(f"Send to {recipient} failed ({e}), retry {attempts}/{MAX_ATTEMPTS - 1} in {delay:.1f}s")
+                self._execute(
+                    "UPDATE messages SET status = 'queued', attempts = ?, next_attempt_at = ?, error = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (attempts, time.time() + delay, str(e)[:300], time.time(), message_id),
+                )
+            else:
+                log.error(f"Send to {recipient} failed permanently: {e}")
+                self._execute(
+                    "UPDATE messages SET status = 'failed', attempts = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (attempts, str(e)[:300], time.time(), message_id),
+                )
+        finally:
+            with self._db_lock:
+                self._in_flight -= 1
+            self._wake.set()
+
+    def run(self):
+        self._recover_stale()
+        while not self._stop_event.is_set():
+            self._wake.clear()
+            try:
+                free = self.workers - self._in_flight
+                rows = self._claim(free) if free > 0 else []
+            except sqlite3.Error as e:
+                log.error(f"Outbox claim failed: {str(e)}")
+                rows = []
+            for row in rows:
+                with self._db_lock:
+                    self._in_flight += 1
+                self._pool.submit(self._deliver, row)
+            if rows:
+                continue
+
+            timeout = POLL_INTERVAL
+            next_due = self._next_due()
+            if next_due is not None:
+                timeout = min(timeout, max(0.05, next_due - time.time()))
+            self._wake.wait(timeout)
+            if time.time() - self._last_recovery > STALE_SENDING:
+                self._recover_stale()
+
+    def pending(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM messages WHERE status IN ('queued', 'sending')").fetchone()[0]
+
+    def wait_idle(self, timeout: float = 30.0) -> bool:
+        """Block until nothing is pending (True) or timeout seconds pass (False)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.pending() == 0:
+                return True
+            time.sleep(0.1)
+        return self.pending() == 0
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_dispatcher() -> Dispatcher:
+    """Process-wide dispatcher, started once (also resumes messages left by a previous run)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = Dispatcher()
+            _dispatcher.start()
+        return _dispatcher
+
+
+def enqueue(recipient: str, text: str, sender: str = None, path: str = None) -> list:
+    """Persist text (split into chunks) for recipient and wake the dispatcher. Returns the row ids."""
+    sender = sender or os.getenv("TWILIO_FROM_NUMBER")
+    now = time.time()
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [
+                conn.execute(
+                    "INSERT INTO messages (recipient, sender, body, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (recipient, sender, chunk, now, now, now),
+                ).lastrowid
+                for chunk in split_message(text)
+            ]
+    finally:
+        conn.close()
+    if path is None:
+        start_dispatcher().wake()
+    return ids
+
+
+def update_status(sid: str, status: str, error_code: str = None, path: str = None) -> bool:
+    """Apply a Twilio status callback (MessageSid / MessageStatus / ErrorCode). False if the SID is unknown."""
+    if status not in FINAL_STATUSES:
+        # queued / sending / sent 回调不改变状态 (否则 queued 会被调度线程重新发送)
+        return True
+    conn = connect(path)
+    try:
+        cursor = conn.execute(
+            "UPDATE messages SET status = ?, error = COALESCE(?, error), updated_at = ? "
+            "WHERE sid = ? AND status NOT IN ('delivered', 'read')",
+            (status, f"Twilio error {error_code}" if error_code else None, time.time(), sid),
+        )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def stats(path: str = None) -> dict:
+    """{status: count} over the whole outbox."""
+    conn = connect(path)
+    try:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall())
+    finally:
+        conn.close()
@@ -4,13 +4,21 @@ import operator
 from typing import List, TypedDict, Annotated
 import datetime
 from langchain_core.messages import SystemMessage, HumanMessage
+from cost_ledger import cogs_ratio_for
+from recipe_bom import deplete_new_reports
+from structured_log import get_logger
+from resilience import check_deadline
+from agent_reports import report, ERROR
+import tenants
+
+log = get_logger("Post-Mortem")
 
 # 定义复盘所需的常量
 COSTS = {
     "RENT_MONTHLY": 60000,
     "STAFF_MONTHLY": 50000,
     "UTILITIES_MONTHLY": 2000,
-    "COGS_RATE": 0.30
+    "COGS_RATE": 0.30 # 仅在成本账本 (cost_ledger) 没有当月收据时使用
 }
 
 DAILY_FIXED_COST = (COSTS["RENT_MONTHLY"] + COSTS["UTILITIES_MONTHLY"] + COSTS["STAFF_MONTHLY"]) / 30
@@ -20,15 +28,14 @@ def post_mortem_agent(state, llm=None):
     分析前一天的销售数据并与预测进行比对。
     如果提供了 llm，则会读取 memory.json 进行偏差分析 (Reinforcement Learning)。
     """
-    base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    reports_dir = os.path.join(base_path, "daily_reports")
-    memory_path = os.path.join(base_path, "memory.json")
+    reports_dir = tenants.data_path("daily_reports")
+    memory_path = tenants.data_path("memory.json")
     
     # 获取最新的报告日期（这里假设我们处理的是今天之前的一份）
     try:
         report_files = sorted([f for f in os.listdir(reports_dir) if f.endswith(".json")], reverse=True)
         if not report_files:
-            return {"context": ["Post-mortem: No daily reports found."]}
+            return report("post_mortem", "No daily reports found.")
         
         report_path = os.path.join(reports_dir, report_files[0])
         with open(report_path, 'r', encoding='utf-8') as f:
@@ -40,7 +47,8 @@ def post_mortem_agent(state, llm=None):
         report_date = report_files[0].replace(".json", "") # e.g., 2026_02_14
         
         # 1. 财务价值评估 (Value Assessment)
-        cogs = net_sales * COSTS["COGS_RATE"]
+        cogs_rate, cogs_source = cogs_ratio_for(report_date.replace("_", "-"), default=COSTS["COGS_RATE"])
+        cogs = net_sales * cogs_rate
         gross_profit = net_sales - cogs - DAILY_FIXED_COST
         
         staff_saving = 0
@@ -51,10 +59,20 @@ def post_mortem_agent(state, llm=None):
             f"--- Financial Post-mortem ({report_date}) ---\n"
             f"Actual Gross Sales: {gross_sales} SEK\n"
             f"Net Sales: {net_sales} SEK\n"
+            f"COGS: {cogs:.2f} SEK ({cogs_rate:.1%}, {cogs_source})\n"
             f"Operating Profit (Daily): {gross_profit:.2f} SEK\n"
         )
         
         calibration_notes = []
+
+        # 按配方 BOM 扣减已售菜品的库存消耗 (每份日报只扣一次)
+        try:
+            depletion = deplete_new_reports(reports_dir=reports_dir)
+            if depletion["applied"]:
+                used = ", ".join(f"{k} -{v:g}" for k, v in sorted(depletion["usage"].items()))
+                calibration_notes.append(f"Stock depleted for {', '.join(depletion['applied'])}: {used}")
+        except Exception as e:
+            log.warning(f"Stock depletion failed: {str(e)}")
         
         # 2. Reinforcement Learning: Bias Capture
         if llm and os.path.exists(memory_path):
@@ -92,6 +110,7 @@ def post_mortem_agent(state, llm=None):
                     episode["bias_correction"] = analysis_result.get("bias_correction", "")
                     
                     # 更新 memory.json
+                    check_deadline("memory update")
                     with open(memory_path, 'w', encoding='utf-8') as mf:
                         json.dump(memory_db, mf, indent=2, ensure_ascii=False)
                         
@@ -100,9 +119,20 @@ def post_mortem_agent(state, llm=None):
                         calibration_notes.append(f"Lesson: {episode['bias_correction']}")
                         
                 except Exception as e:
+                    log.warning(f"RL Analysis Failed: {str(e)}")
                     calibration_notes.append(f"RL Analysis Failed: {str(e)}")
 
-        return {"context": [performance_report + "\n" + " | ".join(calibration_notes)]}
+        financials = {
+            "report_date": report_date,
+            "gross_sales": gross_sales,
+            "net_sales": net_sales,
+            "cogs": round(cogs, 2),
+            "cogs_rate": cogs_rate,
+            "operating_profit": round(gross_profit, 2),
+            "calibration_notes": calibration_notes,
+        }
+        return report("post_mortem", performance_report + "\n" + " | ".join(calibration_notes), financials=financials)
         
     except Exception as e:
-        return {"context": [f"Post-mortem Error: {str(e)}"]}
+        log.error(str(e))
+        return report("post_mortem", str(e), status=ERROR)
@@ -6,9 +6,16 @@ import base64
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from io import BytesIO
 from dotenv import load_dotenv
+from structured_log import get_logger
+from resilience import get_breaker, bounded_timeout
+from agent_reports import report, ERROR
 
 load_dotenv()
 
+log = get_logger("Poster Agent")
+
+IMAGE_TIMEOUT = 30  # seconds per request (capped by the node's remaining budget)
+
 class PosterRenderer:
     def __init__(self, asset_dir="generated_assets"):
         self.asset_dir = asset_dir
@@ -57,7 +64,7 @@ class PosterRenderer:
         try:
             base_img = Image.open(BytesIO(image_data)).convert("RGBA")
         except Exception as e:
-            print(f"Failed to load image: {e}")
+            log.error(f"Failed to load image: {e}")
             return None
             
         width, height = base_img.size
@@ -115,11 +122,28 @@ class PosterRenderer:
         final.save(save_path)
         return save_path
 
+def _request_image(url, headers, payload):
+    """Generated image bytes (None on a client error); raises on timeouts / 429 / 5xx for the breaker."""
+    response = requests.post(url, headers=headers, json=payload, timeout=bounded_timeout(IMAGE_TIMEOUT))
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RuntimeError(f"Image API unavailable ({response.status_code})")
+    if response.status_code != 200:
+        log.warning(f"API Error ({response.status_code}): {response.text}")
+        return None
+
+    data = response.json()
+    # Handle both URL or Base64 return types
+    img_url = data.get("data", [{}])[0].get("url")
+    if img_url:
+        return requests.get(img_url, timeout=bounded_timeout(IMAGE_TIMEOUT)).content
+    b64_data = data.get("data", [{}])[0].get("b64_json")
+    return base64.b64decode(b64_data) if b64_data else None
+
 def poster_agent(state):
-    print("\n[Poster Agent] Generating high-quality assets...")
+    log.info("Generating high-quality assets...")
     promo = state.get("promotion_data")
     if not promo:
-        return {"context": ["Poster Agent: No promotion data found."]}
+        return report("creative", "No promotion data found.")
 
     # 1. Image Generation via Nano Banana API
     api_key = os.getenv("NANO_BANANA_API_KEY")
@@ -139,7 +163,7 @@ def poster_agent(state):
         # Based on search results, assuming standard Gemini/Nano Banana endpoint pattern 
         # for a specialized provider like Kie.ai or similar. 
         # If the user's provider differs, this may need adjustment.
-        print(f"  > Requesting image for: {visual_prompt[:40]}...")
+        log.info(f"Requesting image for: {original_prompt[:40]}...")
         
         # We will attempt a standard POST request. If this fails, we fall back to a "better mock" 
         # so as not to block the entire workflow, but the user requested real integration.
@@ -156,26 +180,13 @@ def poster_agent(state):
             "size": "1024x1024"
         }
         
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # Handle both URL or Base64 return types
-            img_url = data.get("data", [{}])[0].get("url")
-            if img_url:
-                image_data = requests.get(img_url).content
-            else:
-                b64_data = data.get("data", [{}])[0].get("b64_json")
-                if b64_data:
-                    image_data = base64.b64decode(b64_data)
-        else:
-            print(f"  > API Error ({response.status_code}): {response.text}")
+        image_data = get_breaker("image").call(_request_image, url, headers, payload)
     except Exception as e:
-        print(f"  > API Exception: {e}")
+        log.error(f"API Exception: {e}")
 
     # Fallback to a much better gradient background if API fails
     if not image_data:
-        print("  > Using enhanced fallback background...")
+        log.warning("Using enhanced fallback background...")
         img = Image.new('RGB', (1024, 1024), color=(30, 30, 30))
         d = ImageDraw.Draw(img)
         # Simple gradient
@@ -192,9 +203,6 @@ def poster_agent(state):
     
     try:
         saved_path = renderer.process(image_data, promo, file_name)
-        return {
-            "poster_path": saved_path,
-            "context": [f"Poster Agent: Revised Asset generated at {saved_path}"]
-        }
+        return report("creative", f"Revised Asset generated at {saved_path}", poster_path=saved_path)
     except Exception as e:
-        return {"context": [f"Poster Agent Error: Finalizing failed. {str(e)}"]}
+        return report("creative", f"Finalizing failed. {str(e)}", status=ERROR)
@@ -0,0 +1,185 @@
+import datetime
+import report_index
+import menu_model
+import recipe_bom
+
+# 定价触发规则：天气 / 库存 / 客流，全部在本地计算
+# 只有触发时才需要 LLM 写文案；没有触发的日子不生成促销 (也就不需要海报)
+BAD_WEATHER_WORDS = ("rain", "snow", "sleet", "storm", "blizzard", "drizzle", "shower", "thunder")
+RAIN_CHANCE_THRESHOLD = 60   # %
+SNOW_CHANCE_THRESHOLD = 50   # %
+COLD_TEMP_THRESHOLD = -10    # °C
+
+SHELF_LIFE_DAYS = 7          # days of cover a perishable can hold before part of it spoils
+PACK_UNITS = ("katon", "hink")   # counted in whole packs: one pack above target is normal ordering
+PROMO_MAX_SERVINGS = 25      # servings a one-day promotion can plausibly add
+PERISHABLES = ("sallad", "tomat", "gurka", "blomkål", "nötkött", "Crispy chicken", "apelsin", "citron")
+
+LOW_TRAFFIC_RATIO = 0.8      # expected gross below 80% of the recent average
+TRAFFIC_WINDOW = 28          # reports used for the baseline
+
+# 触发 -> 促销模板 (分区 / 菜品 / 折扣)，按优先级排列
+WARM_DRINKS = ("Chailatte", "Mackalatte", "expresso")
+BAD_WEATHER_OFFER = {"discount_type": "20_PERCENT_OFF", "theme": "Cozy Weather Warm-Up"}
+OVERSTOCK_OFFER = {"discount_type": "30_PERCENT_OFF", "theme": "Fresh Today"}
+LOW_TRAFFIC_OFFER = {"product_category": "Drink", "product_item": "ALL_CATEGORY",
+                     "discount_type": "BOGO_FREE", "theme": "Bring a Friend"}
+
+
+def _bad_weather(weather: dict):
+    """Reason string when tomorrow's weather warrants comfort-food offers, else None."""
+    if not weather:
+        return None
+    condition = (weather.get("condition") or "").lower()
+    reasons = []
+    if any(word in condition for word in BAD_WEATHER_WORDS):
+        reasons.append(weather.get("condition"))
+    if (weather.get("rain_chance") or 0) >= RAIN_CHANCE_THRESHOLD:
+        reasons.append(f"{weather['rain_chance']}% chance of rain")
+    if (weather.get("snow_chance") or 0) >= SNOW_CHANCE_THRESHOLD:
+        reasons.append(f"{weather['snow_chance']}% chance of snow")
+    temp = weather.get("avg_temp_c")
+    if temp is not None and temp < COLD_TEMP_THRESHOLD:
+        reasons.append(f"{temp}°C")
+    return ", ".join(dict.fromkeys(reasons)) or None
+
+
+def _surplus(row: dict) -> float:
+    """Quantity that would spoil at the current pace: above both the target and SHELF_LIFE_DAYS of usage."""
+    return row["quantity"] - max(row["target"], row.get("daily_usage", 0) * SHELF_LIFE_DAYS)
+
+
+def _overstocked(stock_rows: list) -> list:
+    """
+    Perishables that will not be used before they spoil: more than SHELF_LIFE_DAYS of cover
+    and above target by more than one pack (whole cartons are normal). Largest surplus first.
+    """
+    perishables = {p.lower() for p in PERISHABLES}
+    rows = []
+    for r in stock_rows:
+        if r["item"].lower() not in perishables or not r.get("target"):
+            continue
+        tolerance = 1 if r.get("unit") in PACK_UNITS else 0
+        if r["quantity"] <= r["target"] + tolerance:
+            continue
+        if r.get("days_left") is not None and r["days_left"] <= SHELF_LIFE_DAYS:
+            continue
+        if _surplus(r) > 0:
+            rows.append(r)
+    return sorted(rows, key=lambda r: _surplus(r) / r["target"], reverse=True)
+
+
+def _item_using(stock_item: str, bom: dict, surplus: float = 0):
+    """
+    Menu item that uses the most of a stock item per serving, or None when even that item
+    would need more than PROMO_MAX_SERVINGS servings to use up the surplus.
+    """
+    best, best_units = None, 0
+    for name, item in bom["items"].items():
+        units = item["components"].get(stock_item, 0)
+        if units > best_units and item.get("price"):
+            best, best_units = item, units
+    if best is None or surplus / best_units > PROMO_MAX_SERVINGS:
+        return None
+    return best
+
+
+def expected_traffic(target_date: str, reports_dir: str = None, expected_gross: float = None) -> dict:
+    """
+    Expected gross for target_date compared with the average over the last TRAFFIC_WINDOW reports.
+    expected_gross is the forecast node's number; without it the same weekday in recent
+    history is used instead.
+    Returns {"expected", "baseline", "ratio", "source"} (values None without history).
+    """
+    reports_dir = reports_dir or report_index.default_reports_dir()
+    dates = report_index.list_dates(end=target_date, reports_dir=reports_dir)
+    dates = [d for d in dates if d < target_date][-TRAFFIC_WINDOW:]
+    source = "forecast" if expected_gross is not None else "same weekday"
+    if not dates:
+        return {"expected": expected_gross, "baseline": None, "ratio": None, "source": source}
+
+    weekday = datetime.date.fromisoformat(target_date).weekday()
+    all_gross, same_day = [], []
+    for date, report in report_index.iter_reports(dates[0], dates[-1], reports_dir):
+        gross = report.get("sales_summary", {}).get("total_gross", 0) or 0
+        all_gross.append(gross)
+        if datetime.date.fromisoformat(date).weekday() == weekday:
+            same_day.append(gross)
+
+    baseline = sum(all_gross) / len(all_gross) if all_gross else None
+    expected = expected_gross
+    if expected is None and same_day:
+        expected = sum(same_day) / len(same_day)
+    if expected is None or not baseline:
+        return {"expected": expected, "baseline": baseline, "ratio": None, "source": source}
+    return {"expected": round(expected, 2), "baseline": round(baseline, 2),
+            "ratio": round(expected / baseline, 3), "source": source}
+
+
+def evaluate_triggers(weather: dict = None, target_date: str = None, stock_rows: list = None,
+                      traffic: dict = None, bom: dict = None, menu=None) -> list:
+    """
+    All pricing triggers that fire for target_date, highest priority first:
+    overstock (clear perishables) > bad weather (warm drinks) > low traffic (BOGO).
+    Each trigger is {"trigger", "reason", "product_category", "product_item", "discount_type", "theme"}.
+    """
+    target_date = target_date or (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    menu = menu or menu_model.get_menu()
+    stock_rows = recipe_bom.project_stockouts() if stock_rows is None else stock_rows
+    bom = bom or recipe_bom.get_bom()
+    triggers = []
+
+    for row in _overstocked(stock_rows):
+        # 促销只在一天的折扣销量能消化掉多余库存时才有意义
+        item = _item_using(row["item"], bom, _surplus(row))
+        if item:
+            cover = f"{row['days_left']:g} days of cover" if row.get("days_left") is not None else "no recent usage"
+            triggers.append({
+                "trigger": "overstock",
+                "reason": (f"{row['item']} at {row['quantity']:g} {row['unit']} vs target {row['target']:g} "
+                           f"({cover})"),
+                "product_category": item["section"],
+                "product_item": item["name"],
+                **OVERSTOCK_OFFER,
+            })
+            break
+
+    weather_reason = _bad_weather(weather)
+    if weather_reason:
+        # 库存最充足的热饮
+        by_stock = {r["item"].lower(): r["quantity"] for r in stock_rows}
+        warm = [name for name in WARM_DRINKS if menu.item(name)]
+        if warm:
+            item = menu.item(max(warm, key=lambda n: by_stock.get(n.lower(), 0)))
+            triggers.append({
+                "trigger": "bad_weather",
+                "reason": f"Bad weather expected: {weather_reason}",
+                "product_category": item["section"],
+                "product_item": item["name"],
+                **BAD_WEATHER_OFFER,
+            })
+
+    traffic = expected_traffic(target_date) if traffic is None else traffic
+    if traffic.get("ratio") is not None and traffic["ratio"] < LOW_TRAFFIC_RATIO:
+        triggers.append({
+            "trigger": "low_traffic",
+            "reason": (f"Low traffic expected: {traffic['expected']:.0f} SEK "
+                       f"({traffic.get('source', 'same weekday')}) vs "
+                       f"{traffic['baseline']:.0f} SEK average ({traffic['ratio']:.0%})"),
+            **LOW_TRAFFIC_OFFER,
+        })
+    return triggers
+
+
+def promotion_skeleton(trigger: dict, target_date: str) -> dict:
+    """Promotion fields derived from a trigger; copy fields are filled in later."""
+    return {
+        "promotion_id": f"{trigger['trigger'].upper()}_{target_date.replace('-', '')}",
+        "theme": trigger["theme"],
+        "product_category": trigger["product_category"],
+        "product_item": trigger["product_item"],
+        "discount_type": trigger["discount_type"],
+        "valid_until": f"{target_date} 21:00:00",
+        "reason": trigger["reason"],
+        "trigger": trigger["trigger"],
+    }
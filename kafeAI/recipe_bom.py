@@ -0,0 +1,377 @@
+import os
+import json
+import datetime
+import threading
+import report_index
+import menu_model
+import tenants
+from structured_log import get_logger
+from resilience import check_deadline
+
+log = get_logger("Recipe BOM")
+
+# 配方 BOM：菜单模型 (menu_model) -> 菜品 -> 组成 -> stock.json 库存项
+# 每份菜品的库存消耗按 DEFAULT_PORTIONS 估算，日报按类别 (sales_by_category) 摊到菜品，
+# 然后从 stock.json 扣减，并按近期日均消耗推算断货天数
+PROJECTION_WINDOW = 14   # reports used for the average daily consumption
+STOCKOUT_HORIZON = 3     # flag items projected to run out within N days
+
+# 配方里的写法 -> 库存项名称 (stock.json)
+INGREDIENT_ALIASES = {
+    "beef": "nötkött",
+    "bbqsås": "bbq sås",
+    "crispy chicken": "Crispy chicken",
+}
+
+# Menu.md 里没有写配方的菜品
+IMPLICIT_RECIPES = {
+    "crispy薯条": ["pommes fries"],
+    "Deluxy Fries": ["pommes fries"],
+    "Kids Hamburger": ["beef", "burger bröd"],
+}
+
+# 配方没有写出来、但每份都会用到的基础材料 (按菜单分区)
+SECTION_BASE = {
+    "汉堡": ["burger bröd"],
+    "Grilla Macka": ["ciabata"],
+    "Räkmacka": ["ciabata", "虾"],
+    "Sallad": ["sallad", "tomat"],
+    "Wrap": ["tortilla", "sallad", "tomat"],   # tortilla counts once it is added to stock.json
+    "Kids": [],
+}
+
+# 每份消耗的库存单位数 (kg / katon / hink / st / cup)，按店内经验估算
+DEFAULT_PORTIONS = {
+    "nötkött": 0.15,
+    "burger bröd": 1 / 48,
+    "sallad": 0.1,
+    "tomat": 1 / 80,
+    "gurka": 1 / 80,
+    "aioli": 1 / 150,
+    "bbq sås": 1 / 150,
+    "rödpesto": 1 / 150,
+    "pommes fries": 1 / 40,
+    "红薯条": 1 / 40,
+    "虾": 1 / 40,
+    "ciabata": 1 / 30,
+    "pankaka": 1 / 30,
+    "Crispy chicken": 1 / 40,
+    "bamboo beef": 1 / 25,
+    "菠萝鸡块": 1 / 25,
+}
+FALLBACK_PORTION = 1 / 50  # for mapped items missing from DEFAULT_PORTIONS (cups / st use 1)
+
+# 日报类别前缀 -> 菜单分区或具体菜品
+CATEGORY_ITEMS = {
+    "MAT": {"sections": ["汉堡", "薯条", "Grilla Macka", "Räkmacka", "Sallad", "Wrap", "Special Kina Mat", "Kids"]},
+    "LÄSK": {"items": ["Smoothie", "Bubble Tea", "ice coffee", "läsk"]},
+    "VARM DRYCK": {"items": ["Chailatte", "Mackalatte", "expresso"]},
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+_stock_lock = threading.Lock()
+
+
+# ── Menu -> BOM ───────────────────────────────────────────────
+def _stock_lookup(stock_items) -> dict:
+    return {name.lower(): name for name in stock_items}
+
+
+def _resolve_token(token: str, lookup: dict):
+    """Map a recipe token / item name to a stock item, or None."""
+    key = token.strip().lower()
+    if key in lookup:
+        return lookup[key]
+    alias = INGREDIENT_ALIASES.get(key)
+    if alias and alias.lower() in lookup:
+        return lookup[alias.lower()]
+    return None
+
+
+def build_bom(menu: menu_model.MenuModel, stock_items) -> dict:
+    """
+    Expand each menu item into {stock_item: units_per_serving}.
+    Recipes may reference other items ("Classic+bacon") and multipliers ("double beef").
+    Returns {"items": {name: {...item, "components": {...}}}, "unmapped": [tokens],
+    "no_components": [names]} (items that map to no stock item and so deplete nothing).
+    """
+    lookup = _stock_lookup(stock_items)
+    with_recipe = [it for it in menu.items if it["recipe"]]
+    unmapped = set()
+
+    def _find_ref(token, section):
+        # "Classic" -> "Classic原味牛肉汉堡" (only within the same menu section)
+        key = token.lower()
+        if len(key) < 3:
+            return None
+        return next((it for it in with_recipe
+                     if it["section"] == section and it["name"].lower().startswith(key)), None)
+
+    def _expand(item, seen, include_base=True) -> dict:
+        counts = {}
+
+        def _add(stock_item, n):
+            counts[stock_item] = counts.get(stock_item, 0) + n
+
+        if include_base:
+            for base in SECTION_BASE.get(item["section"], []):
+                resolved = _resolve_token(base, lookup)
+                if resolved:
+                    _add(resolved, 1)
+
+        tokens = item["recipe"] or IMPLICIT_RECIPES.get(item["name"]) or [item["name"]]
+        for token in tokens:
+            n = 1
+            words = token.split()
+            if words and words[0].lower() == "double":
+                n, token = 2, " ".join(words[1:])
+
+            ref = _find_ref(token, item["section"])
+            if ref is not None and ref is not item and ref["name"] not in seen:
+                # "BBQ bacon burger (Classic+...)": 分区基础材料 (面包) 已经算过
+                for stock_item, k in _expand(ref, seen | {ref["name"]}, include_base=False).items():
+                    _add(stock_item, k * n)
+                continue
+
+            resolved = _resolve_token(token, lookup)
+            if resolved:
+                _add(resolved, n)
+            elif item["recipe"]:
+                unmapped.add(token)
+        return counts
+
+    bom = {}
+    for item in menu.items:
+        counts = _expand(item, {item["name"]})
+        bom[item["name"]] = {
+            **item,
+            "components": {s: n * portion_for(s, stock_items) for s, n in counts.items()},
+        }
+    no_components = sorted(name for name, it in bom.items() if not it["components"])
+    return {"items": bom, "unmapped": sorted(unmapped), "no_components": no_components}
+
+
+def portion_for(stock_item: str, stock_items=None) -> float:
+    if stock_item in DEFAULT_PORTIONS:
+        return DEFAULT_PORTIONS[stock_item]
+    unit = (stock_items or {}).get(stock_item, "") if isinstance(stock_items, dict) else ""
+    return 1.0 if unit in ("cup", "st") else FALLBACK_PORTION
+
+
+def default_stock_path() -> str:
+    """stock.json of the current tenant."""
+    return tenants.data_path("stock.json")
+
+
+def load_stock(stock_path: str = None) -> dict:
+    with open(stock_path or default_stock_path(), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_bom(menu_path: str = None, stock_path: str = None) -> dict:
+    """Compiled BOM, rebuilt only when the menu model or the set of stock items changes."""
+    menu_path = menu_path or tenants.data_path("Menu.md")
+    stock = load_stock(stock_path)
+    units = {e["item"]: e.get("unit", "") for e in stock.get("inventory", [])}
+    menu = menu_model.get_menu(menu_path)
+
+    units_key = tuple(sorted(units.items()))
+    with _cache_lock:
+        cached = _cache.get(menu_path)
+        if cached and cached[0] is menu and cached[1] == units_key:
+            return cached[2]
+        bom = build_bom(menu, units)
+        if bom["no_components"]:
+            log.warning(f"Menu items without stock components (not depleted or projected): "
+                        f"{', '.join(bom['no_components'])}")
+        _cache[menu_path] = (menu, units_key, bom)
+        return bom
+
+
+# ── Sales -> Consumption ──────────────────────────────────────
+def _category_items(category: str, bom: dict) -> list:
+    prefix = category.split("(")[0].strip().upper()
+    for key, spec in CATEGORY_ITEMS.items():
+        if prefix.startswith(key):
+            names = set(spec.get("items", []))
+            sections = set(spec.get("sections", []))
+            return [it for name, it in bom["items"].items()
+                    if name in names or it["section"] in sections]
+    return []
+
+
+def estimate_consumption(report: dict, bom: dict) -> dict:
+    """
+    Expected stock usage for one daily report: {stock_item: units}.
+    Category servings come from `count` when present, otherwise amount / average item price,
+    and are spread evenly over the category's menu items.
+    """
+    usage = {}
+    for cat in report.get("sales_by_category", []):
+        items = [it for it in _category_items(cat.get("category", ""), bom) if it["components"]]
+        if not items:
+            continue
+        servings = cat.get("count") or 0
+        if not servings:
+            prices = [it["price"] for it in items if it.get("price")]
+            if not prices:
+                continue
+            servings = (cat.get("amount", 0) or 0) / (sum(prices) / len(prices))
+        per_item = servings / len(items)
+        for it in items:
+            for stock_item, units in it["components"].items():
+                usage[stock_item] = usage.get(stock_item, 0) + per_item * units
+    return usage
+
+
+# ── Depletion Engine ──────────────────────────────────────────
+def _write_stock(stock: dict, stock_path: str):
+    tmp = stock_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(stock, f, indent=4, ensure_ascii=False)
+    os.replace(tmp, stock_path)
+
+
+def update_stock(change, stock_path: str = None, what: str = "stock update"):
+    """
+    Read-modify-write of stock.json under the stock lock, replaced atomically.
+    change(stock) edits the dict in place and returns a result; None means nothing changed
+    (no write). Every writer of stock.json (orders, depletion) goes through here.
+    """
+    stock_path = stock_path or default_stock_path()
+    with _stock_lock:
+        stock = load_stock(stock_path)
+        result = change(stock)
+        if result is None:
+            return None
+        check_deadline(what)
+        stock.setdefault("metadata", {})["last_updated"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        _write_stock(stock, stock_path)
+        return result
+
+
+def add_orders(orders: list, stock_path: str = None) -> list:
+    """
+    Add ordered quantities ([{"item", "amount_to_add"}], names matched case-insensitively)
+    to stock.json. Returns one note per order, e.g. "sallad (+10)".
+    """
+    def _add(stock: dict) -> list:
+        updates = []
+        for order in orders:
+            item_name = order["item"].lower()
+            amount = order["amount_to_add"]
+            entry = next((e for e in stock["inventory"] if e["item"].lower() == item_name), None)
+            if entry is None:
+                # 如果没找到，可以选择新增或忽略，这里暂定记录 log
+                updates.append(f"{item_name} (New item, ignored for safety)")
+                continue
+            try:
+                entry["quantity"] += int(amount)
+            except (ValueError, TypeError):
+                updates.append(f"{item_name} (Invalid amount: {amount})")
+                continue
+            updates.append(f"{item_name} (+{amount})")
+        return updates
+
+    return update_stock(_add, stock_path)
+
+
+def deplete_new_reports(stock_path: str = None, reports_dir: str = None) -> dict:
+    """
+    Subtract expected consumption for every report newer than the last one applied.
+    The marker lives in stock.json metadata ("last_depleted_report"), so re-runs are no-ops.
+    On first use only the latest report is applied.
+    Returns {"applied": [dates], "usage": {stock_item: units}}.
+    """
+    reports_dir = reports_dir or report_index.default_reports_dir()
+    stock_path = stock_path or default_stock_path()
+
+    def _deplete(stock: dict):
+        meta = stock.setdefault("metadata", {})
+        last = meta.get("last_depleted_report")
+        dates = report_index.list_dates(reports_dir=reports_dir)
+        if not dates:
+            return None
+        start = dates[-1] if not last else None
+
+        bom = get_bom(stock_path=stock_path)
+        total, applied = {}, []
+        for date, report in report_index.iter_reports(start, None, reports_dir):
+            if last and date <= last:
+                continue
+            for stock_item, units in estimate_consumption(report, bom).items():
+                total[stock_item] = total.get(stock_item, 0) + units
+            applied.append(date)
+
+        if not applied:
+            return None
+
+        for entry in stock.get("inventory", []):
+            used = total.get(entry["item"])
+            if used:
+                entry["quantity"] = round(max(0.0, entry["quantity"] - used), 2)
+        meta["last_depleted_report"] = applied[-1]
+        return {"applied": applied, "usage": {k: round(v, 3) for k, v in total.items()}}
+
+    return update_stock(_deplete, stock_path, "stock depletion") or {"applied": [], "usage": {}}
+
+
+def project_stockouts(stock_path: str = None, reports_dir: str = None,
+                      window: int = PROJECTION_WINDOW, horizon: int = STOCKOUT_HORIZON) -> list:
+    """
+    Per stock item: quantity, storage target, average daily usage over the last `window`
+    reports and projected days until stockout. Sorted by days left; "at_risk" when <= horizon.
+    """
+    reports_dir = reports_dir or report_index.default_reports_dir()
+    stock = load_stock(stock_path)
+    bom = get_bom(stock_path=stock_path)
+    menu = menu_model.get_menu()
+
+    dates = report_index.list_dates(reports_dir=reports_dir)[-window:]
+    usage = {}
+    if dates:
+        for _, report in report_index.iter_reports(dates[0], dates[-1], reports_dir):
+            for stock_item, units in estimate_consumption(report, bom).items():
+                usage[stock_item] = usage.get(stock_item, 0) + units
+
+    rows = []
+    for entry in stock.get("inventory", []):
+        name = entry["item"]
+        daily = usage.get(name, 0) / len(dates) if dates else 0
+        target = menu.target(name)
+        days_left = entry["quantity"] / daily if daily > 0 else None
+        rows.append({
+            "item": name,
+            "quantity": entry["quantity"],
+            "unit": entry.get("unit", ""),
+            "target": target[0] if target else None,
+            "daily_usage": round(daily, 3),
+            "days_left": round(days_left, 1) if days_left is not None else None,
+            "at_risk": days_left is not None and days_left <= horizon,
+        })
+    rows.sort(key=lambda r: (r["days_left"] is None, r["days_left"] or 0))
+    return rows
+
+
+def projection_table(rows: list) -> str:
+    """Compact text table of project_stockouts() rows for agent prompts."""
+    lines = ["item | qty | target | avg daily use | days left"]
+    for r in rows:
+        target = f"{r['target']:g}" if r["target"] is not None else "-"
+        days = f"{r['days_left']:g}" if r["days_left"] is not None else "n/a"
+        flag = " ⚠️" if r["at_risk"] else ""
+        lines.append(f"{r['item']} | {r['quantity']:g} {r['unit']} | {target} | {r['daily_usage']:g} | {days}{flag}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    bom = get_bom()
+    print(f"--- Recipe BOM ({len(bom['items'])} items) ---")
+    for name, item in bom["items"].items():
+        parts = ", ".join(f"{k} {v:.3f}" for k, v in item["components"].items()) or "-"
+        print(f"  {name}: {parts}")
+    if bom["unmapped"]:
+        print(f"Unmapped ingredients (not in stock.json): {', '.join(bom['unmapped'])}")
+    print()
+    print(projection_table(project_stockouts()))
@@ -0,0 +1,71 @@
+import os
+import json
+import threading
+import tenants
+
+# daily_reports/ 的轻量索引：文件名即日期 (YYYY_MM_DD.json)
+# 索引只保存 日期 -> 路径，内容按需流式读取，目录 mtime 变化时自动重建
+# 目录按当前门店 (tenants) 解析，每个门店各自缓存
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def _date_from_filename(name: str):
+    """2026_02_14.json -> 2026-02-14 (None if the name is not a report date)"""
+    stem = name[:-5] if name.endswith(".json") else ""
+    parts = stem.split("_")
+    if len(parts) != 3 or not all(p.isdigit() for p in parts):
+        return None
+    return f"{parts[0]}-{parts[1]}-{parts[2]}"
+
+
+def default_reports_dir() -> str:
+    """daily_reports/ of the current tenant."""
+    return tenants.data_path("daily_reports")
+
+
+def get_index(reports_dir: str = None) -> list:
+    """Chronological list of (iso_date, path). Rebuilt only when the directory changes."""
+    reports_dir = reports_dir or default_reports_dir()
+    try:
+        mtime = os.stat(reports_dir).st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    with _index_lock:
+        cached = _index_cache.get(reports_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        entries = []
+        for name in os.listdir(reports_dir):
+            date = _date_from_filename(name)
+            if date:
+                entries.append((date, os.path.join(reports_dir, name)))
+        entries.sort()
+        _index_cache[reports_dir] = (mtime, entries)
+        return entries
+
+
+def list_dates(start: str = None, end: str = None, reports_dir: str = None) -> list:
+    """ISO dates with a report, optionally limited to [start, end] (inclusive)."""
+    return [d for d, _ in get_index(reports_dir) if (not start or d >= start) and (not end or d <= end)]
+
+
+def iter_reports(start: str = None, end: str = None, reports_dir: str = None):
+    """
+    Yield (iso_date, report_dict) in date order for [start, end] (inclusive).
+    Reports are loaded one at a time, so memory stays flat for any period length.
+    Unreadable files are skipped.
+    """
+    for date, path in get_index(reports_dir):
+        if start and date < start:
+            continue
+        if end and date > end:
+            break
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                yield date, json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
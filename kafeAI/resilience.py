@@ -0,0 +1,205 @@
+import os
+import time
+import datetime
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from structured_log import get_logger
+import agent_reports
+
+# 有界响应时间：整次运行有一个截止时间 (deadline)，每个节点再有自己的时间预算
+# 节点超时或出错时降级：只读分析节点返回上一次的缓存结果 (标注时间)，其他节点返回明确的跳过说明
+# 外部依赖 (天气 / 图片 / 各个 LLM 模型) 有熔断器：连续失败后在冷却期内直接失败，不再等待超时
+# 有副作用的节点 (写 stock.json / memory.json) 不在后台线程里被放弃：在调用线程内运行，写入前检查截止时间
+RUN_DEADLINE = float(os.getenv("KAFEAI_RUN_DEADLINE", "150"))   # seconds per phase
+
+# node -> seconds
+NODE_BUDGETS = {
+    "router": 2,
+    "post_mortem": 20,
+    "forecast": 25,
+    "predictor": 8,
+    "stock_manager": 25,
+    "pricing": 20,
+    "creative": 45,
+    "manager": 60,
+    "quick_manager": 12,
+    "executor": 25,
+}
+DEFAULT_BUDGET = 20
+
+# Nodes that start a phase get a fresh deadline (the HITL pause can last hours)
+PHASE_START_NODES = ("router", "manager")
+# Read-only analyses whose previous result is an acceptable stand-in
+CACHEABLE_NODES = ("post_mortem", "forecast", "predictor", "stock_manager")
+# Nodes whose output is a "decision" rather than a report
+DECISION_NODES = ("manager", "quick_manager")
+# Nodes that write shared files: run inline and check the deadline before writing, never abandoned
+SIDE_EFFECT_NODES = ("executor", "post_mortem")
+
+FAILURE_THRESHOLD = 3     # consecutive failures that open a breaker
+RESET_TIMEOUT = 60        # seconds a breaker stays open before a trial call
+NODE_WORKERS = 16
+
+log = get_logger("Resilience")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> open after FAILURE_THRESHOLD consecutive failures -> half-open after RESET_TIMEOUT."""
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.time() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                log.info(f"Circuit '{self.name}' closed")
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    log.warning(f"Circuit '{self.name}' open for {self.reset_timeout:.0f}s after {self.failures} failures")
+                self.opened_at = time.time()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker; raises CircuitOpenError without calling fn while open."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} unavailable (circuit open)")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.failure()
+            raise
+        self.success()
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states() -> dict:
+    """{name: "closed" | "open" | "half-open"} for the Monitor tab."""
+    with _breakers_lock:
+        return {name: b.state for name, b in _breakers.items()}
+
+
+# ── Deadlines ─────────────────────────────────────────────────
+_deadline = contextvars.ContextVar("kafeai_deadline", default=None)
+
+
+def remaining(default: float = None):
+    """Seconds left before the current node's deadline (default when none is set)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return max(0.0, deadline - time.time())
+
+
+def bounded_timeout(timeout: float) -> float:
+    """timeout capped by the time left in the current node (for HTTP calls inside nodes)."""
+    left = remaining()
+    return timeout if left is None else max(0.5, min(timeout, left))
+
+
+def check_deadline(what: str):
+    """Raise TimeoutError when the current node's deadline has passed (call before a write)."""
+    if remaining() == 0:
+        raise TimeoutError(f"deadline passed before {what}")
+
+
+# ── Guarded Nodes ─────────────────────────────────────────────
+_last_results = {}        # (tenant_id, node) -> (timestamp, result)
+_results_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=NODE_WORKERS, thread_name_prefix="kafeai-node")
+
+
+def _degraded(node: str, tenant_id: str, reason: str) -> dict:
+    """Last good result for a cacheable node (marked), otherwise a clearly marked skip."""
+    if node in CACHEABLE_NODES:
+        with _results_lock:
+            cached = _last_results.get((tenant_id, node))
+        if cached:
+            ts, result = cached
+            note = f" [⚠️ cached from {datetime.datetime.fromtimestamp(ts).strftime('%m-%d %H:%M')}: {reason}]"
+            degraded = dict(result)
+            entry = agent_reports.report_of(result, node)
+            if entry:
+                degraded["reports"] = {node: {"status": agent_reports.DEGRADED, "text": entry["text"] + note}}
+            return degraded
+    message = f"⏭️ {node} skipped: {reason}"
+    if node in DECISION_NODES:
+        return {"decision": message}
+    return agent_reports.report(node, message, status=agent_reports.SKIPPED)
+
+
+def run_guarded(node: str, fn, state: dict, tenant_id: str = None) -> dict:
+    """
+    Run fn(state) with the node's budget, capped by the run deadline in state["deadline"].
+    Timeouts and errors degrade instead of stalling or failing the run. The worker thread
+    of a timed-out node is left to finish in the background; its result is discarded.
+    SIDE_EFFECT_NODES are never abandoned: they run in the calling thread and rely on
+    check_deadline() before their writes (and on LLM timeouts capped by the deadline).
+    """
+    now = time.time()
+    deadline = state.get("deadline")
+    new_deadline = None
+    if node in PHASE_START_NODES or not deadline:
+        new_deadline = deadline = now + RUN_DEADLINE
+
+    budget = min(NODE_BUDGETS.get(node, DEFAULT_BUDGET), deadline - now)
+    if budget <= 0:
+        log.warning(f"[{node}] Run deadline passed, skipping")
+        return _degraded(node, tenant_id, "run deadline passed")
+
+    ctx = contextvars.copy_context()
+    ctx.run(_deadline.set, now + budget)
+    try:
+        if node in SIDE_EFFECT_NODES:
+            result = ctx.run(fn, state)
+        else:
+            result = _executor.submit(ctx.run, fn, state).result(timeout=budget)
+    except (FutureTimeout, TimeoutError):
+        log.warning(f"[{node}] Exceeded its {budget:.0f}s budget, degrading")
+        result = _degraded(node, tenant_id, f"exceeded {budget:.0f}s budget")
+    except Exception as e:
+        log.error(f"[{node}] Failed: {str(e)}")
+        result = _degraded(node, tenant_id, f"error: {str(e)[:120]}")
+    else:
+        entry = agent_reports.report_of(result or {}, node)
+        if node in CACHEABLE_NODES and entry and entry["status"] == agent_reports.OK:
+            with _results_lock:
+                _last_results[(tenant_id, node)] = (time.time(), result)
+
+    if new_deadline is not None:
+        result = {**(result or {}), "deadline": new_deadline}
+    return result
@@ -0,0 +1,359 @@
+import os
+import json
+import datetime
+import threading
+import numpy as np
+import report_index
+import tenants
+
+# 销售聚合立方体：日报 (daily_reports/) 增量汇总成按 星期 / ISO 周 / 月 / 类别 预先计算好的聚合，
+# 列式保存在当前门店的 cache/sales_cube.npz (NumPy 数组)
+# - 每天一行 (day table)；各聚合层 (month / week / weekday / weekday_month) 保存累加和，
+#   新增或修改一份日报时只对相关的行加上差值 (new - old)，不重读其它日报
+# - 比率类指标 (hot_drink_ratio / bakery_attach_rate / avg_gross) 在查询时由累加和计算 (ratio of sums)
+#   日报没有逐笔小票，bakery_attach_rate 用 烘焙件数 / 交易笔数 近似 (没有 count 的日报为 n/a)
+# - 日报目录变化时 (上传、手动复制、删除) 自动同步；前端上传日报后 refresh() 立即写入
+# 查询都在内存中的小数组上进行 (微秒级)，供分析页、预测 agent 和 LLM 提示词使用
+
+HOT_DRINK_CATEGORY = "VARM DRYCK"     # category key (the report name before " (...)")
+BAKERY_CATEGORY = "BAKVERK"
+
+# Summed per day and per aggregate cell
+MEASURES = ("gross", "net", "vat", "transactions", "hot_drink", "bakery", "bakery_count")
+LEVELS = ("month", "week", "weekday", "weekday_month")
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+_cubes = {}               # cube path -> (SalesCube, reports dir mtime it was synced at)
+_cubes_lock = threading.Lock()
+
+
+def cube_path() -> str:
+    return tenants.data_path("cache", "sales_cube.npz")
+
+
+def category_key(name: str) -> str:
+    """"VARM DRYCK (热饮)" -> "VARM DRYCK"."""
+    return (name or "?").split("(")[0].strip().upper() or "?"
+
+
+def _dims(date: str) -> dict:
+    """Aggregate keys of one report date: month 202601, ISO week 202602, weekday 0-6 (Mon=0)."""
+    d = datetime.date.fromisoformat(date)
+    iso_year, iso_week, _ = d.isocalendar()
+    month = d.year * 100 + d.month
+    return {
+        "month": month,
+        "week": iso_year * 100 + iso_week,
+        "weekday": d.weekday(),
+        "weekday_month": month * 10 + d.weekday(),
+    }
+
+
+def _facts(report: dict):
+    """(measure values, {category key: amount}) of one daily report."""
+    s = report.get("sales_summary", {})
+    categories, counts = {}, {}
+    for c in report.get("sales_by_category", []):
+        key = category_key(c.get("category"))
+        categories[key] = categories.get(key, 0.0) + (c.get("amount", 0) or 0)
+        counts[key] = counts.get(key, 0) + (c.get("count", 0) or 0)
+    values = np.array([
+        s.get("total_gross", 0) or 0,
+        s.get("total_net", 0) or 0,
+        s.get("total_vat", 0) or 0,
+        report.get("payment_methods", {}).get("total_transactions", 0) or 0,
+        categories.get(HOT_DRINK_CATEGORY, 0.0),
+        categories.get(BAKERY_CATEGORY, 0.0),
+        counts.get(BAKERY_CATEGORY, 0),
+    ], dtype=float)
+    return values, categories
+
+
+def _columns(keys, days, measures) -> dict:
+    columns = {"keys": keys, "days": days}
+    for j, name in enumerate(MEASURES):
+        columns[name] = measures[:, j]
+    columns["avg_gross"] = _ratio(columns["gross"], days)
+    columns["hot_drink_ratio"] = _ratio(columns["hot_drink"], columns["gross"])
+    columns["bakery_attach_rate"] = _ratio(columns["bakery_count"], columns["transactions"])
+    return columns
+
+
+def _ratio(num, den):
+    num, den = np.asarray(num, dtype=float), np.asarray(den, dtype=float)
+    out = np.full(num.shape, np.nan)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def period_label(level: str, key: int) -> str:
+    key = int(key)
+    if level == "month":
+        return f"{key // 100}-{key % 100:02d}"
+    if level == "week":
+        return f"{key // 100}-W{key % 100:02d}"
+    if level == "weekday":
+        return WEEKDAYS[key]
+    return f"{key // 1000}-{key // 10 % 100:02d} {WEEKDAYS[key % 10]}"
+
+
+class SalesCube:
+    """
+    Day table + summed aggregates per level. Arrays:
+    day_dates (ISO strings), day_mtimes (source file mtime_ns), day_measures (days x MEASURES),
+    day_cats (days x categories); per level: keys (sorted), days, measures, cats.
+    """
+
+    def __init__(self):
+        self.categories = np.array([], dtype="U64")
+        self.day_dates = np.array([], dtype="U10")
+        self.day_mtimes = np.array([], dtype=np.int64)
+        self.day_measures = np.zeros((0, len(MEASURES)))
+        self.day_cats = np.zeros((0, 0))
+        self.levels = {
+            level: {"keys": np.array([], dtype=np.int64), "days": np.array([], dtype=np.int64),
+                    "measures": np.zeros((0, len(MEASURES))), "cats": np.zeros((0, 0))}
+            for level in LEVELS
+        }
+
+    # ── Storage ───────────────────────────────────────────────
+    def save(self, path: str):
+        arrays = {
+            "categories": self.categories, "day_dates": self.day_dates, "day_mtimes": self.day_mtimes,
+            "day_measures": self.day_measures, "day_cats": self.day_cats,
+        }
+        for level, cells in self.levels.items():
+            for name, values in cells.items():
+                arrays[f"{level}_{name}"] = values
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SalesCube":
+        cube = cls()
+        with np.load(path) as data:
+            if tuple(data["day_measures"].shape[1:]) != (len(MEASURES),):
+                raise ValueError("cube was built with different measures")
+            cube.categories = data["categories"]
+            cube.day_dates = data["day_dates"]
+            cube.day_mtimes = data["day_mtimes"]
+            cube.day_measures = data["day_measures"]
+            cube.day_cats = data["day_cats"]
+            for level, cells in cube.levels.items():
+                for name in cells:
+                    cells[name] = data[f"{level}_{name}"]
+        return cube
+
+    # ── Incremental updates ───────────────────────────────────
+    def _category_index(self, key: str) -> int:
+        hits = np.flatnonzero(self.categories == key)
+        if hits.size:
+            return int(hits[0])
+        self.categories = np.append(self.categories, key).astype("U64")
+        self.day_cats = np.pad(self.day_cats, ((0, 0), (0, 1)))
+        for cells in self.levels.values():
+            cells["cats"] = np.pad(cells["cats"], ((0, 0), (0, 1)))
+        return len(self.categories) - 1
+
+    def _apply(self, dims: dict, measures: np.ndarray, cats: np.ndarray, sign: int):
+        """Add (sign=1) or remove (sign=-1) one day's facts in every level."""
+        for level, cells in self.levels.items():
+            key = dims[level]
+            i = int(np.searchsorted(cells["keys"], key))
+            if i == len(cells["keys"]) or cells["keys"][i] != key:
+                cells["keys"] = np.insert(cells["keys"], i, key)
+                cells["days"] = np.insert(cells["days"], i, 0)
+                cells["measures"] = np.insert(cells["measures"], i, 0.0, axis=0)
+                cells["cats"] = np.insert(cells["cats"], i, 0.0, axis=0)
+            cells["days"][i] += sign
+            cells["measures"][i] += sign * measures
+            cells["cats"][i] += sign * cats
+            if cells["days"][i] == 0:
+                for name in cells:
+                    cells[name] = np.delete(cells[name], i, axis=0)
+
+    def upsert(self, date: str, report: dict, mtime: int = 0):
+        """Add or replace the day `date`; only that day's delta touches the aggregates."""
+        measures, by_category = _facts(report)
+        columns = [(self._category_index(k), v) for k, v in by_category.items()]
+        cats = np.zeros(len(self.categories))
+        for j, amount in columns:
+            cats[j] += amount
+        self.remove(date)
+        i = int(np.searchsorted(self.day_dates, date))
+        self.day_dates = np.insert(self.day_dates, i, date)
+        self.day_mtimes = np.insert(self.day_mtimes, i, mtime)
+        self.day_measures = np.insert(self.day_measures, i, measures, axis=0)
+        self.day_cats = np.insert(self.day_cats, i, cats, axis=0)
+        self._apply(_dims(date), measures, cats, 1)
+
+    def remove(self, date: str) -> bool:
+        i = int(np.searchsorted(self.day_dates, date))
+        if i == len(self.day_dates) or self.day_dates[i] != date:
+            return False
+        self._apply(_dims(date), self.day_measures[i], self.day_cats[i], -1)
+        self.day_dates = np.delete(self.day_dates, i)
+        self.day_mtimes = np.delete(self.day_mtimes, i)
+        self.day_measures = np.delete(self.day_measures, i, axis=0)
+        self.day_cats = np.delete(self.day_cats, i, axis=0)
+        return True
+
+    def sync(self, reports_dir: str = None) -> int:
+        """Apply new, changed and deleted reports. Returns the number of days changed."""
+        index = dict(report_index.get_index(reports_dir))
+        known = dict(zip(self.day_dates.tolist(), self.day_mtimes.tolist()))
+        changed = 0
+        for date in set(known) - set(index):
+            changed += self.remove(date)
+        for date, path in index.items():
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if known.get(date) == mtime:
+                continue
+            report = _read(path)
+            if report is None:
+                continue
+            self.upsert(date, report, mtime)
+            changed += 1
+        return changed
+
+    # ── Queries ───────────────────────────────────────────────
+    def table(self, level: str) -> dict:
+        """
+        Column arrays of one level: keys, days, every measure (sums), avg_gross,
+        hot_drink_ratio and bakery_attach_rate (ratios of the sums).
+        """
+        cells = self.levels[level]
+        return _columns(cells["keys"], cells["days"], cells["measures"])
+
+    def row(self, level: str, key: int) -> dict:
+        """One aggregate cell as {measure: value} (None if it has no days)."""
+        cells = self.levels[level]
+        i = int(np.searchsorted(cells["keys"], key))
+        if i == len(cells["keys"]) or cells["keys"][i] != key:
+            return None
+        one = slice(i, i + 1)
+        columns = _columns(cells["keys"][one], cells["days"][one], cells["measures"][one])
+        return {name: values[0].item() for name, values in columns.items()}
+
+    def category_series(self, category: str, level: str = "week"):
+        """(keys, amounts, share of gross) of one category per period of a level."""
+        cells = self.levels[level]
+        hits = np.flatnonzero(self.categories == category_key(category))
+        if not hits.size:
+            return cells["keys"], np.zeros(len(cells["keys"])), np.zeros(len(cells["keys"]))
+        amounts = cells["cats"][:, hits[0]]
+        return cells["keys"], amounts, _ratio(amounts, cells["measures"][:, MEASURES.index("gross")])
+
+    def weekday_compare(self, weekday: int, month: int) -> dict:
+        """Average gross of a weekday in `month` (yyyymm) vs the month before."""
+        previous = month - 1 if month % 100 > 1 else (month // 100 - 1) * 100 + 12
+        current = self.row("weekday_month", month * 10 + weekday)
+        before = self.row("weekday_month", previous * 10 + weekday)
+        now_avg = current["avg_gross"] if current else None
+        prev_avg = before["avg_gross"] if before else None
+        change = (now_avg / prev_avg - 1) * 100 if now_avg is not None and prev_avg else None
+        return {"weekday": WEEKDAYS[weekday], "month": now_avg, "previous_month": prev_avg, "change_pct": change}
+
+    def prompt_summary(self, weeks: int = 4, months: int = 3) -> str:
+        """Compact aggregate context for LLM prompts ("" when the cube is empty)."""
+        if not len(self.day_dates):
+            return ""
+        lines = []
+        t = self.table("month")
+        for i in range(max(0, len(t["keys"]) - months), len(t["keys"])):
+            lines.append(
+                f"{period_label('month', t['keys'][i])}: {t['days'][i]} days, gross {t['gross'][i]:,.0f} SEK "
+                f"(avg {t['avg_gross'][i]:,.0f}/day), hot drinks {_pct(t['hot_drink_ratio'][i])}, "
+                f"bakery attach {_pct(t['bakery_attach_rate'][i])}"
+            )
+        latest = datetime.date.fromisoformat(str(self.day_dates[-1]))
+        month = latest.year * 100 + latest.month
+        pattern = []
+        for wd in range(7):
+            cmp = self.weekday_compare(wd, month)
+            if cmp["month"] is not None:
+                change = f" ({cmp['change_pct']:+.0f}% vs last month)" if cmp["change_pct"] is not None else ""
+                pattern.append(f"{cmp['weekday']} {cmp['month']:,.0f}{change}")
+        if pattern:
+            lines.append(f"Avg gross by weekday, {period_label('month', month)}: " + "; ".join(pattern))
+        t = self.table("week")
+        recent = slice(max(0, len(t["keys"]) - weeks), len(t["keys"]))
+        totals = self.levels["week"]["cats"][recent].sum(axis=0)
+        for j in np.argsort(totals)[::-1][:4]:
+            if not totals[j]:
+                break
+            keys, amounts, _ = self.category_series(self.categories[j], "week")
+            trend = ", ".join(f"{period_label('week', k)} {a:,.0f}" for k, a in zip(keys[recent], amounts[recent]))
+            lines.append(f"{self.categories[j]} by week: {trend}")
+        return "\n".join(lines)
+
+
+def _pct(value) -> str:
+    return "n/a" if value is None or np.isnan(value) else f"{value * 100:.0f}%"
+
+
+def _read(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_cube(reports_dir: str = None, path: str = None) -> SalesCube:
+    """
+    The current site's cube, loaded from disk once per process and synced with
+    daily_reports/ whenever the directory changes.
+    """
+    reports_dir = reports_dir or report_index.default_reports_dir()
+    path = path or cube_path()
+    try:
+        dir_mtime = os.stat(reports_dir).st_mtime_ns
+    except FileNotFoundError:
+        dir_mtime = None
+
+    with _cubes_lock:
+        cube, synced_at = _cubes.get(path, (None, None))
+        if cube is None:
+            try:
+                cube = SalesCube.load(path)
+            except (OSError, KeyError, ValueError):
+                cube = SalesCube()
+        if synced_at != dir_mtime:
+            if cube.sync(reports_dir) or not os.path.exists(path):
+                cube.save(path)
+        _cubes[path] = (cube, dir_mtime)
+        return cube
+
+
+def refresh(reports_dir: str = None, path: str = None) -> SalesCube:
+    """
+    Sync now, even if the directory mtime is unchanged (a report overwritten in place).
+    Only new or changed reports are read. Called after an upload.
+    """
+    path = path or cube_path()
+    with _cubes_lock:
+        _cubes[path] = (_cubes.get(path, (None, None))[0], None)
+    return get_cube(reports_dir, path)
+
+
+def rebuild(reports_dir: str = None, path: str = None) -> SalesCube:
+    """Build the cube from scratch (e.g. after changing MEASURES)."""
+    path = path or cube_path()
+    cube = SalesCube()
+    cube.sync(reports_dir)
+    cube.save(path)
+    with _cubes_lock:
+        _cubes.pop(path, None)
+    return get_cube(reports_dir, path)
+
+
+if __name__ == "__main__":
+    cube = rebuild()
+    print(f"--- Sales Cube: {len(cube.day_dates)} days, {len(cube.categories)} categories ---")
+    print(cube.prompt_summary())
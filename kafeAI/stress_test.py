@@ -5,7 +5,10 @@ import sys
 # Add current directory to path so we can import manageragent
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from manageragent import app, AgentState
+from agent_client import get_app
+
+# Runs against the agent service when AGENT_SERVICE_URL is set (exercises its worker pool)
+app = get_app()
 
 def run_stress_test(iterations=2):
     print(f"--- Starting Stress Test ({iterations} iterations) ---")
@@ -18,7 +21,7 @@ def run_stress_test(iterations=2):
         start_time = time.time()
         
         config = {"configurable": {"thread_id": f"stress_test_{i}"}}
-        inputs = {"issue": "Stress Test", "context": [], "feedback": ""}
+        inputs = {"issue": "Stress Test", "feedback": ""}
         
         try:
             # Phase 1: Run to interrupt
@@ -31,7 +34,7 @@ def run_stress_test(iterations=2):
             snapshot = app.get_state(config)
             if snapshot.next:
                 # We supply dummy feedback
-                app.update_state(config, {"context": ["Human Feedback: Approved via Stress Test"]}, as_node="stock_manager")
+                app.update_state(config, {"feedback": "Approved via Stress Test"}, as_node="creative")
                 
                 # Resume
                 print("  > Phase 3: Resuming execution...")
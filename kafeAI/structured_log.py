@@ -0,0 +1,229 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 结构化日志：所有进程 (Streamlit / Twilio / WhatsApp) 写入同一个 SQLite 日志库
+# 每条记录带 node / thread_id / run_id，Monitor 页按 id 增量读取
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOG_DB_PATH = os.path.join(BASE_PATH, "logs", "kafeai_logs.db")
+
+MAX_ROWS = 50000          # rotation: oldest rows beyond this are deleted
+MAX_BYTES = 50 * 1024 * 1024  # rotation: database size bound (trimmed to 3/4 of it when exceeded)
+ROTATE_CHECK_EVERY = 500  # inserts between rotation checks
+PROCESS_NAME = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else "python"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts        REAL NOT NULL,
+    level     TEXT NOT NULL,
+    node      TEXT,
+    thread_id TEXT,
+    run_id    TEXT,
+    process   TEXT,
+    pid       INTEGER,
+    message   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_logs_level ON logs(level);
+CREATE INDEX IF NOT EXISTS idx_logs_node ON logs(node);
+CREATE INDEX IF NOT EXISTS idx_logs_run ON logs(run_id);
+"""
+
+_thread_id = contextvars.ContextVar("kafeai_thread_id", default=None)
+_run_id = contextvars.ContextVar("kafeai_run_id", default=None)
+
+
+@contextmanager
+def run_context(thread_id: str = None, run_id: str = None):
+    """Tag every log record emitted inside the block with thread_id / run_id."""
+    t1 = _thread_id.set(thread_id)
+    t2 = _run_id.set(run_id)
+    try:
+        yield
+    finally:
+        _thread_id.reset(t1)
+        _run_id.reset(t2)
+
+
+def current_run_id() -> str:
+    """run_id of the enclosing run_context() (None outside one)."""
+    return _run_id.get()
+
+
+def _normalize_level(levelname: str) -> str:
+    return {"WARNING": "WARN", "CRITICAL": "ERROR"}.get(levelname, levelname)
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    path = path or LOG_DB_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    # Lets rotation hand freed pages back to the OS (only takes effect on a new file, before WAL)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class SQLiteLogHandler(logging.Handler):
+    """Appends records to the shared log database; WAL mode lets processes write concurrently."""
+
+    def __init__(self, path: str = None):
+        super().__init__()
+        self.path = path or LOG_DB_PATH
+        self._local = threading.local()
+        self._inserts = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT INTO logs (ts, level, node, thread_id, run_id, process, pid, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record.created,
+                    _normalize_level(record.levelname),
+                    getattr(record, "node", record.name),
+                    getattr(record, "thread_id", None) or _thread_id.get(),
+                    getattr(record, "run_id", None) or _run_id.get(),
+                    PROCESS_NAME,
+                    record.process,
+                    record.getMessage(),
+                ),
+            )
+            conn.commit()
+            self._inserts += 1
+            if self._inserts % ROTATE_CHECK_EVERY == 0:
+                self._rotate(conn)
+        except Exception:
+            self.handleError(record)
+
+    @staticmethod
+    def _rotate(conn: sqlite3.Connection):
+        low, high = conn.execute("SELECT MIN(id), MAX(id) FROM logs").fetchone()
+        if high is None:
+            return
+        cutoff = high - MAX_ROWS
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if pages * page_size > MAX_BYTES:
+            # Keep as many of the newest rows as fit in three quarters of MAX_BYTES
+            keep = int((high - low + 1) * 0.75 * MAX_BYTES / (pages * page_size))
+            cutoff = max(cutoff, high - keep)
+        if cutoff < low:
+            return
+        conn.execute("DELETE FROM logs WHERE id <= ?", (cutoff,))
+        conn.commit()
+        # Shrink the file, not just the row count
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # executescript steps the pragma to completion (execute() frees a single page)
+            conn.executescript("PRAGMA incremental_vacuum;")
+        else:
+            # Log databases created before auto_vacuum: one full VACUUM converts them
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+class _ConsoleFormatter(logging.Formatter):
+    """Keeps the familiar '[Node]: message' console style."""
+
+    def format(self, record):
+        return f"[{getattr(record, 'node', record.name)}]: {record.getMessage()}"
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _configure():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        root = logging.getLogger("kafeai")
+        root.setLevel(logging.INFO)
+        root.propagate = False
+        root.addHandler(SQLiteLogHandler())
+        console = logging.StreamHandler()
+        console.setFormatter(_ConsoleFormatter())
+        root.addHandler(console)
+        _configured = True
+
+
+def get_logger(node: str) -> logging.LoggerAdapter:
+    """Logger for one agent / service, e.g. get_logger("Router")."""
+    _configure()
+    return logging.LoggerAdapter(logging.getLogger(f"kafeai.{node}"), {"node": node})
+
+
+# ── Reading (Monitor tab) ─────────────────────────────────────
+_COLUMNS = ["id", "ts", "level", "node", "thread_id", "run_id", "process", "message"]
+
+_reader = None            # one connection shared by the Monitor tab's refreshes
+_reader_lock = threading.Lock()
+
+
+def _read(query: str, params=()) -> list:
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = _connect()
+        return _reader.execute(query, params).fetchall()
+
+
+def _query(after_id: int, level: str, node: str, run_id: str, limit: int, newest: bool) -> list:
+    if not os.path.exists(LOG_DB_PATH):
+        return []
+    query = f"SELECT {', '.join(_COLUMNS)} FROM logs WHERE id > ?"
+    params = [after_id]
+    for column, value in (("level", level), ("node", node), ("run_id", run_id)):
+        if value:
+            query += f" AND {column} = ?"
+            params.append(value)
+    query += f" ORDER BY id {'DESC' if newest else 'ASC'} LIMIT ?"
+    params.append(limit)
+
+    rows = _read(query, params)
+    if newest:
+        rows.reverse()
+    return [dict(zip(_COLUMNS, row)) for row in rows]
+
+
+def tail(after_id: int = 0, level: str = None, node: str = None, run_id: str = None, limit: int = 200) -> list:
+    """Records with id > after_id, oldest first, optionally filtered."""
+    return _query(after_id, level, node, run_id, limit, newest=False)
+
+
+def recent(after_id: int = 0, level: str = None, node: str = None, run_id: str = None, limit: int = 200) -> list:
+    """The newest `limit` records with id > after_id, returned oldest first."""
+    return _query(after_id, level, node, run_id, limit, newest=True)
+
+
+def latest_id() -> int:
+    if not os.path.exists(LOG_DB_PATH):
+        return 0
+    return _read("SELECT COALESCE(MAX(id), 0) FROM logs")[0][0]
+
+
+def distinct_values(column: str, since_seconds: float = 86400) -> list:
+    """Distinct node / run_id values seen recently (for filter dropdowns)."""
+    if column not in ("node", "run_id", "level") or not os.path.exists(LOG_DB_PATH):
+        return []
+    rows = _read(
+        f"SELECT DISTINCT {column} FROM logs WHERE ts >= ? AND {column} IS NOT NULL ORDER BY {column}",
+        (time.time() - since_seconds,),
+    )
+    return [r[0] for r in rows]
@@ -0,0 +1,137 @@
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# 多门店：每个门店 (tenant) 有独立的数据目录 (stock.json / Menu.md / memory.json / daily_reports/ ...)
+# 和独立配置 (城市、WhatsApp 管理员号码)。没有 tenants.json 时只有一个 "default" 门店，数据目录就是项目根目录。
+#
+# tenants.json:
+# {
+#   "default_tenant": "sundsvall",
+#   "tenants": [
+#     {"id": "sundsvall", "name": "Tant Anki Sundsvall", "city": "Sundsvall",
+#      "data_root": "sites/sundsvall", "admin_number": "whatsapp:+46..."}
+#   ]
+# }
+BASE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TENANTS_PATH = os.path.join(BASE_PATH, "tenants.json")
+DEFAULT_TENANT = "default"
+
+_current = contextvars.ContextVar("kafeai_tenant", default=None)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _default_registry() -> dict:
+    return {
+        "default_tenant": DEFAULT_TENANT,
+        "tenants": {
+            DEFAULT_TENANT: {
+                "id": DEFAULT_TENANT,
+                "name": os.getenv("SHOP_NAME", "kafeAI"),
+                "city": os.getenv("CITY", "Sundsvall"),
+                "data_root": BASE_PATH,
+                "admin_number": os.getenv("WHATSAPP_PHONE_NUMBER"),
+            }
+        },
+    }
+
+
+def load_tenants(path: str = None) -> dict:
+    """{"default_tenant": id, "tenants": {id: config}}, re-read only when tenants.json changes."""
+    path = path or TENANTS_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return _default_registry()
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        tenants = {}
+        for entry in raw.get("tenants", []):
+            root = entry.get("data_root") or os.path.join("sites", entry["id"])
+            tenants[entry["id"]] = {
+                "id": entry["id"],
+                "name": entry.get("name", entry["id"]),
+                "city": entry.get("city") or os.getenv("CITY", "Sundsvall"),
+                "data_root": root if os.path.isabs(root) else os.path.join(BASE_PATH, root),
+                "admin_number": entry.get("admin_number"),
+            }
+        registry = _default_registry() if not tenants else {
+            "default_tenant": raw.get("default_tenant") or next(iter(tenants)),
+            "tenants": tenants,
+        }
+        _cache[path] = (mtime, registry)
+        return registry
+
+
+def tenant_ids() -> list:
+    return list(load_tenants()["tenants"])
+
+
+def current_tenant_id() -> str:
+    """Tenant of the current run: tenant_scope() > KAFEAI_TENANT env > default tenant."""
+    return _current.get() or os.getenv("KAFEAI_TENANT") or load_tenants()["default_tenant"]
+
+
+def get_tenant(tenant_id: str = None) -> dict:
+    registry = load_tenants()
+    tenant_id = tenant_id or current_tenant_id()
+    if tenant_id not in registry["tenants"]:
+        raise KeyError(f"Unknown tenant '{tenant_id}'")
+    return registry["tenants"][tenant_id]
+
+
+@contextmanager
+def tenant_scope(tenant_id: str = None):
+    """Resolve all data paths inside the block against tenant_id's data root."""
+    token = _current.set(tenant_id or current_tenant_id())
+    try:
+        yield get_tenant()
+    finally:
+        _current.reset(token)
+
+
+def data_path(*parts: str, tenant_id: str = None) -> str:
+    """Path inside the tenant's data root, e.g. data_path("stock.json")."""
+    return os.path.join(get_tenant(tenant_id)["data_root"], *parts)
+
+
+def tenant_for_number(number: str) -> str:
+    """Tenant whose admin_number matches an incoming WhatsApp sender (default tenant otherwise)."""
+    normalized = (number or "").replace("whatsapp:", "").strip()
+    registry = load_tenants()
+    for tenant in registry["tenants"].values():
+        if normalized and (tenant.get("admin_number") or "").replace("whatsapp:", "").strip() == normalized:
+            return tenant["id"]
+    return registry["default_tenant"]
+
+
+def run_for_tenants(fn, ids: list = None, max_workers: int = None) -> dict:
+    """
+    Call fn(tenant_id) for every tenant concurrently, each inside its own tenant_scope.
+    LLM calls inside share the process-wide rate limiter, so N sites take about as
+    long as the slowest one. Returns {tenant_id: result or Exception}.
+    """
+    ids = ids or tenant_ids()
+
+    def _run(tenant_id):
+        with tenant_scope(tenant_id):
+            return fn(tenant_id)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(ids) or 1, thread_name_prefix="kafeai-tenant") as pool:
+        futures = {tenant_id: pool.submit(_run, tenant_id) for tenant_id in ids}
+        for tenant_id, future in futures.items():
+            try:
+                results[tenant_id] = future.result()
+            except Exception as e:
+                results[tenant_id] = e
+    return results
@@ -0,0 +1,65 @@
+import os
+import time
+import threading
+import requests
+from resilience import get_breaker, bounded_timeout
+
+# 天气预报 (weatherapi.com)：predictor 节点和夜间预计算的输入指纹 (briefing_scheduler) 共用
+# 天气预报缓存：同一城市的门店共用一次 API 请求
+WEATHER_CACHE_TTL = 1800  # seconds
+WEATHER_TIMEOUT = 5       # seconds per request
+
+_weather_cache = {}
+_weather_lock = threading.Lock()
+
+
+def _request_forecast(url: str):
+    """weatherapi.com response; raises on timeouts / 429 / 5xx so the breaker counts the outage."""
+    response = requests.get(url, timeout=bounded_timeout(WEATHER_TIMEOUT))
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RuntimeError(f"Weather API unavailable ({response.status_code})")
+    return response
+
+
+def fetch_forecast(city: str) -> dict:
+    """weatherapi.com 2-day forecast for city, cached for WEATHER_CACHE_TTL seconds."""
+    now = time.time()
+    with _weather_lock:
+        cached = _weather_cache.get(city.lower())
+        if cached and now - cached[0] < WEATHER_CACHE_TTL:
+            return cached[1]
+    api_key = os.getenv("WEATHER_API_KEY")
+    url = f"http://api.weatherapi.com/v1/forecast.json?key={api_key}&q={city}&days=2&aqi=no"
+    response = get_breaker("weather").call(_request_forecast, url)
+    data = response.json()
+    if "forecast" in data:
+        with _weather_lock:
+            _weather_cache[city.lower()] = (now, data)
+    return data
+
+
+def tomorrow(city: str):
+    """(target_date, structured weather) for tomorrow in city (index 1 of the forecast)."""
+    day = fetch_forecast(city)["forecast"]["forecastday"][1]
+    return day["date"], _structured(city, day)
+
+
+def for_date(city: str, date: str):
+    """Structured weather for an ISO date in city, or None when it is outside the 2-day forecast."""
+    for day in fetch_forecast(city)["forecast"]["forecastday"]:
+        if day["date"] == date:
+            return _structured(city, day)
+    return None
+
+
+def _structured(city: str, day: dict) -> dict:
+    forecast = day["day"]
+    return {
+        "city": city,
+        "condition": forecast["condition"]["text"],
+        "avg_temp_c": forecast["avgtemp_c"],
+        "min_temp_c": forecast.get("mintemp_c"),
+        "rain_chance": forecast["daily_chance_of_rain"],
+        "snow_chance": forecast.get("daily_chance_of_snow", 0),
+        "precip_mm": forecast.get("totalprecip_mm", 0),
+    }
@@ -1,8 +1,7 @@
 import asyncio
 import os
 import sys
-import json
-import time
+import uuid
 from playwright.async_api import async_playwright
 from dotenv import load_dotenv
 
@@ -12,17 +11,30 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Load environment variables
 load_dotenv()
 
-# Import the LangGraph app
+# Import the LangGraph app (the agent service when AGENT_SERVICE_URL is set, see agent_client.py)
 try:
-    from manageragent import app
+    from agent_client import get_app, release_thread
+    app = get_app()
 except ImportError as e:
     print(f"❌ Error importing manageragent: {e}")
     sys.exit(1)
+from agent_routing import route_for
+
+from structured_log import get_logger, run_context
+from agent_reports import update_text
+from whatsapp_web import ChatPage, HEADLESS, INPUT_SELECTOR, chat_key, launch, sender_loop
+import briefing_scheduler
+import conversation_store
+import tenants
+
+log = get_logger("WhatsApp Bot")
 
 # Configuration
 USER_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "whatsapp_session")
 TARGET_NUMBER = os.getenv("WHATSAPP_PHONE_NUMBER")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+POLL_INTERVAL = 5     # seconds between checks for new incoming messages
+WORKERS = int(os.getenv("WHATSAPP_WORKERS", "3"))   # workflow runs in parallel across all chats
 
 if not GOOGLE_API_KEY:
     print("❌ GOOGLE_API_KEY or GEMINI_API_KEY not found in .env")
@@ -31,58 +43,132 @@ if not GOOGLE_API_KEY:
 # Ensure GOOGLE_API_KEY is set in environment for LangChain
 os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 
-async def send_whatsapp_message(page, message):
-    """Types and sends a message in the currently active chat."""
-    try:
-        input_selector = 'div[contenteditable="true"]'
-        await page.wait_for_selector(input_selector)
-        
-        # Click the input box
-        await page.click(input_selector)
-        
-        # Clear any existing text (optional but safer)
-        # Type the message
-        # Use fill if possible, or type
-        await page.type(input_selector, message)
-        await asyncio.sleep(0.5)
-        await page.press(input_selector, "Enter")
-        print(f"📤 Sent response to WhatsApp.")
-    except Exception as e:
-        print(f"❌ Failed to send message: {e}")
+CONVERSATION_PREFIX = "wa_"
+
+
+def authorised_chats() -> dict:
+    """
+    Chats the bot answers: WHATSAPP_CHATS="+46701234567, Kafe Team=kafe_sodermalm"
+    (chat name or number, optionally =tenant). Defaults to WHATSAPP_PHONE_NUMBER.
+    Returns {chat: tenant_id}.
+    """
+    entries = [e.strip() for e in (os.getenv("WHATSAPP_CHATS") or TARGET_NUMBER or "").split(",") if e.strip()]
+    chats = {}
+    for entry in entries:
+        chat, _, tenant_id = entry.partition("=")
+        chat = chat.strip()
+        chats[chat] = tenant_id.strip() or tenants.tenant_for_number(chat)
+    return chats
+
+
+class ChatSession:
+    """Per-chat state: its own work queue, conversation and site."""
+
+    def __init__(self, chat: str, tenant_id: str):
+        self.chat = chat
+        self.key = chat_key(chat)
+        self.tenant_id = tenant_id
+        self.conversation_id = CONVERSATION_PREFIX + self.key.lstrip("+")
+        self.inbox = asyncio.Queue()
+        self.last_seen = None     # (message id, text) pairs at the last read; None until the first read
+
+
+def _new_messages(messages: list, last_seen: list) -> list:
+    """
+    Texts of the incoming (id, text) messages that arrived since last_seen (the messages
+    seen at the previous read). Compared by message id, so the same text sent twice counts twice;
+    without ids (WhatsApp Web DOM change) the message count is compared instead.
+    """
+    if not messages:
+        return []
+    if any(mid is None for mid, _ in messages + last_seen):
+        return [text for _, text in messages[len(last_seen):]]
+    # 找到上次读取的最后一条 (按 id) 在当前列表中的位置
+    seen = {mid for mid, _ in last_seen}
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i][0] in seen:
+            return [text for _, text in messages[i + 1:]]
+    if not last_seen:
+        return [text for _, text in messages]
+    # 上次的消息已滚出页面：只处理最新一条
+    return [messages[-1][1]]
 
-async def get_last_incoming_message(page):
-    """Retrieves the last message that was NOT sent by the bot."""
-    try:
-        # WhatsApp Web message selectors can be tricky and change often
-        # This is a common pattern for incoming messages
-        messages = await page.query_selector_all('div.message-in')
-        if not messages:
-            return None
-        
-        last_msg = messages[-1]
-        # Extract text content
-        text_element = await last_msg.query_selector('span.selectable-text')
-        if text_element:
-            text = await text_element.inner_text()
-            return text.strip()
-    except Exception as e:
-        print(f"❌ Error reading messages: {e}")
-    return None
 
-async def run_kafeai_workflow(query):
+async def poll_chat(chat_page, session: ChatSession) -> list:
+    """New incoming messages of one chat; the first read only records a baseline."""
+    messages = await chat_page.read(session.chat)
+    if session.last_seen is None:
+        session.last_seen = messages
+        return []
+    new = _new_messages(messages, session.last_seen)
+    session.last_seen = messages
+    return new
+
+
+async def chat_worker(session: ChatSession, pool: asyncio.Semaphore, outgoing: asyncio.Queue):
+    """Answers one chat's messages in order; runs share the bounded worker pool with other chats."""
+    while True:
+        query = await session.inbox.get()
+        try:
+            async with pool:
+                response = await run_kafeai_workflow(query, session.conversation_id, session.tenant_id)
+            outgoing.put_nowait((session.chat, response))
+        except Exception as e:
+            log.error(f"Workflow failed for {session.chat}: {e}")
+            outgoing.put_nowait((session.chat, f"❌ System Error: {e}"))
+        finally:
+            session.inbox.task_done()
+
+
+async def run_kafeai_workflow(query, conversation_id, tenant_id):
     """Runs the LangGraph workflow and returns the final decision/result."""
-    print(f"🧠 Processing query via kafeAI: {query}")
-    config = {"configurable": {"thread_id": "whatsapp_bot"}}
-    inputs = {"issue": query, "context": [], "feedback": ""}
+    # 每条消息一个新的运行线程；对话历史另存 (conversation_store)，提示词长度不随聊天天数增长
+    thread_id = conversation_store.new_thread_id(conversation_id)
+    # 在工作线程中运行 (每个节点有时间预算)，浏览器事件循环不会被阻塞；
+    # 该聊天对应门店的数据目录 (tenant_scope 随 to_thread 一起传入工作线程)
+    with tenants.tenant_scope(tenant_id), run_context(thread_id=thread_id, run_id=uuid.uuid4().hex[:12]):
+        try:
+            answer = await asyncio.to_thread(_run_kafeai_workflow, query, thread_id, conversation_id)
+        finally:
+            release_thread(thread_id)
+        conversation_store.append(conversation_id, "user", query)
+        conversation_store.append(conversation_id, "assistant", answer)
+    return answer
+
+
+def _run_kafeai_workflow(query, thread_id, conversation_id):
+    log.info(f"Processing query via kafeAI: {query}")
+    config = {"configurable": {"thread_id": thread_id}}
+    inputs = {
+        "issue": query,
+        "history": conversation_store.history_text(conversation_id),
+        "feedback": "",
+        "tenant_id": tenants.current_tenant_id(),
+    }
     
     final_output = []
     
     try:
-        # Phase 1: Run until HITL
-        for output in app.stream(inputs, config=config):
-            for node_name, content in output.items():
-                if "context" in content:
-                    final_output.append(f"[{node_name}] {content['context'][-1]}")
+        if route_for(query)[0] == "single":
+            # @mention 快速问答：不经过 HITL，只回复 quick_manager 的答案
+            for output in app.stream(inputs, config=config):
+                if "quick_manager" in output:
+                    final_output.append(output["quick_manager"]["decision"])
+            return "\n\n".join(final_output)
+
+        # 完整报告且夜间预计算仍然有效时，直接恢复 Phase 1 的结果
+        record = briefing_scheduler.load_precomputed()
+        if record:
+            log.info(f"Using precomputed briefing for {record['target_date']}")
+            briefing_scheduler.restore(app, config, record, inputs)
+            final_output.append(record["summary"])
+        else:
+            # Phase 1: Run until HITL
+            for output in app.stream(inputs, config=config):
+                for node_name, content in output.items():
+                    text = update_text(node_name, content)
+                    if text:
+                        final_output.append(f"[{node_name}] {text}")
         
         # Check if we are at the HITL point (before manager)
         snapshot = app.get_state(config)
@@ -99,90 +185,91 @@ async def run_kafeai_workflow(query):
                 for node_name, content in output.items():
                     if node_name == "manager":
                         final_output.append(f"🤖 COO Decision:\n{content['decision']}")
-                    elif "context" in content:
-                        final_output.append(f"✅ {node_name}: {content['context'][-1]}")
+                    elif update_text(node_name, content):
+                        final_output.append(f"✅ {node_name}: {update_text(node_name, content)}")
         
         return "\n\n".join(final_output)
     except Exception as e:
         return f"❌ System Error: {str(e)}"
 
 async def start_bot():
+    chats = authorised_chats()
     print("\n" + "="*50)
     print("🤖 [kafeAI WhatsApp Bot Mode]")
-    print(f"Target Admin: {TARGET_NUMBER}")
+    for chat, tenant_id in chats.items():
+        print(f"Chat: {chat} -> {tenant_id}")
+    print(f"Workers: {WORKERS} | Headless: {HEADLESS}")
     print("Connecting to WhatsApp Session...")
     print("="*50 + "\n")
 
     async with async_playwright() as p:
-        context = await p.chromium.launch_persistent_context(
-            user_data_dir=USER_DATA_DIR,
-            headless=False, # Keep visible so user can see what's happening
-            args=["--no-sandbox", "--disable-setuid-sandbox"]
-        )
+        context = await launch(p, USER_DATA_DIR)
         
         page = context.pages[0] if context.pages else await context.new_page()
         await page.goto("https://web.whatsapp.com")
         
         print("⏳ Waiting for WhatsApp Web to load...")
         try:
-            await page.wait_for_selector('div[contenteditable="true"]', timeout=60000)
+            await page.wait_for_selector(INPUT_SELECTOR, timeout=60000)
             print("✅ WhatsApp Web Ready.")
         except:
-            print("❌ Timeout waiting for WhatsApp Web. Is the session valid?")
+            print("❌ Timeout waiting for WhatsApp Web. Is the session valid? (python setup/wa_linker.py)")
             await context.close()
             return
 
-        # 1. Find the chat with the admin
-        print(f"🔍 Looking for chat with {TARGET_NUMBER}...")
-        try:
-            # Search for the contact
-            search_box = await page.wait_for_selector('div[contenteditable="true"][data-tab="3"]')
-            await search_box.click()
-            await search_box.fill(TARGET_NUMBER)
-            await asyncio.sleep(2)
-            await page.press('div[contenteditable="true"][data-tab="3"]', "Enter")
-            print(f"✅ Active chat set to {TARGET_NUMBER}")
-        except Exception as e:
-            print(f"⚠️ Could not automatically find chat: {e}")
-            print("Please manually select the chat in the browser window.")
+        chat_page = ChatPage(page)
+        sessions = {}
+        for chat, tenant_id in chats.items():
+            session = ChatSession(chat, tenant_id)
+            try:
+                # 记录每个聊天当前的消息 (启动前的消息不处理)
+                await poll_chat(chat_page, session)
+                print(f"✅ Watching {chat}")
+            except Exception as e:
+                print(f"⚠️ Could not open chat {chat}: {e}")
+            sessions[session.key] = session
 
-        last_seen_message = ""
+        # 发送与读取分开：回复进入队列，由 sender_loop 依次发送；
+        # 每个聊天一个工作队列 (同一聊天按顺序回答)，所有聊天共用 WORKERS 个工作流名额
+        outgoing = asyncio.Queue()
+        sender = asyncio.create_task(sender_loop(chat_page, outgoing))
+        pool = asyncio.Semaphore(WORKERS)
+        workers = {key: asyncio.create_task(chat_worker(s, pool, outgoing)) for key, s in sessions.items()}
         
         print("🚀 Bot is now listening for messages...")
         
         while True:
             try:
-                current_msg = await get_last_incoming_message(page)
-                
-                if current_msg and current_msg != last_seen_message:
-                    print(f"📩 New message received: {current_msg}")
-                    last_seen_message = current_msg
-                    
-                    # Optional: Only trigger if message starts with a keyword or just any message
-                    # Let's assume any message from the admin triggers the AI
-                    
-                    await send_whatsapp_message(page, "⏳ KafeAI is thinking... please wait.")
-                    
-                    # Run kafeAI Logic
-                    response = await run_kafeai_workflow(current_msg)
-                    
-                    # Send response back (might need to split if too long)
-                    if len(response) > 4000:
-                        # Simple split
-                        parts = [response[i:i+4000] for i in range(0, len(response), 4000)]
-                        for part in parts:
-                            await send_whatsapp_message(page, part)
-                    else:
-                        await send_whatsapp_message(page, response)
+                # 只读取有未读标记的聊天和当前打开的聊天 (打开的聊天收到消息时不显示未读标记)
+                # 侧栏按标题匹配：按号码配置的已保存联系人，标题是打开时记录的联系人名字
+                by_title = {chat_page.title_key(s.chat): key for key, s in sessions.items()}
+                due = {by_title[t] for t in await chat_page.unread_chats() if t in by_title}
+                if chat_page.current:
+                    due.add(chat_key(chat_page.current))
+                for key in due:
+                    session = sessions[key]
+                    for message in await poll_chat(chat_page, session):
+                        log.info(f"New message from {session.chat}: {message}")
+                        outgoing.put_nowait((session.chat, "⏳ KafeAI is thinking... please wait."))
+                        session.inbox.put_nowait(message)
                 
-                await asyncio.sleep(5) # Poll every 5 seconds
+                if sender.done():
+                    log.warning(f"Sender stopped ({sender.exception()}), restarting")
+                    sender = asyncio.create_task(sender_loop(chat_page, outgoing))
+                # 某个聊天的工作任务意外退出时重启 (排队的消息仍在 session.inbox 中)
+                for key, worker in workers.items():
+                    if worker.done():
+                        error = worker.exception() if not worker.cancelled() else "cancelled"
+                        log.warning(f"Worker for {sessions[key].chat} stopped ({error}), restarting")
+                        workers[key] = asyncio.create_task(chat_worker(sessions[key], pool, outgoing))
+                await asyncio.sleep(POLL_INTERVAL)
             except Exception as e:
-                print(f"⚠️ Loop error: {e}")
+                log.warning(f"Loop error: {e}")
                 await asyncio.sleep(10)
 
 if __name__ == "__main__":
-    if not TARGET_NUMBER:
-        print("❌ WHATSAPP_PHONE_NUMBER not set in .env")
+    if not authorised_chats():
+        print("❌ WHATSAPP_CHATS / WHATSAPP_PHONE_NUMBER not set in .env")
     else:
         try:
             asyncio.run(start_bot())
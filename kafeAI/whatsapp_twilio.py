@@ -1,93 +1,134 @@
 import os
 import sys
+import uuid
 import threading
 from flask import Flask, request
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.rest import Client
 from dotenv import load_dotenv
 
 # Load environment
 load_dotenv()
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import kafeAI core logic
+# Import kafeAI core logic (the agent service when AGENT_SERVICE_URL is set, see agent_client.py)
 try:
-    from manageragent import app
+    from agent_client import get_app, release_thread
+    app = get_app()
 except ImportError as e:
     print(f"❌ Could not import manageragent: {e}")
     sys.exit(1)
+from agent_routing import route_for
+
+from structured_log import get_logger, run_context
+from agent_reports import text_of
+import briefing_scheduler
+import conversation_store
+import outbox
+import tenants
+
+log = get_logger("Twilio")
 
 app_flask = Flask(__name__)
 
-# Twilio Client Configuration
-account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-twilio_from = os.getenv('TWILIO_FROM_NUMBER')
-twilio_client = Client(account_sid, auth_token)
+# 回复经由发件箱发送 (outbox.py)：持久化、按段落拆分、按收件人排序、失败重试
+
+# Phase 1 的哪些报告发到 WhatsApp：node -> (标题, 最大长度)
+SUMMARY_SECTIONS = {
+    "predictor": ("🌤️ 预测", None),
+    "stock_manager": ("📦 库存", 300),
+}
+
+
+def _summarize(reports, final_output):
+    """Phase 1 reports ({node: report}) -> short WhatsApp sections."""
+    for node, (title, limit) in SUMMARY_SECTIONS.items():
+        entry = reports.get(node)
+        if not entry:
+            continue
+        text = entry["text"].strip()
+        if limit and len(text) > limit:
+            text = text[:limit] + "..."
+        final_output.append(f"{title}：\n{text}")
+
+
+def _run_full_report(config, inputs, final_output):
+    """Phase 1 (or the precomputed briefing) + Phase 2, appending WhatsApp sections."""
+    # 完整报告且夜间预计算仍然有效时，直接恢复 Phase 1 的结果
+    record = briefing_scheduler.load_precomputed()
+    if record:
+        log.info(f"Using precomputed briefing for {record['target_date']}")
+        briefing_scheduler.restore(app, config, record, inputs)
+        _summarize(record["values"].get("reports") or {}, final_output)
+    else:
+        # Phase 1: Gathering inputs
+        for output in app.stream(inputs, config=config):
+            for node_name, content in output.items():
+                if content and content.get("reports"):
+                    _summarize(content["reports"], final_output)
+    
+    # Phase 2: Resume for final decision
+    for output in app.stream(None, config=config):
+        for node_name, content in output.items():
+            if node_name == "manager":
+                final_output.append(f"📊 核心决策：\n{content['decision']}")
+            elif node_name == "executor":
+                final_output.append(f"✅ 执行：{text_of(content, 'executor')}")
+
 
 def process_ai_and_respond(sender_number, incoming_msg):
     """Background task to run LangGraph and send result back via Twilio REST API."""
-    print(f"🧠 [Background] Processing for {sender_number}...")
-    
-    config = {"configurable": {"thread_id": f"sms_{sender_number}"}}
-    inputs = {"issue": incoming_msg, "context": [], "feedback": ""}
+    # 每条消息一个新的运行线程；对话历史另存 (conversation_store)，提示词长度不随聊天天数增长
+    conversation_id = f"sms_{sender_number}"
+    thread_id = conversation_store.new_thread_id(conversation_id)
+    # 按发送者号码找到对应门店，本次运行的所有数据都读写该门店的目录
+    tenant_id = tenants.tenant_for_number(sender_number)
+    with tenants.tenant_scope(tenant_id), run_context(thread_id=thread_id, run_id=uuid.uuid4().hex[:12]):
+        try:
+            _process_ai_and_respond(sender_number, incoming_msg, conversation_id, thread_id, tenant_id)
+        finally:
+            release_thread(thread_id)
+
+
+def _process_ai_and_respond(sender_number, incoming_msg, conversation_id, thread_id, tenant_id):
+    log.info(f"Processing for {sender_number} ({tenant_id})...")
     
-    final_output = ["🤖 kafeAI COO 决策报告："]
+    config = {"configurable": {"thread_id": thread_id}}
+    inputs = {
+        "issue": incoming_msg,
+        "history": conversation_store.history_text(conversation_id),
+        "feedback": "",
+        "tenant_id": tenant_id,
+    }
     
     try:
-        # Phase 1: Gathering inputs
-        for output in app.stream(inputs, config=config):
-            for node_name, content in output.items():
-                if "context" in content:
-                    msg = content['context'][-1]
-                    if "Predictor:" in msg:
-                        final_output.append(f"🌤️ 预测：\n{msg.split('Predictor:')[1].strip()}")
-                    elif "Inventory Steward" in msg:
-                        text = msg.split('Analysis:')[1].strip()
-                        final_output.append(f"📦 库存：\n{text[:300]}...")
+        if route_for(incoming_msg)[0] == "single":
+            # @mention 快速问答：不经过 HITL，只回复 quick_manager 的答案
+            final_output = [
+                output["quick_manager"]["decision"]
+                for output in app.stream(inputs, config=config) if "quick_manager" in output
+            ]
+        else:
+            final_output = ["🤖 kafeAI COO 决策报告："]
+            _run_full_report(config, inputs, final_output)
         
-        # Phase 2: Resume for final decision
-        for output in app.stream(None, config=config):
-            for node_name, content in output.items():
-                if node_name == "manager":
-                    final_output.append(f"📊 核心决策：\n{content['decision']}")
-                elif node_name == "executor":
-                    final_output.append(f"✅ 执行：{content['context'][-1]}")
-                    
         response_text = "\n\n---\n\n".join(final_output)
+        conversation_store.append(conversation_id, "user", incoming_msg)
+        conversation_store.append(conversation_id, "assistant", response_text)
         
-        # Split and send if too long
-        if len(response_text) > 1600:
-            parts = [response_text[i:i+1500] for i in range(0, len(response_text), 1500)]
-            for part in parts:
-                twilio_client.messages.create(
-                    from_=twilio_from,
-                    to=sender_number,
-                    body=part
-                )
-        else:
-            twilio_client.messages.create(
-                from_=twilio_from,
-                to=sender_number,
-                body=response_text
-            )
-        print(f"📤 [Background] Response sent to {sender_number}")
+        ids = outbox.enqueue(sender_number, response_text)
+        log.info(f"Response queued for {sender_number} ({len(ids)} message(s))")
         
     except Exception as e:
         error_msg = f"❌ kafeAI 处理出错: {str(e)}"
-        print(f"  [Error] {error_msg}")
-        twilio_client.messages.create(
-            from_=twilio_from,
-            to=sender_number,
-            body=error_msg
-        )
+        log.error(error_msg)
+        outbox.enqueue(sender_number, error_msg)
 
 @app_flask.route("/whatsapp", methods=['POST'])
 def whatsapp_webhook():
     incoming_msg = request.values.get('Body', '').strip()
     sender_number = request.values.get('From', '')
     
-    print(f"📩 [Webhook] Request from {sender_number}: {incoming_msg}")
+    log.info(f"Webhook request from {sender_number}: {incoming_msg}")
     
     # Start background processing
     threading.Thread(target=process_ai_and_respond, args=(sender_number, incoming_msg)).start()
@@ -97,9 +138,22 @@ def whatsapp_webhook():
     resp.message("🕒 收到。kafeAI 正在进行多维度分析，请稍候...")
     return str(resp)
 
+@app_flask.route("/twilio/status", methods=['POST'])
+def twilio_status_callback():
+    """Delivery status for messages sent from the outbox (set TWILIO_STATUS_CALLBACK_URL to this route)."""
+    sid = request.values.get('MessageSid', '')
+    status = request.values.get('MessageStatus', '')
+    if not outbox.update_status(sid, status, request.values.get('ErrorCode')):
+        log.warning(f"Status '{status}' for unknown message {sid}")
+    elif status in ("undelivered", "failed"):
+        log.warning(f"Message {sid} {status} (error {request.values.get('ErrorCode')})")
+    return "", 204
+
 if __name__ == "__main__":
     print("\n" + "="*50)
     print("🚀 kafeAI Twilio PRO Mode Started")
     print("   Listening on Port 5000")
     print("="*50 + "\n")
+    briefing_scheduler.start_scheduler()
+    outbox.start_dispatcher()  # also sends anything left queued by a previous run
     app_flask.run(port=5000)
@@ -0,0 +1,178 @@
+import os
+import re
+import asyncio
+from outbox import split_message
+from structured_log import get_logger
+
+# WhatsApp Web (Playwright) 的页面操作：
+# - 浏览器：沿用 wa_linker 的持久化登录目录，默认无头运行，屏蔽图片和媒体下载以减少 CPU / 内存
+# - 一个页面服务多个聊天 (ChatPage)：切换聊天、读取消息、发送都在同一把锁下进行
+# - 发送：整行 insertText 代替逐字符输入，长回复按段落拆分，由单独的发送队列依次发送
+# 基准测试：python bench_whatsapp_send.py
+# WhatsApp Web 的 DOM 经常变化，选择器集中在这里
+
+log = get_logger("WhatsApp Bot")
+
+HEADLESS = os.getenv("WHATSAPP_HEADLESS", "1") != "0"
+# 无头 Chromium 的默认 UA 含 "HeadlessChrome"，WhatsApp Web 会拒绝
+USER_AGENT = os.getenv(
+    "WHATSAPP_USER_AGENT",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+)
+BROWSER_ARGS = [
+    "--no-sandbox", "--disable-setuid-sandbox",
+    "--blink-settings=imagesEnabled=false", "--mute-audio", "--disable-gpu",
+    "--autoplay-policy=user-gesture-required",
+]
+# Media and profile pictures (mmg / pps / media-*.cdn.whatsapp.net); static.whatsapp.net (JS/CSS) is kept
+MEDIA_URL_RE = re.compile(r"^https://(?!static\.|web\.)[\w.-]*whatsapp\.net/")
+
+INPUT_SELECTOR = 'div[contenteditable="true"]'
+SEARCH_SELECTOR = 'div[contenteditable="true"][data-tab="3"]'
+MAX_CHARS = 4000      # per WhatsApp Web message; longer replies are split at paragraph boundaries
+SEND_SETTLE = 0.2     # seconds for WhatsApp to register the inserted text before Enter
+SEARCH_SETTLE = 1.5   # seconds for the chat search results to appear
+TITLE_TIMEOUT = 5000  # ms to wait for the opened chat's header title
+
+# Title of the open chat, once it differs from `previous` (a saved contact shows its name, not its number)
+CHAT_TITLE_JS = """
+(previous) => {
+  const el = document.querySelector('#main header span[title], #main header span[dir="auto"]');
+  const title = el ? (el.getAttribute('title') || el.textContent || '').trim() : '';
+  return title && title !== previous ? title : null;
+}
+"""
+
+# Titles of sidebar chats that show an unread badge
+UNREAD_CHATS_JS = """
+() => Array.from(document.querySelectorAll('#pane-side [role="listitem"], #pane-side [role="row"]'))
+  .filter(row => row.querySelector('span[aria-label*="unread"]'))
+  .map(row => (row.querySelector('span[title]') || {}).title)
+  .filter(Boolean)
+"""
+
+# [data-id, text] of the incoming messages loaded in the open chat, oldest first
+INCOMING_MESSAGES_JS = """
+() => Array.from(document.querySelectorAll('div.message-in')).map(el => {
+  const row = el.closest('[data-id]') || el.querySelector('[data-id]');
+  const text = el.querySelector('span.selectable-text');
+  return [row ? row.getAttribute('data-id') : null, text ? text.innerText.trim() : null];
+}).filter(m => m[1])
+"""
+
+
+def chat_key(title: str) -> str:
+    """Comparable form of a chat title or number ("+46 70-123 45 67" -> "+46701234567")."""
+    return re.sub(r"[\s\-()]", "", (title or "").replace("whatsapp:", "")).lower()
+
+
+async def launch(playwright, user_data_dir: str, headless: bool = HEADLESS):
+    """Persistent-profile browser context (the session linked by setup/wa_linker.py) with media blocked."""
+    context = await playwright.chromium.launch_persistent_context(
+        user_data_dir=user_data_dir,
+        headless=headless,
+        user_agent=USER_AGENT if headless else None,
+        args=BROWSER_ARGS,
+    )
+    await context.route(MEDIA_URL_RE, lambda route: route.abort())
+    return context
+
+
+async def send_whatsapp_message(page, message):
+    """Inserts and sends a message in the currently active chat. Returns True on success."""
+    try:
+        await page.wait_for_selector(INPUT_SELECTOR)
+        
+        # Click the input box
+        await page.click(INPUT_SELECTOR)
+        
+        # insertText 一次插入整行 (而不是逐字符按键)；换行用 Shift+Enter，因为 Enter 会直接发送
+        for i, line in enumerate(message.split("\n")):
+            if i:
+                await page.keyboard.press("Shift+Enter")
+            if line:
+                await page.keyboard.insert_text(line)
+        await asyncio.sleep(SEND_SETTLE)
+        await page.press(INPUT_SELECTOR, "Enter")
+        log.info(f"Sent response to WhatsApp ({len(message)} chars).")
+        return True
+    except Exception as e:
+        log.error(f"Failed to send message: {e}")
+        return False
+
+
+class ChatPage:
+    """One WhatsApp Web page shared by several chats. Every UI action holds `lock`."""
+
+    def __init__(self, page):
+        self.page = page
+        self.lock = asyncio.Lock()
+        self.current = None
+        self.titles = {}      # configured chat -> chat_key() of its sidebar title
+
+    async def open_chat(self, chat: str):
+        """Switch to chat via the search box (caller holds the lock); resolves its title the first time."""
+        if self.current == chat:
+            return
+        previous = self.titles.get(self.current)
+        search = await self.page.wait_for_selector(SEARCH_SELECTOR)
+        await search.click()
+        await search.fill(chat)
+        await asyncio.sleep(SEARCH_SETTLE)
+        await self.page.press(SEARCH_SELECTOR, "Enter")
+        self.current = chat
+        if chat not in self.titles:
+            await self._resolve_title(chat, previous)
+
+    async def _resolve_title(self, chat: str, previous: str):
+        # 已保存的联系人在侧栏显示名字而不是号码：记录打开后标题栏的名字，未读标记按它匹配
+        try:
+            handle = await self.page.wait_for_function(CHAT_TITLE_JS, arg=previous, timeout=TITLE_TIMEOUT)
+            title = await handle.json_value()
+        except Exception as e:
+            log.warning(f"Could not read the title of chat {chat}: {e}")
+            return
+        self.titles[chat] = chat_key(title)
+        if self.titles[chat] != chat_key(chat):
+            log.info(f"Chat {chat} appears in the sidebar as '{title}'")
+
+    def title_key(self, chat: str) -> str:
+        """chat_key() of the chat's sidebar title (the configured name or number until resolved)."""
+        return self.titles.get(chat) or chat_key(chat)
+
+    async def incoming_messages(self) -> list:
+        """(message id, text) of the incoming messages loaded in the open chat, oldest first."""
+        return [tuple(m) for m in await self.page.evaluate(INCOMING_MESSAGES_JS)]
+
+    async def unread_chats(self) -> set:
+        """chat_key() of the title of every sidebar chat with unread messages."""
+        async with self.lock:
+            titles = await self.page.evaluate(UNREAD_CHATS_JS)
+        return {chat_key(t) for t in titles}
+
+    async def read(self, chat: str) -> list:
+        async with self.lock:
+            await self.open_chat(chat)
+            return await self.incoming_messages()
+
+    async def send(self, chat: str, text: str):
+        """Open chat and send text, split at paragraph boundaries."""
+        async with self.lock:
+            await self.open_chat(chat)
+            for chunk in split_message(text, MAX_CHARS):
+                await send_whatsapp_message(self.page, chunk)
+
+
+async def sender_loop(chat_page: ChatPage, outgoing: asyncio.Queue):
+    """
+    Sends queued (chat, text) replies one at a time, so the listening loop keeps
+    reading new messages while a long report is being sent.
+    """
+    while True:
+        chat, text = await outgoing.get()
+        try:
+            await chat_page.send(chat, text)
+        except Exception as e:
+            log.error(f"Failed to send to {chat}: {e}")
+        finally:
+            outgoing.task_done()
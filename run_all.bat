@@ -19,16 +19,21 @@ if not exist "%BACKEND_DIR%\.env" (
     exit /b
 )
 
-:: --- 3. 启动后台: WhatsApp Twilio Bot (Port 5000) ---
-echo [1/3] Starting WhatsApp Twilio Bot...
+:: --- 3. 启动 Agent 服务 (Port 8765)：所有前端共用一个图、检查点和 LLM 限流 ---
+echo [1/4] Starting Agent Service (Port 8765)...
+start /min "kafeAI_Agents" cmd /c "cd /d \"%BACKEND_DIR%\" && \"%VENV_PYTHON%\" agent_service.py"
+SET AGENT_SERVICE_URL=http://127.0.0.1:8765
+
+:: --- 4. 启动后台: WhatsApp Twilio Bot (Port 5000) ---
+echo [2/4] Starting WhatsApp Twilio Bot...
 start /min "kafeAI_Twilio" cmd /c "cd /d \"%BACKEND_DIR%\" && \"%VENV_PYTHON%\" whatsapp_twilio.py"
 
-:: --- 4. 启动前端: Streamlit Dashboard (Port 8502) ---
-echo [2/3] Starting Streamlit Dashboard (Port 8502)...
+:: --- 5. 启动前端: Streamlit Dashboard (Port 8502) ---
+echo [3/4] Starting Streamlit Dashboard (Port 8502)...
 start /min "kafeAI_Frontend" cmd /c "cd /d \"%FRONTEND_DIR%\" && \"%VENV_PYTHON%\" -m streamlit run app.py --server.port 8502"
 
-:: --- 5. 启动隧道: ngrok (Port 5000) ---
-echo [3/3] Starting ngrok Tunnel...
+:: --- 6. 启动隧道: ngrok (Port 5000) ---
+echo [4/4] Starting ngrok Tunnel...
 :: 尝试杀掉旧进程确保成功
 taskkill /F /IM ngrok.exe >nul 2>&1
 start "kafeAI_ngrok" cmd /c "ngrok http 5000"
@@ -38,6 +43,7 @@ echo --------------------------------------------------
 echo ✅ ALL SYSTEMS GO!
 echo.
 echo 🖥️  Frontend: http://localhost:8502
+echo 🧠 Agents: http://127.0.0.1:8765/health
 echo 📱 WhatsApp: Twilio is listening on Port 5000
 echo 🌐 Tunnel: Check the ngrok window for your public URL
 echo --------------------------------------------------
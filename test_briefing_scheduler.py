@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+# 将 kafeAI 目录加入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kafeAI"))
+
+import tenants
+import weather_forecast
+import briefing_scheduler
+
+# 22:30 预计算明天 (D+1) 的简报，第二天 07:00 的请求必须能直接恢复它：
+# 指纹按简报自己的 target_date 取天气 (而不是“相对现在的明天”)，且只看天气的粗分档
+ROOT = os.path.dirname(os.path.abspath(__file__))
+EVENING, TARGET, NEXT = "2026-03-09", "2026-03-10", "2026-03-11"
+
+
+def _day(date: str, condition: str, avg_temp: float, rain: int) -> dict:
+    return {"date": date, "day": {"condition": {"text": condition}, "avgtemp_c": avg_temp, "mintemp_c": avg_temp - 3,
+                                  "daily_chance_of_rain": rain, "daily_chance_of_snow": 0, "totalprecip_mm": 0}}
+
+
+def _forecast(*days) -> dict:
+    """A weatherapi.com-shaped 2-day forecast (what fetch_forecast returns)."""
+    return {"forecast": {"forecastday": list(days)}}
+
+
+class _Site:
+    """A tenant whose data root is a copy of the shipped stock.json / Menu.md / latest report."""
+
+    def __init__(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "site")
+        os.makedirs(os.path.join(self.root, "daily_reports"))
+        shutil.copy(os.path.join(ROOT, "stock.json"), self.root)
+        shutil.copy(os.path.join(ROOT, "Menu.md"), self.root)
+        latest = sorted(os.listdir(os.path.join(ROOT, "daily_reports")))[-1]
+        shutil.copy(os.path.join(ROOT, "daily_reports", latest), os.path.join(self.root, "daily_reports"))
+        registry = os.path.join(self.tmp, "tenants.json")
+        with open(registry, "w", encoding="utf-8") as f:
+            json.dump({"tenants": [{"id": "test", "city": "Sundsvall", "data_root": self.root}]}, f)
+        self._saved = (tenants.TENANTS_PATH, weather_forecast.fetch_forecast)
+        tenants.TENANTS_PATH = registry
+        self.forecast = None
+        weather_forecast.fetch_forecast = lambda city: self.forecast
+
+    def close(self):
+        tenants.TENANTS_PATH, weather_forecast.fetch_forecast = self._saved
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+def _precompute_at_2230(site: _Site) -> dict:
+    """What _precompute() saves, without running the graph."""
+    site.forecast = _forecast(_day(EVENING, "Partly cloudy", 4.2, 10), _day(TARGET, "Partly cloudy", 4.2, 10))
+    record = {"tenant_id": "test", "target_date": TARGET, "created_at": f"{EVENING} 22:30:00",
+              "fingerprint": briefing_scheduler.input_fingerprint(TARGET),
+              "values": {"reports": {}}, "summary": "briefing"}
+    briefing_scheduler.save_record(record)
+    return record
+
+
+def test_evening_briefing_is_used_the_next_morning():
+    site = _Site()
+    try:
+        with tenants.tenant_scope("test"):
+            record = _precompute_at_2230(site)
+            # 07:00: TARGET is now forecast index 0 (today); its numbers were revised overnight
+            site.forecast = _forecast(_day(TARGET, "Partly cloudy", 4.6, 20), _day(NEXT, "Heavy snow", -12, 90))
+            assert briefing_scheduler.load_precomputed(today=TARGET) == record
+    finally:
+        site.close()
+
+
+def test_briefing_goes_stale_when_its_inputs_change():
+    site = _Site()
+    try:
+        with tenants.tenant_scope("test"):
+            _precompute_at_2230(site)
+            # The forecast for the briefing's day turned to rain
+            site.forecast = _forecast(_day(TARGET, "Moderate rain", 4.6, 80), _day(NEXT, "Sunny", 6, 0))
+            assert briefing_scheduler.load_precomputed(today=TARGET) is None
+
+            # Same weather, but stock changed after the briefing was computed
+            site.forecast = _forecast(_day(TARGET, "Partly cloudy", 4.6, 20), _day(NEXT, "Sunny", 6, 0))
+            assert briefing_scheduler.load_precomputed(today=TARGET) is not None
+            stock_path = os.path.join(site.root, "stock.json")
+            with open(stock_path, "r", encoding="utf-8") as f:
+                stock = json.load(f)
+            stock["inventory"][0]["quantity"] += 5
+            with open(stock_path, "w", encoding="utf-8") as f:
+                json.dump(stock, f)
+            assert briefing_scheduler.load_precomputed(today=TARGET) is None
+
+            # A briefing for a day that has passed is never used
+            assert briefing_scheduler.load_precomputed(today=NEXT) is None
+    finally:
+        site.close()
+
+
+if __name__ == "__main__":
+    test_evening_briefing_is_used_the_next_morning()
+    test_briefing_goes_stale_when_its_inputs_change()
+    print("briefing scheduler tests passed")
@@ -9,7 +9,7 @@ import json
 
 def test_workflow():
     config = {"configurable": {"thread_id": "test_thread"}}
-    inputs = {"issue": "Test Order", "context": [], "feedback": ""}
+    inputs = {"issue": "Test Order", "feedback": ""}
     
     print("--- Testing Phase 1 ---")
     for output in app.stream(inputs, config=config):
@@ -17,14 +17,14 @@ def test_workflow():
     
     # 模拟反馈
     print("--- Injecting Feedback ---")
-    app.update_state(config, {"context": ["Human Feedback: Please add 5 units of sallad."]}, as_node="stock_manager")
+    app.update_state(config, {"feedback": "Please add 5 units of sallad."}, as_node="creative")
     
     print("--- Testing Phase 2 ---")
     for output in app.stream(None, config=config):
         node_name = list(output.keys())[0]
         print(f"Node: {node_name}")
         if node_name == "executor":
-            print(f"Result: {output['executor']['context'][-1]}")
+            print(f"Result: {output['executor']['reports']['executor']['text']}")
 
 if __name__ == "__main__":
     test_workflow()
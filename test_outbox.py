@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import importlib
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# 将 kafeAI 目录加入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kafeAI"))
+
+# 本地假 Twilio：按收件人脚本化返回 201 / 429 (Retry-After) / 5xx / 400，并记录每个请求的时间区间
+# 状态回调由假 Twilio 按发送时收到的 StatusCallback 地址回传，回调服务与 /twilio/status 一样调用 outbox.update_status
+ACCOUNT_SID = "ACtest"
+REQUEST_DELAY = 0.2       # seconds the fake Twilio holds every request (makes overlap measurable)
+
+
+class FakeTwilio:
+    """
+    script: {recipient: [(status, headers), ...]}; responses are used in order and the
+    last one repeats. Recipients without a script always get 201.
+    """
+
+    def __init__(self, script: dict = None):
+        self.script = script or {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._counts = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                started = time.time()
+                form = {k: v[0] for k, v in parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode()).items()}
+                time.sleep(REQUEST_DELAY)
+                status, headers, sid = fake._respond(form)
+                body = {"sid": sid} if status in (200, 201) else {"code": 20000 + status, "message": f"fake {status}"}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                with fake._lock:
+                    fake.requests.append({
+                        "path": self.path, "recipient": form.get("To"), "body": form.get("Body"),
+                        "callback": form.get("StatusCallback"), "status": status, "sid": sid,
+                        "start": started, "end": time.time(),
+                    })
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _respond(self, form: dict):
+        recipient = form.get("To")
+        with self._lock:
+            n = self._counts[recipient] = self._counts.get(recipient, 0) + 1
+            total = sum(self._counts.values())
+        responses = self.script.get(recipient) or [(201, {})]
+        status, headers = responses[min(n, len(responses)) - 1]
+        return status, headers, f"SM{total:04d}" if status in (200, 201) else None
+
+    def of(self, recipient: str) -> list:
+        with self._lock:
+            return sorted((r for r in self.requests if r["recipient"] == recipient), key=lambda r: r["start"])
+
+    def deliver(self, sid: str, status: str, error_code: str = None):
+        """Send the status callback Twilio would send for sid to the URL given when it was sent."""
+        request = next(r for r in self.requests if r["sid"] == sid)
+        data = {"MessageSid": sid, "MessageStatus": status}
+        if error_code:
+            data["ErrorCode"] = error_code
+        requests.post(request["callback"], data=data, timeout=5).raise_for_status()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StatusCallbackServer:
+    """Stand-in for whatsapp_twilio's /twilio/status route (same update_status call)."""
+
+    def __init__(self, outbox, path: str):
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                form = {k: v[0] for k, v in parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode()).items()}
+                outbox.update_status(form.get("MessageSid", ""), form.get("MessageStatus", ""), form.get("ErrorCode"), path=path)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/twilio/status"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _load_outbox(fake: FakeTwilio, callback_url: str = None):
+    """Import outbox pointed at the fake Twilio (TWILIO_API_BASE is read at import time)."""
+    os.environ["TWILIO_API_BASE"] = fake.url
+    os.environ["TWILIO_ACCOUNT_SID"] = ACCOUNT_SID
+    os.environ["TWILIO_AUTH_TOKEN"] = "token"
+    if callback_url:
+        os.environ["TWILIO_STATUS_CALLBACK_URL"] = callback_url
+    else:
+        os.environ.pop("TWILIO_STATUS_CALLBACK_URL", None)
+    import outbox
+    outbox = importlib.reload(outbox)
+    outbox.BACKOFF_BASE = 0.05    # keep retries fast; Retry-After still applies in full
+    return outbox
+
+
+def _run(outbox, path: str, messages: list, timeout: float = 30.0):
+    """Enqueue (recipient, text) pairs, then send them all with a fresh dispatcher."""
+    for recipient, text in messages:
+        outbox.enqueue(recipient, text, sender="whatsapp:+46000", path=path)
+    dispatcher = outbox.Dispatcher(path=path, workers=4, mps=0)
+    dispatcher.start()
+    try:
+        assert dispatcher.wait_idle(timeout), "outbox did not drain"
+    finally:
+        dispatcher.stop()
+
+
+def _rows(outbox, path: str) -> dict:
+    conn = outbox.connect(path)
+    try:
+        rows = conn.execute("SELECT recipient, body, status, attempts, sid, error FROM messages ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    return {body: {"recipient": r, "status": s, "attempts": a, "sid": sid, "error": e} for r, body, s, a, sid, e in rows}
+
+
+def test_order_and_parallel_recipients():
+    tmp = tempfile.mkdtemp()
+    fake = FakeTwilio()
+    try:
+        outbox = _load_outbox(fake)
+        path = os.path.join(tmp, "outbox.db")
+        _run(outbox, path, [(to, f"{to} #{i}") for i in range(3) for to in ("whatsapp:+461", "whatsapp:+462")])
+
+        assert all(r["path"] == f"/2010-04-01/Accounts/{ACCOUNT_SID}/Messages.json" for r in fake.requests)
+        for to in ("whatsapp:+461", "whatsapp:+462"):
+            sent = fake.of(to)
+            # 同一收件人：严格按入队顺序，且上一条完成后才发下一条
+            assert [r["body"] for r in sent] == [f"{to} #{i}" for i in range(3)]
+            assert all(a["end"] <= b["start"] for a, b in zip(sent, sent[1:]))
+        # 不同收件人：请求时间有重叠 (并行发送)
+        a, b = fake.of("whatsapp:+461"), fake.of("whatsapp:+462")
+        assert any(x["start"] < y["end"] and y["start"] < x["end"] for x in a for y in b)
+        assert all(row["status"] == "sent" and row["attempts"] == 1 for row in _rows(outbox, path).values())
+    finally:
+        fake.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_retries_stop_at_the_limit():
+    tmp = tempfile.mkdtemp()
+    fake = FakeTwilio({
+        "whatsapp:+46429": [(429, {"Retry-After": "1"}), (201, {})],
+        "whatsapp:+46503": [(503, {}), (502, {}), (201, {})],
+        "whatsapp:+46500": [(500, {})],
+        "whatsapp:+46400": [(400, {})],
+    })
+    try:
+        outbox = _load_outbox(fake)
+        path = os.path.join(tmp, "outbox.db")
+        _run(outbox, path, [(to, f"to {to}") for to in fake.script])
+        rows = _rows(outbox, path)
+
+        limited = fake.of("whatsapp:+46429")
+        assert len(limited) == 2 and rows["to whatsapp:+46429"]["status"] == "sent"
+        assert limited[1]["start"] - limited[0]["end"] >= 1.0   # Retry-After honoured
+
+        assert len(fake.of("whatsapp:+46503")) == 3
+        assert rows["to whatsapp:+46503"]["status"] == "sent" and rows["to whatsapp:+46503"]["attempts"] == 3
+
+        # 一直 5xx：重试到 MAX_ATTEMPTS 次后放弃
+        assert len(fake.of("whatsapp:+46500")) == outbox.MAX_ATTEMPTS
+        assert rows["to whatsapp:+46500"]["status"] == "failed"
+        assert rows["to whatsapp:+46500"]["attempts"] == outbox.MAX_ATTEMPTS
+
+        # 400 不可重试：只发一次
+        assert len(fake.of("whatsapp:+46400")) == 1
+        assert rows["to whatsapp:+46400"]["status"] == "failed" and "HTTP 400" in rows["to whatsapp:+46400"]["error"]
+    finally:
+        fake.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_status_callbacks_update_the_outbox():
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "outbox.db")
+    fake = FakeTwilio()
+    callbacks = None
+    try:
+        import outbox
+        callbacks = StatusCallbackServer(outbox, path)
+        outbox = _load_outbox(fake, callbacks.url)
+        _run(outbox, path, [("whatsapp:+461", "hello"), ("whatsapp:+462", "goodbye")])
+        assert all(r["callback"] == callbacks.url for r in fake.requests)
+
+        rows = _rows(outbox, path)
+        fake.deliver(rows["hello"]["sid"], "sent")          # intermediate: no change
+        assert _rows(outbox, path)["hello"]["status"] == "sent"
+        fake.deliver(rows["hello"]["sid"], "delivered")
+        fake.deliver(rows["goodbye"]["sid"], "undelivered", "63016")
+
+        rows = _rows(outbox, path)
+        assert rows["hello"]["status"] == "delivered"
+        assert rows["goodbye"]["status"] == "undelivered" and rows["goodbye"]["error"] == "Twilio error 63016"
+        assert outbox.stats(path) == {"delivered": 1, "undelivered": 1}
+    finally:
+        if callbacks:
+            callbacks.close()
+        fake.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_order_and_parallel_recipients()
+    test_retries_stop_at_the_limit()
+    test_status_callbacks_update_the_outbox()
+    print("outbox tests passed")
@@ -0,0 +1,56 @@
+import os
+import sys
+import datetime
+
+# 将 kafeAI 目录加入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kafeAI"))
+
+import report_index
+import recipe_bom
+import pricing_rules
+
+# 随仓库提供的 stock.json / Menu.md / daily_reports 是一个普通的日子：不应该触发任何促销
+# (整箱计数的库存比目标多一箱是正常的订货方式，不是积压)
+CLEAR_WEATHER = {"city": "Sundsvall", "condition": "Partly cloudy", "avg_temp_c": 6.0, "min_temp_c": 2.0,
+                 "rain_chance": 10, "snow_chance": 0, "precip_mm": 0.0}
+
+
+def _next_day() -> str:
+    last = report_index.list_dates()[-1]
+    return (datetime.date.fromisoformat(last) + datetime.timedelta(days=1)).isoformat()
+
+
+def test_shipped_data_triggers_nothing():
+    assert pricing_rules.evaluate_triggers(weather=CLEAR_WEATHER, target_date=_next_day()) == []
+
+
+def test_shipped_stock_is_not_overstocked_on_any_day():
+    rows = recipe_bom.project_stockouts()
+    start = datetime.date.fromisoformat(_next_day())
+    for offset in range(7):
+        target = (start + datetime.timedelta(days=offset)).isoformat()
+        triggers = pricing_rules.evaluate_triggers(weather=CLEAR_WEATHER, target_date=target, stock_rows=rows)
+        assert not [t for t in triggers if t["trigger"] == "overstock"], (target, triggers)
+
+
+def test_overstock_needs_a_surplus_one_promotion_can_use():
+    bom = recipe_bom.get_bom()
+    burger_beef = {"item": "nötkött", "quantity": 16, "unit": "kg", "target": 10, "daily_usage": 0.9, "days_left": 17.8}
+    triggers = pricing_rules.evaluate_triggers(weather=CLEAR_WEATHER, stock_rows=[burger_beef], traffic={}, bom=bom)
+    assert [(t["trigger"], t["product_item"]) for t in triggers] == [("overstock", "Double Burger")]
+
+    # One carton over target is ordering granularity, not overstock
+    tomatoes = {"item": "tomat", "quantity": 2, "unit": "katon", "target": 1, "daily_usage": 0.05, "days_left": 40}
+    assert pricing_rules._overstocked([tomatoes]) == []
+
+    # Too much lettuce for any one dish to use up (0.1 head per serving): no discount
+    lettuce = {"item": "sallad", "quantity": 60, "unit": "st", "target": 30, "daily_usage": 1.7, "days_left": 35.3}
+    assert pricing_rules._overstocked([lettuce]) == [lettuce]
+    assert pricing_rules.evaluate_triggers(weather=CLEAR_WEATHER, stock_rows=[lettuce], traffic={}, bom=bom) == []
+
+
+if __name__ == "__main__":
+    test_shipped_data_triggers_nothing()
+    test_shipped_stock_is_not_overstocked_on_any_day()
+    test_overstock_needs_a_surplus_one_promotion_can_use()
+    print("pricing rules tests passed")
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+
+# 将 kafeAI 目录加入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kafeAI"))
+
+import recipe_bom
+
+# 下单 (executor) 与按日报扣减 (post_mortem / 同步) 同时写 stock.json：两者都不能丢失，文件不能写坏
+ROOT = os.path.dirname(os.path.abspath(__file__))
+THREADS, ORDERS_PER_THREAD = 8, 25
+
+
+def test_concurrent_orders_and_depletion_are_not_lost():
+    tmp = tempfile.mkdtemp()
+    try:
+        stock_path = os.path.join(tmp, "stock.json")
+        reports_dir = os.path.join(tmp, "daily_reports")
+        os.makedirs(reports_dir)
+        shutil.copy(os.path.join(ROOT, "stock.json"), stock_path)
+        latest = sorted(os.listdir(os.path.join(ROOT, "daily_reports")))[-1]
+        shutil.copy(os.path.join(ROOT, "daily_reports", latest), reports_dir)
+        # Start from "nothing depleted yet" whatever the shipped file's marker says
+        stock = recipe_bom.load_stock(stock_path)
+        stock.get("metadata", {}).pop("last_depleted_report", None)
+        recipe_bom._write_stock(stock, stock_path)
+
+        before = {e["item"]: e["quantity"] for e in recipe_bom.load_stock(stock_path)["inventory"]}
+        with open(os.path.join(reports_dir, latest), "r", encoding="utf-8") as f:
+            usage = recipe_bom.estimate_consumption(json.load(f), recipe_bom.get_bom(stock_path=stock_path))
+        assert usage.get("sallad")
+
+        def order():
+            for _ in range(ORDERS_PER_THREAD):
+                assert recipe_bom.add_orders([{"item": "Sallad", "amount_to_add": 1}], stock_path) == ["sallad (+1)"]
+
+        workers = [threading.Thread(target=order) for _ in range(THREADS)]
+        workers.append(threading.Thread(target=recipe_bom.deplete_new_reports, args=(stock_path, reports_dir)))
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        stock = recipe_bom.load_stock(stock_path)   # still valid JSON
+        after = {e["item"]: e["quantity"] for e in stock["inventory"]}
+        expected = round(before["sallad"] - usage["sallad"], 2) + THREADS * ORDERS_PER_THREAD
+        assert abs(after["sallad"] - expected) < 0.01
+        assert stock["metadata"]["last_depleted_report"] == latest[:-5].replace("_", "-")
+        assert not os.path.exists(stock_path + ".tmp")
+
+        # Already applied: a second depletion changes nothing
+        assert recipe_bom.deplete_new_reports(stock_path, reports_dir) == {"applied": [], "usage": {}}
+        assert recipe_bom.load_stock(stock_path) == stock
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_orders_for_unknown_items_or_bad_amounts_change_nothing():
+    tmp = tempfile.mkdtemp()
+    try:
+        stock_path = os.path.join(tmp, "stock.json")
+        shutil.copy(os.path.join(ROOT, "stock.json"), stock_path)
+        before = recipe_bom.load_stock(stock_path)["inventory"]
+        updates = recipe_bom.add_orders([{"item": "unicorn", "amount_to_add": 3},
+                                         {"item": "tomat", "amount_to_add": "a few"}], stock_path)
+        assert updates == ["unicorn (New item, ignored for safety)", "tomat (Invalid amount: a few)"]
+        assert recipe_bom.load_stock(stock_path)["inventory"] == before
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_concurrent_orders_and_depletion_are_not_lost()
+    test_orders_for_unknown_items_or_bad_amounts_change_nothing()
+    print("recipe BOM tests passed")
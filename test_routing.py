@@ -11,19 +11,19 @@ def test_routing(issue):
     print(f">>> Testing input: {issue}")
     print(f"{'='*50}")
     config = {"configurable": {"thread_id": f"test_{issue[:10]}"}}
-    inputs = {"issue": issue, "context": [], "feedback": ""}
+    inputs = {"issue": issue, "feedback": ""}
     
     try:
         for output in app.stream(inputs, config=config):
             for node_name, content in output.items():
                 print(f"\n[EXECUTION] Node Finished: {node_name}")
-                if "context" in content:
-                    print(f"    - Context Update: {content['context'][-1][:200]}...")
+                if content and node_name in content.get("reports", {}):
+                    print(f"    - Report: {content['reports'][node_name]['text'][:200]}...")
                 if "decision" in content:
                     print(f"    - Decision: {content['decision'][:200]}...")
                 if "routing_mode" in content:
                     print(f"    - Router set mode: {content['routing_mode']}")
-                    print(f"    - Router set target: {content['target_node']}")
+                    print(f"    - Router set targets: {content['target_nodes']}")
     except Exception as e:
         print(f"ERROR during execution: {e}")
 
@@ -36,3 +36,6 @@ if __name__ == "__main__":
     
     # Test 3: Single Agent (@stock)
     test_routing("@stock 那边的咖啡豆够用吗？")
+    
+    # Test 4: Multiple mentions (@weather @stock run in parallel)
+    test_routing("@weather @stock should I order more sallad?")
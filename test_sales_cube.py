@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+# 将 kafeAI 目录加入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kafeAI"))
+
+import sales_cube
+from sales_cube import SalesCube, LEVELS
+
+# 增量同步 (get_cube / refresh) 在新增、修改、删除日报和出现新类别之后，必须与从头重建的结果一致
+_mtime = [1_700_000_000 * 10**9]
+
+
+def _touch(path: str):
+    """Give path a strictly newer mtime (sync and the report index compare mtimes, not contents)."""
+    _mtime[0] += 10**9
+    os.utime(path, ns=(_mtime[0], _mtime[0]))
+
+
+def _write_report(reports_dir: str, date: str, gross: float, categories: dict, transactions: int = 50):
+    report = {
+        "sales_summary": {"total_gross": gross, "total_net": round(gross / 1.12, 2), "total_vat": round(gross - gross / 1.12, 2)},
+        "sales_by_category": [{"category": name, "amount": amount, "count": count} for name, (amount, count) in categories.items()],
+        "payment_methods": {"total_transactions": transactions},
+    }
+    path = os.path.join(reports_dir, date.replace("-", "_") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f)
+    _touch(path)
+    _touch(reports_dir)
+
+
+def _delete_report(reports_dir: str, date: str):
+    os.remove(os.path.join(reports_dir, date.replace("-", "_") + ".json"))
+    _touch(reports_dir)
+
+
+def _assert_same(cube: SalesCube, expected: SalesCube):
+    """Same days and aggregates; category columns are compared by name (order and all-zero columns may differ)."""
+    assert cube.day_dates.tolist() == expected.day_dates.tolist()
+    assert np.allclose(cube.day_measures, expected.day_measures)
+    names = sorted(set(cube.categories.tolist()) | set(expected.categories.tolist()))
+
+    def by_name(c: SalesCube, cats: np.ndarray) -> np.ndarray:
+        columns = [cats[:, c.categories.tolist().index(n)] if n in c.categories.tolist() else np.zeros(len(cats))
+                   for n in names]
+        return np.stack(columns, axis=1) if columns else np.zeros((len(cats), 0))
+
+    assert np.allclose(by_name(cube, cube.day_cats), by_name(expected, expected.day_cats))
+    for level in LEVELS:
+        got, want = cube.levels[level], expected.levels[level]
+        assert got["keys"].tolist() == want["keys"].tolist(), level
+        assert got["days"].tolist() == want["days"].tolist(), level
+        assert np.allclose(got["measures"], want["measures"]), level
+        assert np.allclose(by_name(cube, got["cats"]), by_name(expected, want["cats"])), level
+        for name, values in cube.table(level).items():
+            assert np.allclose(values, expected.table(level)[name], equal_nan=True), (level, name)
+
+
+def _rebuilt(reports_dir: str) -> SalesCube:
+    cube = SalesCube()
+    cube.sync(reports_dir)
+    return cube
+
+
+def test_incremental_sync_matches_rebuild():
+    tmp = tempfile.mkdtemp()
+    reports_dir = os.path.join(tmp, "daily_reports")
+    os.makedirs(reports_dir)
+    path = os.path.join(tmp, "cache", "sales_cube.npz")
+    try:
+        for i, date in enumerate(("2025-12-29", "2025-12-30", "2026-01-05", "2026-01-06", "2026-01-12")):
+            _write_report(reports_dir, date, 1000 + 100 * i, {
+                "VARM DRYCK (热饮)": (300 + 10 * i, 40), "BAKVERK (烘焙)": (200, 12 + i),
+            })
+        cube = sales_cube.get_cube(reports_dir, path)
+        _assert_same(cube, _rebuilt(reports_dir))
+
+        # 修改 (同一文件原地覆盖)、删除、以及一个只在新日报里出现的类别
+        _write_report(reports_dir, "2026-01-05", 1750, {"VARM DRYCK": (500, 60), "BAKVERK": (250, 20)})
+        _delete_report(reports_dir, "2025-12-30")
+        _write_report(reports_dir, "2026-01-13", 1300, {"VARM DRYCK": (320, 41), "LUNCH (午餐)": (600, 8)})
+        cube = sales_cube.refresh(reports_dir, path)
+        _assert_same(cube, _rebuilt(reports_dir))
+        assert "LUNCH" in cube.categories.tolist()
+
+        # 删除一个月的唯一一天：该月的聚合行消失；删掉唯一含新类别的日报后该类别列全为 0
+        _delete_report(reports_dir, "2025-12-29")
+        _delete_report(reports_dir, "2026-01-13")
+        cube = sales_cube.refresh(reports_dir, path)
+        _assert_same(cube, _rebuilt(reports_dir))
+        assert 202512 not in cube.levels["month"]["keys"].tolist()
+
+        # 持久化的立方体与内存中的一致，rebuild() 与增量结果一致
+        _assert_same(SalesCube.load(path), cube)
+        _assert_same(sales_cube.rebuild(reports_dir, path), cube)
+    finally:
+        sales_cube._cubes.pop(path, None)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def test_weekday_compare_across_the_year_boundary():
+    tmp = tempfile.mkdtemp()
+    reports_dir = os.path.join(tmp, "daily_reports")
+    os.makedirs(reports_dir)
+    try:
+        # December 2025 Mondays average 1100; January 2026 Mondays average 1320 (+20%)
+        for date, gross in (("2025-12-01", 1000), ("2025-12-08", 1200), ("2026-01-05", 1320), ("2026-01-12", 1320)):
+            _write_report(reports_dir, date, gross, {"VARM DRYCK": (gross / 4, 30)})
+        _write_report(reports_dir, "2025-12-31", 900, {"VARM DRYCK": (200, 20)})    # a Wednesday
+        cube = _rebuilt(reports_dir)
+
+        monday = cube.weekday_compare(0, 202601)
+        assert monday["weekday"] == "Mon"
+        assert monday["month"] == 1320 and monday["previous_month"] == 1100
+        assert abs(monday["change_pct"] - 20.0) < 1e-9
+
+        # No Wednesday in January yet; December's is still reported as the previous month
+        wednesday = cube.weekday_compare(2, 202601)
+        assert wednesday["month"] is None and wednesday["previous_month"] == 900 and wednesday["change_pct"] is None
+
+        # December looks back to November 2025 (no reports)
+        december = cube.weekday_compare(0, 202512)
+        assert december["month"] == 1100 and december["previous_month"] is None and december["change_pct"] is None
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_incremental_sync_matches_rebuild()
+    test_weekday_compare_across_the_year_boundary()
+    print("sales cube tests passed")